@@ -0,0 +1,128 @@
+import argparse
+import sys
+import time
+
+from document import JSONDocument, convert_str
+from file_index import FileLoader
+from query import QueryError, compile_query, split_assignment
+
+
+# Applies path=value edits to a JSON or JSON Lines file without opening a
+# window. The file is parsed once, every edit is made in memory, and it is
+# written once at the end, however many edits there are.
+#
+#     python batch_edit.py data.json edits.txt
+#     printf 'users/0/name=Nadia\n$..active=False\n' | python batch_edit.py data.json
+#
+# Paths are keys separated by /, or JSONPath queries starting with $ to set
+# every member they match. Values are read as the editor reads typed ones.
+
+
+def read_edits(lines):
+    # (line number, path text, value text) for each edit. Blank lines and
+    # lines starting with # are skipped.
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        path, value = split_assignment(line)
+        if value is None:
+            raise ValueError(f"line {number}: expected path=value, found {line!r}")
+        yield number, path, value
+
+
+def find_paths(document: JSONDocument, path: str):
+    # The document itself has no parent to be set in, so it cannot be one of
+    # the paths.
+    if path.startswith('$'):
+        paths = compile_query(path).evaluate(document.data)
+        if [] in paths:
+            raise ValueError(path)
+        return paths
+    if not path.strip('/'):
+        raise ValueError(path)
+    return [path.strip('/').split('/')]
+
+
+def apply_edits(document: JSONDocument, edits):
+    # Returns how many members were set, and an error message for each edit
+    # that could not be made. Views are not told of each edit, and the save
+    # is left to the caller.
+    count = 0
+    errors = []
+    with document.batch(quiet=True):
+        for number, path, value in edits:
+            try:
+                paths = find_paths(document, path)
+                if len(paths) == 1:
+                    document.set(paths[0], convert_str(value))
+                    count += 1
+                else:
+                    count += document.set_all(paths, convert_str(value))
+            except QueryError as error:
+                errors.append(f"line {number}: {error}")
+            except (KeyError, IndexError, TypeError, ValueError):
+                errors.append(f"line {number}: cannot set {path!r}, which is not a member of the document")
+    return count, errors
+
+
+def load(filename: str):
+    # Parsed with json.loads in one go, skipping the member spans the text
+    # pane needs. The history is capped at nothing, since there is no undo.
+    loader = FileLoader(filename)
+    loader.start_parsing(record_spans=False)
+    while loader.parsing:
+        time.sleep(0.005)
+    return JSONDocument(filename, loader, save_delay=3600, history_bytes=0)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Apply path=value edits to a JSON or JSON Lines file, writing it once.")
+    parser.add_argument("file", help="the JSON or JSON Lines file to edit")
+    parser.add_argument("edits", nargs="?", default="-", help="file of path=value lines, or - for stdin")
+    parser.add_argument("--keep-going", action="store_true", help="write the edits that worked even if some failed")
+    options = parser.parse_args(arguments)
+
+    start = time.perf_counter()
+    document = load(options.file)
+    if not document.loaded:
+        print(f"could not read {options.file}: {document.loader.error}", file=sys.stderr)
+        document.loader.lines.close()
+        return 1
+    loaded = time.perf_counter()
+
+    try:
+        if options.edits == "-":
+            edits = list(read_edits(sys.stdin))
+        else:
+            with open(options.edits, encoding='utf-8') as file:
+                edits = list(read_edits(file))
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        document.loader.lines.close()
+        return 1
+
+    count, errors = apply_edits(document, edits)
+    applied = time.perf_counter()
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors and not options.keep_going:
+        print(f"{len(errors)} of {len(edits)} edits failed; {options.file} was left unchanged", file=sys.stderr)
+        document.loader.lines.close()
+        return 1
+
+    document.flush()
+    # On Windows the file cannot be replaced while its line index maps it.
+    document.loader.lines.close()
+    document.finish_replace()
+    written = time.perf_counter()
+
+    elapsed = written - start
+    print(f"{len(edits) - len(errors)} edits, {count} members set in {elapsed:.2f} s "
+          f"({len(edits) / max(applied - loaded, 1e-9):,.0f} edits/s): "
+          f"load {loaded - start:.2f} s, edit {applied - loaded:.2f} s, write {written - applied:.2f} s")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
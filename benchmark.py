@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+# Runs without a window, so it works on CI machines and over SSH.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from layout import BACKGROUND_COLOUR, EditorLayout
+from query import compile_query
+from utils import DisplayJSONBox
+
+
+# Root members, and the depth and fan-out of the object nested under each.
+SIZES = {
+    "small": dict(members=50, depth=2, fanout=4),
+    "medium": dict(members=2000, depth=2, fanout=8),
+    "large": dict(members=20000, depth=2, fanout=8),
+}
+
+def make_value(rng: random.Random, depth: int, fanout: int):
+    if depth == 0:
+        return rng.choice([
+            rng.randint(0, 10 ** 6),
+            round(rng.random() * 1000, 3),
+            f"value {rng.randint(0, 10 ** 6)}",
+            rng.random() < 0.5,
+            None,
+        ])
+    return {f"field{i}": make_value(rng, depth - 1, fanout) for i in range(fanout)}
+
+
+def make_document(path: str, members: int, depth: int, fanout: int, seed: int = 0):
+    rng = random.Random(seed)
+    data = {f"key{i}": make_value(rng, depth, fanout) for i in range(members)}
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=4)
+    return data
+
+
+def percentile(ordered: list, fraction: float):
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def summarize(samples: list):
+    ordered = sorted(samples)
+    return {
+        "samples": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(ordered, 0.5),
+        "p90": percentile(ordered, 0.9),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1],
+    }
+
+
+def measure(function, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+class ScriptedMouse:
+    # The dummy video driver has no pointer, and the widgets ask pygame for
+    # the mouse position rather than reading it from events. While a session
+    # runs, the position is whatever the last posted mouse event said.
+    def __init__(self):
+        self.position = (0, 0)
+        self.get_pos = None
+
+    def __enter__(self):
+        self.get_pos = pygame.mouse.get_pos
+        pygame.mouse.get_pos = lambda: self.position
+        return self
+
+    def __exit__(self, *exc_info):
+        pygame.mouse.get_pos = self.get_pos
+
+    def move(self, position: tuple):
+        self.position = position
+        pygame.event.post(pygame.event.Event(pygame.MOUSEMOTION, pos=position, rel=(0, 0), buttons=(0, 0, 0)))
+
+    def press(self, position: tuple, button: int = 1):
+        self.move(position)
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=position, button=button))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=position, button=button))
+
+
+class Editor(EditorLayout):
+    # main.py's layout with the parts of its loop that handle events and
+    # redraw dirty widgets. Saves are pushed far out, so the background
+    # writer never competes with the code being timed.
+    def __init__(self, screen: pygame.Surface, filename: str):
+        super().__init__(screen, filename, save_delay=3600)
+        self.user_text = self.text_input.placeholder
+        self.input_box_active = False
+
+    def wait_until_loaded(self, timeout: float = 600):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.text_box.update_loading()
+            if self.document.loaded and self.text_box.structure is not None:
+                self.display_keys.set_keys(force_reload=True)
+                return True
+            if self.document.failed:
+                return False
+            time.sleep(0.005)
+        return False
+
+    def frame(self):
+        for event in pygame.event.get():
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                self.user_text, self.input_box_active = self.keyboard.handle_mousedown(self.user_text, self.text_input)
+            if event.type == pygame.KEYDOWN and self.input_box_active:
+                self.user_text = self.keyboard.handle_keydown(event, self.user_text, self.text_input, lambda text: None, self.text_box)
+
+            self.text_input.handle_event(event)
+            self.text_box.handle_event(event)
+            self.display_keys.handle_event(event)
+            self.minimap.handle_event(event)
+            self.search_panel.handle_event(event)
+
+        self.text_box.update_loading()
+        self.minimap.update()
+        self.search_panel.update()
+
+        for widget in self.widgets:
+            if not widget.dirty:
+                continue
+            if widget is self.text_box:
+                self.text_box.load_visible_text()
+            elif widget is self.display_keys:
+                self.display_keys.set_keys()
+            self.screen.fill(BACKGROUND_COLOUR, widget.dirty_rect)
+            widget.draw()
+            widget.dirty = False
+
+    def close(self):
+        self.text_box.close()
+
+
+def post_key(key: int, unicode: str = ''):
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, unicode=unicode, mod=0))
+    pygame.event.post(pygame.event.Event(pygame.KEYUP, key=key, unicode=unicode, mod=0))
+
+
+def session_script(editor: Editor, mouse: ScriptedMouse, rng: random.Random):
+    # Each step posts the events of one user action; a frame runs after each.
+    text_box = editor.text_box
+    for _ in range(40):
+        yield lambda: mouse.press((1000, 300), button=5)
+    for _ in range(10):
+        yield lambda: mouse.press((1000, 300), button=4)
+    for _ in range(10):
+        yield lambda: mouse.press((300, 550), button=5)
+    yield lambda: mouse.press((30, 420))
+    yield lambda: mouse.press((30, 420))
+    yield lambda: mouse.press((425, 150))
+    for character in "edited":
+        yield lambda character=character: post_key(ord(character), character)
+    yield lambda: post_key(pygame.K_RETURN, '\r')
+    yield lambda: mouse.press((710, 375))
+    yield lambda: mouse.press((710, 375))
+    for _ in range(10):
+        yield lambda: jump(text_box, rng.randrange(max(len(text_box.lines), 1)))
+
+
+def jump(text_box: DisplayJSONBox, line: int):
+    text_box.scroll_to_line(line)
+    text_box.dirty = True
+
+
+def remove_sidecar(filename: str):
+    directory, name = os.path.split(os.path.abspath(filename))
+    try:
+        os.remove(os.path.join(directory, f".{name}.index"))
+    except FileNotFoundError:
+        pass
+
+
+def write_sidecar(editor: Editor, timeout: float = 60):
+    # The sidecar is written once the text pane has measured the text.
+    editor.text_box.load_visible_text()
+    editor.text_box.update_loading()
+    deadline = time.monotonic() + timeout
+    while editor.text_box.loader.cached is None and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def run_document(screen: pygame.Surface, filename: str, repeat: int):
+    rng = random.Random(1)
+    results = {}
+    # Whole loads and searches are slow, so they get fewer samples, but
+    # enough for a median that is steady from run to run.
+    slow_repeat = max(repeat // 5, 5)
+
+    # Cold loads parse the file; reopens find the index sidecar the first
+    # load left behind.
+    load_samples = []
+    for _ in range(slow_repeat):
+        remove_sidecar(filename)
+        start = time.perf_counter()
+        editor = Editor(screen, filename)
+        editor.wait_until_loaded()
+        load_samples.append((time.perf_counter() - start) * 1000)
+        if editor.text_box.loader.cached is None:
+            write_sidecar(editor)
+        editor.close()
+    results["load"] = load_samples
+
+    reopen_samples = []
+    for _ in range(slow_repeat):
+        start = time.perf_counter()
+        editor = Editor(screen, filename)
+        editor.wait_until_loaded()
+        reopen_samples.append((time.perf_counter() - start) * 1000)
+        editor.close()
+    results["reopen"] = reopen_samples
+
+    editor = Editor(screen, filename)
+    if not editor.wait_until_loaded():
+        raise RuntimeError(f"{filename} did not load: {editor.document.loader.error}")
+    text_box = editor.text_box
+    display_keys = editor.display_keys
+
+    def scroll_and_load():
+        text_box.scroll_offset_y = rng.random() * max(text_box.text_height - text_box.height, 0)
+        text_box.load_visible_text()
+    results["load_visible_text"] = measure(scroll_and_load, repeat)
+
+    results["set_keys"] = measure(lambda: display_keys.set_keys(force_reload=True), repeat)
+    results["key_grid_draw"] = measure(display_keys.draw, repeat)
+    results["minimap_layout"] = measure(editor.minimap.set_layout, repeat)
+    results["minimap_draw"] = measure(editor.minimap.draw, repeat)
+
+    keys = list(editor.document.data.keys())
+
+    def edit():
+        member = rng.choice(keys)
+        editor.text_input.path = [member, "field0", "field0"]
+        editor.text_input.add_json(editor.document, str(rng.randint(0, 10 ** 6)))
+    results["add_json"] = measure(edit, repeat)
+
+    # Each sample undoes an edit made above and redoes it, through the
+    # text pane and key grid as Ctrl+Z and Ctrl+Y would.
+    editor.text_input.path = []
+    display_keys.open_path([])
+
+    def undo_redo():
+        display_keys.step_history()
+        display_keys.step_history(redo=True)
+    results["undo_redo"] = measure(undo_redo, repeat)
+
+    # A first search indexes the document while streaming its matches; later
+    # ones on the same version only look tokens up. Both run to completion.
+    search = editor.search_panel.search
+
+    def run_search(query: str):
+        search.start(query)
+        while search.searching:
+            time.sleep(0.0002)
+
+    index_samples = []
+    for _ in range(slow_repeat):
+        search.index = None
+        index_samples.extend(measure(lambda: run_search("value"), 1))
+    results["search_index"] = index_samples
+    results["search_query"] = measure(lambda: run_search(rng.choice(["field1", "value 12", "key1", "true"])), repeat)
+
+    # Walks the whole document for each query, with plans already compiled.
+    queries = ["$..field1", "$.*.field0[?(@.field0 > 500000)]", "$[*][*][*]"]
+    results["query_evaluate"] = measure(lambda: compile_query(rng.choice(queries)).evaluate(editor.document.data), repeat)
+
+    # Each sample reloads the file until the loader threads have finished.
+    def reload():
+        text_box.set_text(filename, force_reload=True)
+        while text_box.loader.loading:
+            time.sleep(0.0002)
+    results["set_text"] = measure(reload, slow_repeat)
+    editor.wait_until_loaded()
+
+    frames = []
+    with ScriptedMouse() as mouse:
+        for step in session_script(editor, mouse, rng):
+            step()
+            start = time.perf_counter()
+            editor.frame()
+            frames.append((time.perf_counter() - start) * 1000)
+    results["session_frame"] = frames
+
+    editor.close()
+    return {name: summarize(samples) for name, samples in results.items()}
+
+
+def compare(results: dict, baseline: dict, tolerance: float, noise_floor: float):
+    # A benchmark regresses when its median got slower by more than the
+    # tolerance, as a fraction of the baseline, and by more than the noise
+    # floor in milliseconds, so sub-millisecond jitter is never flagged.
+    regressions = []
+    for size, benchmarks in results["results"].items():
+        for name, stats in benchmarks.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if before is None:
+                continue
+            slowdown = stats["p50"] - before["p50"]
+            if slowdown > before["p50"] * tolerance and slowdown > noise_floor:
+                regressions.append(f"{size}/{name} p50: {before['p50']:.3f} ms -> {stats['p50']:.3f} ms")
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Time the editor's load, navigate, edit and render paths headlessly.")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma separated, from {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=50, help="samples per benchmark")
+    parser.add_argument("--output", default="bench_output.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging, e.g. 0.2 for 20%%")
+    parser.add_argument("--noise-floor", type=float, default=0.5, help="slowdowns under this many ms are never flagged")
+    options = parser.parse_args(arguments)
+
+    pygame.init()
+    screen = pygame.display.set_mode((1280, 720))
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "sdl": ".".join(map(str, pygame.get_sdl_version())),
+            "platform": platform.platform(),
+            "repeat": options.repeat,
+            "unit": "ms",
+        },
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in options.sizes.split(","):
+            filename = os.path.join(directory, f"{size}.json")
+            make_document(filename, **SIZES[size])
+            results["results"][size] = run_document(screen, filename, options.repeat)
+            print(f"{size}: " + ", ".join(f"{name} p50 {stats['p50']:.3f} ms" for name, stats in results["results"][size].items()))
+
+    pygame.quit()
+
+    with open(options.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    if options.baseline:
+        with open(options.baseline) as file:
+            regressions = compare(results, json.load(file), options.tolerance, options.noise_floor)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+import ast
+import copy
+import json
+import operator
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+
+from file_index import FileLoader, RecordList
+from history import MISSING, EditHistory
+
+
+# Containers indexed by position, where path keys are converted to ints.
+SEQUENCES = (list, RecordList)
+
+
+# Reads a value typed into the editor: a number, else a Python literal such
+# as a list or True, else the text itself as a string.
+def convert_str(s):
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return float(s)
+        except ValueError:
+            try:
+                return ast.literal_eval(s)
+            except (ValueError, SyntaxError):
+                return s
+
+
+class JSONDocument:
+    def __init__(self, filename: str, loader: FileLoader = None, save_delay: float = 1.0, history_bytes: int = 64 * 1024 * 1024):
+        self.filename = filename
+        self.loader = loader if loader else FileLoader(filename)
+        self.data = self.loader.start_parsing()
+
+        self.version = 0
+        self.saved_version = 0
+        self.write_lock = threading.Lock()
+
+        # The last error a save ran into, until a save succeeds again.
+        self.error = None
+
+        # A finished save that could not be renamed over the file because the
+        # file is still open, as (temp path, version).
+        self.pending_replace = None
+
+        # Called as observer(path, value, deleted, position) after every edit.
+        # position is the member's index when the edit added or removed it.
+        self.observers = []
+
+        self.history = EditHistory(history_bytes)
+
+        # A quiet batch tells observers once, with an empty path meaning
+        # anything may have changed.
+        self.batching = False
+        self.quiet = False
+        self.quiet_after = 500
+
+        self.saver = DebouncedSaver(self, save_delay)
+
+    @property
+    def loaded(self):
+        return self.loader.parsed and self.loader.error is None
+
+    @property
+    def failed(self):
+        return self.loader.error is not None
+
+    def resolve(self, path):
+        node = self.data
+        for key in path:
+            node = node[int(key)] if isinstance(node, SEQUENCES) else node[key]
+        return node
+
+    def set(self, path, value, record: bool = True):
+        if not path:
+            return
+        self.pin(path)
+        parent = self.resolve(path[:-1])
+        key = int(path[-1]) if isinstance(parent, SEQUENCES) else path[-1]
+        if isinstance(parent, dict) and key not in parent:
+            self.insert(path, value, len(parent), record)
+            return
+
+        old = parent[key]
+        parent[key] = value
+        if record:
+            self.history.record(path, old, value)
+        self.changed(path, value)
+
+    def insert(self, path, value, position: int, record: bool = True):
+        # For arrays the last key of path is the index it ends up at.
+        if not path:
+            return
+        self.pin(path)
+        parent = self.resolve(path[:-1])
+        if isinstance(parent, SEQUENCES):
+            parent.insert(position, value)
+        elif position >= len(parent):
+            parent[path[-1]] = value
+        else:
+            # Rebuilt in place, so views holding on to the object see it too.
+            items = list(parent.items())
+            items.insert(position, (path[-1], value))
+            parent.clear()
+            parent.update(items)
+        if record:
+            self.history.record(path, MISSING, value, position)
+        self.changed(path, value, position=position)
+
+    def delete(self, path, record: bool = True):
+        if not path:
+            return
+        self.pin(path)
+        parent = self.resolve(path[:-1])
+        if isinstance(parent, SEQUENCES):
+            key = position = int(path[-1])
+        else:
+            key = path[-1]
+            position = operator.indexOf(parent, key)
+        old = parent[key]
+        del parent[key]
+        if record:
+            self.history.record(path, old, MISSING, position)
+        self.changed(path, None, deleted=True, position=position)
+
+    def undo(self):
+        # Returns the last path changed, or None when there was nothing to undo.
+        steps = self.history.undo()
+        with self.batch(quiet=len(steps) > self.quiet_after):
+            for step in steps:
+                if step.old is MISSING:
+                    self.delete(step.path, record=False)
+                elif step.new is MISSING:
+                    self.insert(step.path, step.old, step.position, record=False)
+                else:
+                    self.set(step.path, step.old, record=False)
+        return steps[-1].path if steps else None
+
+    def redo(self):
+        steps = self.history.redo()
+        with self.batch(quiet=len(steps) > self.quiet_after):
+            for step in steps:
+                if step.old is MISSING:
+                    self.insert(step.path, step.new, step.position, record=False)
+                elif step.new is MISSING:
+                    self.delete(step.path, record=False)
+                else:
+                    self.set(step.path, step.new, record=False)
+        return steps[-1].path if steps else None
+
+    def set_all(self, paths, value):
+        # Each member gets its own copy.
+        paths = self.bulk_order(paths)
+        with self.batch(quiet=len(paths) > self.quiet_after), self.history_group():
+            for path in paths:
+                self.set(path, copy.deepcopy(value))
+        return len(paths)
+
+    def delete_all(self, paths):
+        paths = self.bulk_order(paths)
+        with self.batch(quiet=len(paths) > self.quiet_after), self.history_group():
+            for path in paths:
+                self.delete(path)
+        return len(paths)
+
+    def bulk_order(self, paths):
+        # Distinct paths, members inside others first and later array items
+        # before earlier ones, so no edit moves or replaces what a later one
+        # is about to change.
+        keys = {}
+        for path in paths:
+            node = self.data
+            key = []
+            for part in path:
+                if isinstance(node, SEQUENCES):
+                    index = int(part)
+                    key.append((index, ''))
+                    node = node[index]
+                else:
+                    key.append((0, part))
+                    node = node[part]
+            keys[tuple(key)] = list(path)
+        return [keys[key] for key in sorted(keys, reverse=True)]
+
+    @contextmanager
+    def batch(self, quiet: bool = False):
+        if self.batching:
+            yield
+            return
+        self.batching = True
+        self.quiet = quiet
+        version = self.version
+        try:
+            yield
+        finally:
+            self.batching = False
+            self.quiet = False
+            if self.version != version:
+                self.saver.schedule()
+                if quiet:
+                    for observer in self.observers:
+                        observer([], self.data, False, None)
+
+    @contextmanager
+    def history_group(self):
+        self.history.start_group()
+        try:
+            yield
+        finally:
+            self.history.end_group()
+
+    def pin(self, path):
+        # A JSON Lines record edited below its top level has to stay parsed
+        # until it is saved, rather than being evicted with the change.
+        if isinstance(self.data, RecordList) and len(path) > 1:
+            self.data.pin(int(path[0]))
+
+    def rebase(self, loader: FileLoader):
+        # Called once a saved file has been reopened. JSON Lines records are
+        # read from the file as needed, so they move over to the new one.
+        if isinstance(self.data, RecordList) and self.saved_version == self.version:
+            self.data.rebase(loader.lines)
+            loader.data = self.data
+
+    def changed(self, path, value, deleted: bool = False, position: int = None):
+        self.version += 1
+        if self.batching:
+            if self.quiet:
+                return
+        else:
+            self.saver.schedule()
+        for observer in self.observers:
+            observer(path, value, deleted, position)
+
+    def write(self):
+        with self.write_lock:
+            # A partially parsed document would overwrite the file with
+            # whatever was read before the load stopped.
+            if not self.loaded:
+                return False
+
+            version = self.version
+            if version == self.saved_version:
+                return True
+
+            # Write next to the target and rename over it, so a crash mid-save
+            # never leaves a truncated file behind.
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+            records = isinstance(self.data, RecordList)
+            try:
+                with os.fdopen(fd, 'wb' if records else 'w') as file:
+                    if records:
+                        self.data.dump(file)
+                    else:
+                        json.dump(self.data, file, indent=4)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except RuntimeError:
+                # The document was edited while it was being serialized.
+                os.remove(temp_path)
+                return False
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+            if self.version != version:
+                os.remove(temp_path)
+                return False
+
+            if os.path.exists(self.filename):
+                shutil.copymode(self.filename, temp_path)
+            try:
+                os.replace(temp_path, self.filename)
+            except PermissionError:
+                # Windows will not replace a file that is still mapped, as the
+                # text pane's line index keeps it. The UI thread swaps the
+                # finished file in once it has let go of the old one.
+                if os.name != 'nt':
+                    os.remove(temp_path)
+                    raise
+                if self.pending_replace is not None:
+                    os.remove(self.pending_replace[0])
+                self.pending_replace = (temp_path, version)
+                return True
+
+            self.saved_version = version
+            return True
+
+    def finish_replace(self):
+        with self.write_lock:
+            if self.pending_replace is None:
+                return False
+            temp_path, version = self.pending_replace
+            self.pending_replace = None
+            os.replace(temp_path, self.filename)
+            self.saved_version = max(self.saved_version, version)
+            return True
+
+    def flush(self):
+        # A document still being built gets the chance to finish first.
+        if self.version == self.saved_version:
+            return True
+        while self.loader.parsing and not self.loader.parsed and not self.loader.cancelled:
+            time.sleep(0.05)
+        if not self.loaded:
+            return False
+
+        while not self.write():
+            pass
+        return True
+
+
+class DebouncedSaver:
+    def __init__(self, document: JSONDocument, delay: float = 1.0):
+        self.document = document
+        self.delay = delay
+        self.due = None
+        self.condition = threading.Condition()
+
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def schedule(self):
+        with self.condition:
+            self.due = time.monotonic() + self.delay
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                # Keep pushing the save back while edits keep coming in.
+                while self.due is None or time.monotonic() < self.due or not self.document.loaded:
+                    if self.document.failed:
+                        self.due = None
+                    timeout = None if self.due is None else max(self.due - time.monotonic(), 0.05)
+                    self.condition.wait(timeout)
+                self.due = None
+
+            try:
+                saved = self.document.write()
+            except OSError as error:
+                # Keep the edits in memory and try again later.
+                self.document.error = error
+                saved = False
+            else:
+                if saved:
+                    self.document.error = None
+
+            if not saved:
+                self.schedule()
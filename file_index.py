@@ -0,0 +1,1341 @@
+import codecs
+import json
+import mmap
+import operator
+import os
+import re
+import struct
+import threading
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import accumulate, chain, islice
+from typing import Callable
+
+from index_cache import IndexCache
+
+
+class LineIndex:
+    def __init__(self, filename: str, chunk_size: int = 4 * 1024 * 1024):
+        self.filename = filename
+        self.chunk_size = chunk_size
+
+        self.file = open(filename, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+
+        # mmap refuses to map an empty file
+        if self.size:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.offsets = array('Q', [0])
+        else:
+            self.data = b''
+            self.offsets = array('Q')
+
+        self.indexed_bytes = 0
+        self.complete = self.size == 0
+        self.closed = False
+
+        # The longest line so far, in bytes, and its line number.
+        self.longest = 0
+        self.longest_line = 0
+
+        # Indexing may run on a loader thread while the UI thread reads lines.
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        if self.complete:
+            return len(self.offsets)
+
+        if not self.indexed_bytes:
+            return len(self.offsets)
+
+        # Extrapolated from the part scanned so far.
+        known_lines = len(self.offsets) - 1
+        return max(int(known_lines * self.size / self.indexed_bytes), len(self.offsets))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            if index.stop is None:
+                self.index_all()
+                stop = self.available_lines()
+            else:
+                stop = index.stop
+                self.ensure(stop - 1)
+            return [self.get_line(i) for i in range(start, min(stop, self.available_lines()))]
+
+        self.ensure(index)
+        if index >= self.available_lines():
+            raise IndexError(index)
+        return self.get_line(index)
+
+    def __iter__(self):
+        line = 0
+        while True:
+            self.ensure(line)
+            if line >= self.available_lines():
+                return
+            yield self.get_line(line)
+            line += 1
+
+    def available_lines(self):
+        if self.complete:
+            return len(self.offsets)
+        return len(self.offsets) - 1
+
+    def index_chunk(self):
+        with self.lock:
+            if self.complete or self.closed:
+                return False
+
+            start = self.indexed_bytes
+            chunk = self.data[start:start + self.chunk_size]
+            parts = chunk.split(b'\n')
+            first_new = len(self.offsets)
+
+            line_starts = accumulate((len(part) + 1 for part in parts[:-1]), initial=start)
+            self.offsets.extend(islice(line_starts, 1, None))
+
+            self.indexed_bytes = start + len(chunk)
+            if self.indexed_bytes >= self.size:
+                if self.offsets[-1] == self.size:
+                    self.offsets.pop()
+                self.complete = True
+
+            # The first line ending here may have started in an earlier chunk.
+            if len(self.offsets) > first_new:
+                self.track_longest(first_new - 1, len(self.offsets))
+            if self.complete and self.offsets:
+                self.track_longest(len(self.offsets) - 1, len(self.offsets))
+
+            return not self.complete
+
+    def index_all(self):
+        while self.index_chunk():
+            pass
+
+    def track_longest(self, start: int, stop: int):
+        length, line = self.longest_in(start, stop)
+        if length > self.longest:
+            self.longest = length
+            self.longest_line = line
+
+    def longest_in(self, start: int, stop: int):
+        # Newlines included; only indexed lines count.
+        stop = min(stop, self.available_lines())
+        if start >= stop:
+            return 0, start
+        ends = islice(self.offsets, start + 1, stop + 1)
+        if stop == len(self.offsets):
+            ends = chain(ends, (self.size, ))
+        lengths = array('q', map(operator.sub, ends, islice(self.offsets, start, stop)))
+        longest = max(lengths)
+        return longest, start + lengths.index(longest)
+
+    def load_offsets(self, offsets: array):
+        with self.lock:
+            if self.complete or self.closed:
+                return
+            self.offsets = offsets
+            self.indexed_bytes = self.size
+            self.complete = True
+            self.longest, self.longest_line = self.longest_in(0, len(offsets))
+
+    def read_chunk(self, start: int, size: int):
+        with self.lock:
+            if self.closed:
+                return b''
+            return self.data[start:start + size]
+
+    def ensure(self, line: int):
+        while not self.complete and self.available_lines() <= line:
+            self.index_chunk()
+
+    def get_line(self, line: int):
+        start = self.offsets[line]
+        end = self.offsets[line + 1] if line + 1 < len(self.offsets) else self.size
+        return self.data[start:end].decode('utf-8', errors='replace').rstrip('\r\n')
+
+    def line_bounds(self, line: int):
+        # For reading a long line a piece at a time.
+        start = self.offsets[line]
+        end = self.offsets[line + 1] if line + 1 < len(self.offsets) else self.size
+        while end > start and self.data[end - 1] in b'\r\n':
+            end -= 1
+        return start, end
+
+    def offset_of(self, line: int, column: int):
+        # Columns count characters, which take at most four bytes each.
+        start = self.offsets[line]
+        prefix = self.read_chunk(start, column * 4).decode('utf-8', errors='replace')[:column]
+        return start + len(prefix.encode('utf-8'))
+
+    def position_of(self, offset: int):
+        line = bisect_right(self.offsets, offset) - 1
+        start = self.offsets[line]
+        return line, len(self.read_chunk(start, offset - start).decode('utf-8', errors='replace'))
+
+    def read(self):
+        return self.data[:]
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.size:
+                self.data.close()
+            self.file.close()
+
+
+class LineBuffer:
+    def __init__(self, base: LineIndex):
+        self.base = base
+
+        # None until the first edit, then (source, first line, line count)
+        # pieces, where a source is the file or a list of new lines.
+        self.pieces = None
+        self.starts = None
+
+    def __len__(self):
+        if self.pieces is None:
+            return len(self.base)
+        return self.starts[-1]
+
+    def __getitem__(self, index):
+        if self.pieces is None:
+            return self.base[index]
+
+        if isinstance(index, slice):
+            start = index.start or 0
+            stop = min(index.stop if index.stop is not None else len(self), len(self))
+            return [self.get_line(line) for line in range(start, stop)]
+
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.get_line(index)
+
+    @property
+    def complete(self):
+        return self.base.complete
+
+    def get_line(self, line: int):
+        source, index = self.locate(line)
+        return source[index]
+
+    def locate(self, line: int):
+        piece = bisect_right(self.starts, line) - 1
+        source, first, _ = self.pieces[piece]
+        return source, first + line - self.starts[piece]
+
+    def source_of(self, line: int):
+        if self.pieces is None:
+            return self.base, line
+        return self.locate(line)
+
+    def get_sources(self, start: int, stop: int):
+        # As (source, line in source), so file lines need not be decoded whole.
+        if self.pieces is None:
+            self.base.ensure(stop - 1)
+            return [(self.base, line) for line in range(start, min(stop, self.base.available_lines()))]
+        return [self.locate(line) for line in range(start, min(stop, len(self)))]
+
+    def splice(self, start: int, stop: int, new_lines: list):
+        if self.pieces is None:
+            self.base.index_all()
+            self.pieces = [(self.base, 0, len(self.base))]
+            self.starts = [0, len(self.base)]
+
+        before = []
+        after = []
+        for (source, first, count), piece_start in zip(self.pieces, self.starts):
+            piece_stop = piece_start + count
+            if piece_start < start:
+                before.append((source, first, min(piece_stop, start) - piece_start))
+            if piece_stop > stop:
+                skipped = max(stop - piece_start, 0)
+                after.append((source, first + skipped, count - skipped))
+
+        inserted = [(new_lines, 0, len(new_lines))] if new_lines else []
+        self.pieces = before + inserted + after
+        self.starts = list(accumulate((count for _, _, count in self.pieces), initial=0))
+
+    def longest_line(self):
+        # Bytes for lines still in the file, characters for edited ones. Safe
+        # off the UI thread: splices replace the piece list, never change it.
+        pieces = self.pieces
+        if pieces is None:
+            return self.base.longest, self.base.longest_line
+
+        longest = (0, 0)
+        for (source, first, count), start in zip(pieces, accumulate((count for _, _, count in pieces), initial=0)):
+            if source is self.base:
+                length, line = self.base.longest_in(first, first + count)
+                line -= first
+            else:
+                length, line = max(((len(text), line) for line, text in enumerate(source[first:first + count])), key=operator.itemgetter(0))
+            if length > longest[0]:
+                longest = (length, start + line)
+        return longest
+
+    def close(self):
+        self.base.close()
+
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+JSON_DECODER = json.JSONDecoder()
+
+
+class MemberScanner:
+    def __init__(self, text: str, index: int, decode: Callable = None):
+        self.text = text
+        self.index = index
+        self.end = None
+
+        # Called as decode(key, key_index, value_index) and returns the value
+        # and the index just past it.
+        self.decode = decode if decode else self.decode_value
+
+    def decode_value(self, key, key_index: int, value_index: int):
+        return JSON_DECODER.raw_decode(self.text, value_index)
+
+    def __iter__(self):
+        text = self.text
+        is_object = text[self.index] == '{'
+        closer = '}' if is_object else ']'
+
+        index = WHITESPACE.match(text, self.index + 1).end()
+        if text[index] == closer:
+            self.end = index
+            return
+
+        ordinal = 0
+        while True:
+            key_index = index
+            if is_object:
+                if text[index] != '"':
+                    raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, index)
+                key, index = JSON_DECODER.raw_decode(text, index)
+                index = WHITESPACE.match(text, index).end()
+                if text[index] != ':':
+                    raise json.JSONDecodeError("Expecting ':' delimiter", text, index)
+                index = WHITESPACE.match(text, index + 1).end()
+            else:
+                key = ordinal
+
+            value_index = index
+            value, index = self.decode(key, key_index, value_index)
+            yield key, key_index, value_index, index, value
+            ordinal += 1
+
+            index = WHITESPACE.match(text, index).end()
+            if text[index] == ',':
+                index = WHITESPACE.match(text, index + 1).end()
+            elif text[index] == closer:
+                self.end = index
+                return
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, index)
+
+
+class PositionMapper:
+    def __init__(self, text: str, base_line: int = 0):
+        self.text = text
+        self.line = base_line
+        self.index = 0
+        self.line_start = 0
+
+    def locate(self, index: int):
+        # Positions are looked up in increasing order, so only the text since
+        # the previous one needs to be searched for newlines.
+        newlines = self.text.count('\n', self.index, index)
+        if newlines:
+            self.line += newlines
+            self.line_start = self.text.rfind('\n', self.index, index) + 1
+        self.index = index
+        return self.line, index - self.line_start
+
+
+def scan_spans(text: str, index: int, mapper: PositionMapper, applied: int = 0):
+    # Records the spans of one container's members. Nested containers are
+    # skipped by the C decoder, and scanned only once something visits them.
+    spans = ContainerSpans(text[index] == '{', mapper.locate(index), applied)
+
+    def decode(key, key_index: int, value_index: int):
+        key_position = mapper.locate(key_index)
+        value_position = mapper.locate(value_index)
+        _, end_index = JSON_DECODER.raw_decode(text, value_index)
+        spans.add(key, key_position, value_position, mapper.locate(end_index))
+        return None, end_index
+
+    scanner = MemberScanner(text, index, decode)
+    for _ in scanner:
+        pass
+    spans.closer = mapper.locate(scanner.end)
+    return spans, scanner.end + 1
+
+
+class FileLoader:
+    def __init__(self, filename: str, chunk_size: int = 4 * 1024 * 1024):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.lines = LineIndex(filename, chunk_size)
+        self.size = self.lines.size
+
+        self.data = None
+        self.parsed_chars = 0
+        self.total_chars = 0
+        self.members_loaded = 0
+        self.parsing = False
+        self.parsed = False
+        self.error = None
+        self.spans = None
+        self.build_data = True
+        self.record_spans = True
+        self.json_lines = False
+
+        # A sidecar from an earlier open of the unchanged file skips both scans.
+        stat = os.fstat(self.lines.file.fileno())
+        self.index_cache = IndexCache(filename, self.size, stat.st_mtime_ns, self.lines.read_chunk(0, 64 * 1024))
+        self.cached = self.index_cache.load()
+        self.widths = dict(self.cached["widths"]) if self.cached else {}
+        self.encoded_spans = None
+        self.index_saved = self.cached is not None
+
+        self.cancelled = False
+
+    def start_indexing(self):
+        threading.Thread(target=self.index, daemon=True).start()
+
+    def start_parsing(self, build_data: bool = True, record_spans: bool = True):
+        if self.parsing or self.parsed:
+            return self.data
+
+        # Without build_data only the member spans are recorded, for a view of
+        # a file whose document is already held elsewhere. Without
+        # record_spans only the document is built.
+        self.build_data = build_data
+        self.record_spans = record_spans
+
+        # JSON Lines records are parsed one at a time as they are opened.
+        self.json_lines = is_json_lines(self.filename, self.lines)
+        if self.json_lines:
+            if build_data:
+                self.data = RecordList(self.lines)
+            self.parsing = True
+            threading.Thread(target=self.index_records, daemon=True).start()
+            return self.data
+
+        # The root container is created up front and filled once parsed, so
+        # a document holding it sees the members arrive.
+        if build_data and record_spans:
+            first = WHITESPACE.match(self.lines.read_chunk(0, 4096).decode('utf-8', errors='replace')).end()
+            opener = self.lines.read_chunk(first, 1)
+            if opener == b'{':
+                self.data = {}
+            elif opener == b'[':
+                self.data = []
+
+        self.parsing = True
+        threading.Thread(target=self.parse, daemon=True).start()
+        return self.data
+
+    def cancel(self):
+        self.cancelled = True
+
+    @property
+    def loading(self):
+        return not self.lines.complete or self.parsing
+
+    def get_progress(self):
+        stages = []
+        if not self.lines.complete:
+            stages.append(f"indexing {self.lines.indexed_bytes / self.size:.0%}")
+        if self.parsing and not self.json_lines:
+            stages.append(f"parsing {self.parsed_chars / max(self.total_chars, 1):.0%}")
+        return ", ".join(stages)
+
+    def index(self):
+        self.load_cached_offsets()
+        while not self.cancelled and self.lines.index_chunk():
+            pass
+
+    def load_cached_offsets(self):
+        if self.cached and not self.lines.complete:
+            try:
+                self.lines.load_offsets(self.index_cache.read_offsets())
+            except (OSError, EOFError):
+                self.cached = None
+
+    def index_records(self):
+        try:
+            self.load_cached_offsets()
+            while not self.cancelled and self.lines.index_chunk():
+                self.members_loaded = self.lines.available_lines()
+            self.members_loaded = self.lines.available_lines()
+            self.parsed = not self.cancelled
+        finally:
+            self.parsing = False
+
+    def parse(self):
+        # The document is built first and counts as parsed, so it can be
+        # edited and saved while the member spans are still being recorded.
+        try:
+            if self.cached and self.load_cached_spans():
+                return
+            text = self.read_text()
+            if self.cancelled:
+                return
+            if self.build_data:
+                self.fill(json.loads(text))
+                self.parsed = not self.cancelled
+            if self.record_spans:
+                self.scan_root(text)
+            self.parsed = not self.cancelled
+        except (ValueError, IndexError) as error:
+            self.error = error
+        finally:
+            self.parsing = False
+
+    def fill(self, data):
+        if isinstance(self.data, dict):
+            self.data.update(data)
+        elif isinstance(self.data, list):
+            self.data.extend(data)
+        else:
+            self.data = data
+        self.members_loaded = len(self.data) if isinstance(self.data, (dict, list)) else 0
+
+    def load_cached_spans(self):
+        try:
+            encoded = self.index_cache.read_spans()
+            spans = decode_spans(encoded) if encoded else None
+        except (OSError, ValueError, struct.error):
+            self.cached = None
+            return False
+
+        if self.build_data:
+            text = self.read_text()
+            if self.cancelled:
+                return True
+            self.fill(json.loads(text))
+            self.parsed_chars = self.total_chars
+
+        self.spans = spans
+        self.parsed = not self.cancelled
+        return True
+
+    def remember_width(self, font_key: str, width: int):
+        self.widths[font_key] = width
+        self.index_saved = False
+
+    def save_index(self):
+        # Called once the view has measured the text, so its width is saved too.
+        if self.index_saved or self.parsing or not self.parsed or self.error or self.cancelled:
+            return
+        self.index_saved = True
+        threading.Thread(target=self.write_index, daemon=True).start()
+
+    def write_index(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return
+        if stat.st_size != self.size or stat.st_mtime_ns != self.index_cache.key["mtime_ns"]:
+            return
+
+        self.lines.index_all()
+        if not self.lines.complete:
+            return
+
+        if self.encoded_spans is not None:
+            encoded = self.encoded_spans
+        elif self.cached:
+            encoded = self.index_cache.read_spans()
+        else:
+            encoded = b''
+
+        if self.index_cache.save(self.lines.offsets, encoded, widths=dict(self.widths), json_lines=self.json_lines):
+            self.cached = self.index_cache.header
+            self.encoded_spans = None
+
+    def read_text(self):
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        chunks = []
+        for start in range(0, self.size, self.chunk_size):
+            if self.cancelled:
+                return ''
+            chunks.append(decoder.decode(self.lines.read_chunk(start, self.chunk_size)))
+        chunks.append(decoder.decode(b'', final=True))
+        text = ''.join(chunks)
+        self.total_chars = len(text)
+        return text
+
+    def scan_root(self, text: str):
+        # Nested containers are scanned lazily by StructureIndex.get_child.
+        scanner = MemberScanner(text, WHITESPACE.match(text, 0).end())
+        if text[scanner.index:scanner.index + 1] not in ('{', '['):
+            if not self.build_data:
+                json.loads(text)
+            return
+
+        mapper = PositionMapper(text)
+        spans = ContainerSpans(text[scanner.index] == '{', mapper.locate(scanner.index))
+
+        for key, key_index, value_index, end_index, _ in scanner:
+            if self.cancelled:
+                return
+            spans.add(key, mapper.locate(key_index), mapper.locate(value_index), mapper.locate(end_index))
+            if not self.build_data:
+                self.members_loaded += 1
+            self.parsed_chars = end_index
+
+        spans.closer = mapper.locate(scanner.end)
+        index = WHITESPACE.match(text, scanner.end + 1).end()
+        if index != len(text):
+            raise json.JSONDecodeError("Extra data", text, index)
+
+        # Encoded for the sidecar before the view can start changing them.
+        self.encoded_spans = encode_spans(spans, self.size < 2 ** 31)
+        self.spans = spans
+        self.parsed_chars = len(text)
+
+
+class ContainerSpans:
+    __slots__ = ('is_object', 'keys', 'ordinals', 'count', 'positions', 'opener', 'closer', 'children', 'applied', 'encoded')
+
+    def __init__(self, is_object: bool, opener: tuple, applied: int = 0):
+        self.is_object = is_object
+        self.keys = []
+        self.ordinals = None
+        self.count = 0
+
+        # (line, column) of each member's key, value start and value end,
+        # flattened six to a member. Arrays use the value start as the key.
+        self.positions = array('q')
+        self.opener = opener
+        self.closer = None
+
+        # Nested spans by ordinal, scanned on first visit.
+        self.children = {}
+
+        # How many entries of the edit log these positions already reflect.
+        self.applied = applied
+
+        # The sidecar encoding to decode children from, if loaded from one.
+        self.encoded = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, key, key_position: tuple, value_position: tuple, end_position: tuple):
+        if self.is_object:
+            self.keys.append(key)
+        self.positions.extend(key_position + value_position + end_position)
+        self.count += 1
+
+    def ordinal(self, key):
+        if not self.is_object:
+            ordinal = int(key)
+            if not 0 <= ordinal < self.count:
+                raise KeyError(key)
+            return ordinal
+
+        if self.ordinals is None:
+            self.ordinals = {key: ordinal for ordinal, key in enumerate(self.keys)}
+        return self.ordinals[key]
+
+    def insert(self, ordinal: int, key, positions: tuple):
+        if self.is_object:
+            self.keys.insert(ordinal, key)
+            self.ordinals = None
+        self.positions[ordinal * 6:ordinal * 6] = array('q', positions)
+        self.count += 1
+        self.children = {
+            child if child < ordinal else child + 1: spans
+            for child, spans in self.children.items()
+        }
+
+    def remove(self, ordinal: int):
+        if self.is_object:
+            del self.keys[ordinal]
+            self.ordinals = None
+        del self.positions[ordinal * 6:ordinal * 6 + 6]
+        self.count -= 1
+        self.children = {
+            child if child < ordinal else child - 1: spans
+            for child, spans in self.children.items() if child != ordinal
+        }
+
+
+def leading_space(line: str):
+    return line[:len(line) - len(line.lstrip())]
+
+
+def advance(position: tuple, text: str):
+    # Where a position ends up after text is written at it.
+    line, column = position
+    newlines = text.count('\n')
+    if newlines:
+        return line + newlines, len(text) - text.rfind('\n') - 1
+    return line, column + len(text)
+
+
+# is_object, member count, opener and closer (line, column), where its keys
+# start among all the keys, and how many nested containers follow it.
+SPANS_HEADER = struct.Struct('<?qqqqqqq')
+SPANS_PREFIX = struct.Struct('<BQ')
+
+
+def encode_spans(root: ContainerSpans, compact: bool):
+    # Positions take 32 bits when compact, which any file under 2 GB allows.
+    # Then come every object key, as one JSON array, and the containers in
+    # preorder: a header, the positions, and the ordinals and offsets of the
+    # nested containers that follow. The offsets let a reader decode only the
+    # containers it visits.
+    typecode = 'i' if compact else 'q'
+    keys = []
+
+    def encode(spans: ContainerSpans):
+        ordinals = sorted(spans.children)
+        children = [encode(spans.children[ordinal]) for ordinal in ordinals]
+        positions = array(typecode, spans.positions).tobytes()
+
+        size = SPANS_HEADER.size + len(positions) + len(ordinals) * 16
+        offsets = islice(accumulate((len(child) for child in children), initial=size), len(children))
+        header = SPANS_HEADER.pack(spans.is_object, spans.count, *spans.opener, *spans.closer, len(keys), len(ordinals))
+        keys.extend(spans.keys)
+        return b''.join([header, positions, array('q', ordinals).tobytes(), array('q', offsets).tobytes()] + children)
+
+    encoded = encode(root)
+    encoded_keys = json.dumps(keys).encode('utf-8')
+    return SPANS_PREFIX.pack(array(typecode).itemsize, len(encoded_keys)) + encoded_keys + encoded
+
+
+def decode_spans(encoded: bytes):
+    itemsize, keys_length = SPANS_PREFIX.unpack_from(encoded, 0)
+    keys = json.loads(encoded[SPANS_PREFIX.size:SPANS_PREFIX.size + keys_length])
+    source = (memoryview(encoded)[SPANS_PREFIX.size + keys_length:], keys, 'i' if itemsize == 4 else 'q')
+    return decode_container(source, 0)
+
+
+def decode_container(source: tuple, position: int):
+    # Children stay as offsets until StructureIndex.get_child decodes them.
+    encoded, keys, typecode = source
+    is_object, count, opener_line, opener_column, closer_line, closer_column, key_start, children = SPANS_HEADER.unpack_from(encoded, position)
+    start = position
+    position += SPANS_HEADER.size
+
+    spans = ContainerSpans(is_object, (opener_line, opener_column))
+    spans.closer = (closer_line, closer_column)
+    spans.count = count
+    spans.encoded = source
+    if is_object:
+        spans.keys = keys[key_start:key_start + count]
+
+    positions = array(typecode)
+    positions.frombytes(encoded[position:position + count * 6 * positions.itemsize])
+    spans.positions = positions if typecode == 'q' else array('q', positions)
+    position += count * 6 * positions.itemsize
+
+    ordinals = array('q')
+    ordinals.frombytes(encoded[position:position + children * 8])
+    offsets = array('q')
+    offsets.frombytes(encoded[position + children * 8:position + children * 16])
+    spans.children = {ordinal: start + offset for ordinal, offset in zip(ordinals, offsets)}
+    return spans
+
+
+class StructureIndex:
+    def __init__(self, lines: LineBuffer, root: ContainerSpans, sync_after: int = 32):
+        self.lines = lines
+        self.root = root
+        self.sync_after = sync_after
+
+        # Every text edit as (line, column, line delta, column delta): any
+        # position at or after (line, column) moves by the deltas. Span tables
+        # catch up with the log lazily, so an edit never walks unrelated spans.
+        self.edits = []
+
+    def transform(self, position: tuple, applied: int):
+        line, column = position
+        for edit_line, edit_column, line_delta, column_delta in islice(self.edits, applied, None):
+            if line > edit_line:
+                line += line_delta
+            elif line == edit_line and column >= edit_column:
+                line += line_delta
+                column += column_delta
+        return line, column
+
+    def sync(self, spans: ContainerSpans, force: bool = False):
+        if len(self.edits) - spans.applied < (1 if force else self.sync_after):
+            return
+
+        # A container's positions are in document order, so the ones an edit
+        # moves are a suffix of them, found by bisecting their lines. Only
+        # those on the edit's own line move sideways.
+        positions = spans.positions
+        lines = positions[0::2]
+        columns = positions[1::2]
+        for edit_line, edit_column, line_delta, column_delta in islice(self.edits, spans.applied, None):
+            first = bisect_left(lines, edit_line)
+            while first < len(lines) and lines[first] == edit_line and columns[first] < edit_column:
+                first += 1
+            index = first
+            while index < len(lines) and lines[index] == edit_line:
+                columns[index] += column_delta
+                index += 1
+            if line_delta:
+                lines[first:] = array('q', map(line_delta.__add__, lines[first:]))
+        positions[0::2] = lines
+        positions[1::2] = columns
+
+        spans.opener = self.transform(spans.opener, spans.applied)
+        spans.closer = self.transform(spans.closer, spans.applied)
+        spans.applied = len(self.edits)
+
+    def get_span(self, spans: ContainerSpans, ordinal: int):
+        self.sync(spans)
+        key_line, key_column, start_line, start_column, end_line, end_column = spans.positions[ordinal * 6:ordinal * 6 + 6]
+        return (
+            self.transform((key_line, key_column), spans.applied),
+            self.transform((start_line, start_column), spans.applied),
+            self.transform((end_line, end_column), spans.applied)
+        )
+
+    def get_bounds(self, spans: ContainerSpans):
+        self.sync(spans)
+        return self.transform(spans.opener, spans.applied), self.transform(spans.closer, spans.applied)
+
+    def get_child(self, spans: ContainerSpans, ordinal: int):
+        child = spans.children.get(ordinal)
+        if isinstance(child, int):
+            child = spans.children[ordinal] = decode_container(spans.encoded, child)
+        if child is not None:
+            return child
+
+        _, (start_line, start_column), (end_line, _) = self.get_span(spans, ordinal)
+        text = '\n'.join(self.lines[start_line:end_line + 1])
+        if text[start_column] not in '{[':
+            raise KeyError(ordinal)
+
+        child, _ = scan_spans(text, start_column, PositionMapper(text, start_line), len(self.edits))
+        spans.children[ordinal] = child
+        return child
+
+    def locate(self, path):
+        if not path:
+            raise KeyError(path)
+
+        spans = self.root
+        for key in path[:-1]:
+            spans = self.get_child(spans, spans.ordinal(key))
+        return spans, spans.ordinal(path[-1])
+
+    def replace_text(self, start: tuple, end: tuple, text: str):
+        start_line, start_column = start
+        end_line, end_column = end
+
+        prefix = self.lines[start_line][:start_column]
+        suffix = self.lines[end_line][end_column:]
+        new_lines = (prefix + text + suffix).split('\n')
+        self.lines.splice(start_line, end_line + 1, new_lines)
+
+        new_end_line = start_line + len(new_lines) - 1
+        new_end_column = len(new_lines[-1]) - len(suffix)
+        self.edits.append((end_line, end_column, new_end_line - end_line, new_end_column - end_column))
+        return start_line, end_line - start_line + 1, new_lines
+
+    def replace(self, path, value):
+        spans, ordinal = self.locate(path)
+        _, start, end = self.get_span(spans, ordinal)
+
+        # Indented as json.dump(indent=4) would from the value's first line.
+        first_line = self.lines[start[0]]
+        indent = first_line[:len(first_line) - len(first_line.lstrip())]
+        text = json.dumps(value, indent=4).replace('\n', '\n' + indent)
+
+        spans.children.pop(ordinal, None)
+        return self.replace_text(start, end, text)
+
+    def insert(self, path, value, ordinal: int):
+        spans = self.root
+        for key in path[:-1]:
+            spans = self.get_child(spans, spans.ordinal(key))
+        self.sync(spans, force=True)
+
+        key_text = json.dumps(path[-1]) + ': ' if spans.is_object else ''
+        if len(spans) == 0:
+            # Into an empty container, one level deeper.
+            opener_line, opener_column = spans.opener
+            indent = leading_space(self.lines[opener_line])
+            at = (opener_line, opener_column + 1)
+            before, after = '\n' + indent + '    ', '\n' + indent
+        elif ordinal < len(spans):
+            # Before the member now at ordinal, taking its place.
+            at = self.get_span(spans, ordinal)[0]
+            line = self.lines[at[0]]
+            indent = leading_space(line)
+            before, after = '', (',\n' + indent if len(indent) == at[1] else ', ')
+        else:
+            # After the last member, which keeps its end where it was.
+            key, _, at = self.get_span(spans, ordinal - 1)
+            line = self.lines[key[0]]
+            indent = leading_space(line)
+            before, after = (',\n' + indent if len(indent) == key[1] else ', '), ''
+        if len(spans) == 0:
+            indent += '    '
+
+        value_text = json.dumps(value, indent=4).replace('\n', '\n' + indent)
+        key_position = advance(at, before)
+        start = advance(key_position, key_text)
+        end = advance(start, value_text)
+        edit = self.replace_text(at, at, before + key_text + value_text + after)
+        self.sync(spans, force=True)
+        if ordinal == len(spans) and ordinal:
+            spans.positions[ordinal * 6 - 2:ordinal * 6] = array('q', at)
+
+        spans.insert(ordinal, path[-1], key_position + start + end)
+        return edit
+
+    def delete(self, path):
+        spans, ordinal = self.locate(path)
+        key, _, end = self.get_span(spans, ordinal)
+
+        if len(spans) == 1:
+            # The container becomes empty: keep just its brackets.
+            (opener_line, opener_column), closer = self.get_bounds(spans)
+            start, end = (opener_line, opener_column + 1), closer
+        elif ordinal < len(spans) - 1:
+            # Cut up to the next member's key, taking the comma with it.
+            end = self.get_span(spans, ordinal + 1)[0]
+            start = key
+        else:
+            # The last member takes the comma after the previous one instead.
+            start = self.get_span(spans, ordinal - 1)[2]
+
+        spans.remove(ordinal)
+        return self.replace_text(start, end, '')
+
+    def get_lines(self, path):
+        if not path:
+            (opener_line, _), (closer_line, _) = self.get_bounds(self.root)
+            return opener_line, closer_line
+
+        spans, ordinal = self.locate(path)
+        (key_line, _), _, (end_line, _) = self.get_span(spans, ordinal)
+        return key_line, end_line
+
+    def path_at(self, line: int, column: int = None):
+        # Without a column the whole line is looked up, which is all a file
+        # with one member per line needs. A minified file needs the column.
+        if column is None:
+            target, part = line, operator.itemgetter(0)
+        else:
+            target, part = (line, column), tuple
+
+        path = []
+        spans = self.root
+        while len(spans):
+            # Members are in document order, so the one holding the target is
+            # the last whose key starts at or before it.
+            ordinal = bisect_right(range(len(spans)), target, key=lambda ordinal: part(self.get_span(spans, ordinal)[0])) - 1
+            if ordinal < 0:
+                break
+
+            _, start, end = self.get_span(spans, ordinal)
+            if target > part(end):
+                break
+
+            # Paths use string keys throughout, as TextInput.path does.
+            path.append(spans.keys[ordinal] if spans.is_object else str(ordinal))
+            if not part(start) < target < part(end):
+                break
+            spans = self.get_child(spans, ordinal)
+        return path
+
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+
+
+def is_json_lines(filename: str, lines: LineIndex, sniff_size: int = 1024 * 1024):
+    if filename.lower().endswith(JSON_LINES_EXTENSIONS):
+        return True
+
+    # A whole value on the first line with more after it cannot be one JSON
+    # document.
+    head = lines.read_chunk(0, sniff_size).decode('utf-8', errors='replace')
+    first, newline, rest = head.partition('\n')
+    if not newline or not rest.strip():
+        return False
+    try:
+        json.loads(first)
+    except ValueError:
+        return False
+    return True
+
+
+class RecordList:
+    def __init__(self, lines: LineIndex, max_cached: int = 1024):
+        self.lines = lines
+        self.max_cached = max_cached
+
+        # Parsed records by source line, least recently used first. Edited
+        # records are kept apart so they are never evicted before a save.
+        self.cache = OrderedDict()
+        self.edited = {}
+
+        # Until a record is deleted, record i is line i of the file. After
+        # that, the records are (first line, count) runs of the file's lines.
+        self.pieces = None
+        self.starts = None
+
+        # Inserted records are numbered on from the file's last line.
+        self.added = 0
+
+    def __len__(self):
+        if self.pieces is None:
+            return self.lines.available_lines()
+        return self.starts[-1]
+
+    def __getitem__(self, ordinal: int):
+        line = self.source_line(ordinal)
+        if line in self.edited:
+            return self.edited[line]
+        if line in self.cache:
+            self.cache.move_to_end(line)
+            return self.cache[line]
+
+        value = self.parse(line)
+        self.cache[line] = value
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return value
+
+    def peek(self, ordinal: int):
+        # Leaves the cache alone, for reading from another thread.
+        line = self.source_line(ordinal)
+        if line in self.edited:
+            return self.edited[line]
+        value = self.cache.get(line)
+        return value if value is not None or line in self.cache else self.parse(line)
+
+    def __setitem__(self, ordinal: int, value):
+        line = self.source_line(ordinal)
+        self.cache.pop(line, None)
+        self.edited[line] = value
+
+    def __delitem__(self, ordinal: int):
+        line = self.source_line(ordinal)
+        if self.pieces is None:
+            self.lines.index_all()
+            self.pieces = [(0, self.lines.available_lines())]
+
+        pieces = []
+        for first, count in self.pieces:
+            if first <= line < first + count:
+                pieces.append((first, line - first))
+                pieces.append((line + 1, first + count - line - 1))
+            else:
+                pieces.append((first, count))
+        self.set_pieces(pieces)
+
+        self.cache.pop(line, None)
+        self.edited.pop(line, None)
+
+    def insert(self, ordinal: int, value):
+        if self.pieces is None:
+            self.lines.index_all()
+            self.pieces = [(0, self.lines.available_lines())]
+            self.starts = [0, self.pieces[0][1]]
+        ordinal = max(0, min(ordinal, len(self)))
+        line = self.lines.available_lines() + self.added
+        self.added += 1
+
+        pieces = []
+        for (first, count), start in zip(self.pieces, self.starts):
+            if start <= ordinal < start + count:
+                pieces.append((first, ordinal - start))
+                pieces.append((line, 1))
+                pieces.append((first + ordinal - start, start + count - ordinal))
+            else:
+                pieces.append((first, count))
+        if ordinal == len(self):
+            pieces.append((line, 1))
+        self.set_pieces(pieces)
+        self.edited[line] = value
+
+    def set_pieces(self, pieces: list):
+        self.pieces = [piece for piece in pieces if piece[1]]
+        self.starts = list(accumulate((count for _, count in self.pieces), initial=0))
+
+    def source_line(self, ordinal: int):
+        if not 0 <= ordinal < len(self):
+            raise IndexError(ordinal)
+        if self.pieces is None:
+            return ordinal
+        piece = bisect_right(self.starts, ordinal) - 1
+        return self.pieces[piece][0] + ordinal - self.starts[piece]
+
+    def parse(self, line: int):
+        text = self.lines.get_line(line)
+        try:
+            return json.loads(text)
+        except ValueError:
+            # Lines that are not JSON, blank ones included, are shown as their
+            # text and written back untouched.
+            return text
+
+    def pin(self, ordinal: int):
+        # Called before a record is changed in place, so that object is saved.
+        line = self.source_line(ordinal)
+        if line not in self.edited:
+            self.edited[line] = self[ordinal]
+            self.cache.pop(line, None)
+
+    def dump(self, file):
+        # Unedited records are copied byte for byte from the mapped file.
+        self.lines.index_all()
+        pieces = self.pieces if self.pieces is not None else [(0, self.lines.available_lines())]
+        edited = sorted(self.edited.items())
+        for first, count in pieces:
+            start = first
+            for line, value in islice(edited, bisect_right(edited, (first, )), None):
+                if line >= first + count:
+                    break
+                self.copy_lines(file, start, line)
+                file.write(json.dumps(value).encode('utf-8') + b'\n')
+                start = line + 1
+            self.copy_lines(file, start, first + count)
+
+    def copy_lines(self, file, start: int, stop: int):
+        if start >= stop:
+            return
+        offsets = self.lines.offsets
+        begin = offsets[start]
+        end = offsets[stop] if stop < len(offsets) else self.lines.size
+        for position in range(begin, end, self.lines.chunk_size):
+            file.write(self.lines.read_chunk(position, min(self.lines.chunk_size, end - position)))
+        if self.lines.read_chunk(end - 1, 1) != b'\n':
+            file.write(b'\n')
+
+    def rebase(self, lines: LineIndex):
+        # Record i is now line i of the saved file. Parsed records carry over,
+        # so views holding on to them stay in step.
+        values = {}
+        for line, value in list(self.cache.items()) + list(self.edited.items()):
+            ordinal = self.ordinal(line)
+            if ordinal is not None:
+                values[ordinal] = value
+
+        self.lines = lines
+        self.pieces = None
+        self.starts = None
+        self.added = 0
+        self.edited = {}
+        self.cache = OrderedDict(sorted(values.items())[-self.max_cached:])
+
+    def ordinal(self, line: int):
+        if self.pieces is None:
+            return line
+        for (first, count), start in zip(self.pieces, self.starts):
+            if first <= line < first + count:
+                return start + line - first
+        return None
+
+
+class RecordStructure:
+    # StructureIndex for a JSON Lines file: line i of the pane is record i.
+    def __init__(self, lines: LineBuffer, records: RecordList):
+        self.lines = lines
+        self.records = records
+
+    def locate(self, path):
+        if not path:
+            raise KeyError(path)
+        ordinal = int(path[0])
+        if not 0 <= ordinal < len(self.records):
+            raise KeyError(path[0])
+        return ordinal
+
+    def replace(self, path, value):
+        # The record is serialized whole, with the edit already applied to it.
+        ordinal = self.locate(path)
+        new_lines = [json.dumps(self.records[ordinal])]
+        self.lines.splice(ordinal, ordinal + 1, new_lines)
+        return ordinal, 1, new_lines
+
+    def insert(self, path, value, ordinal: int):
+        if len(path) > 1:
+            return self.replace(path, None)
+
+        # The record is already in the list by the time this runs.
+        new_lines = [json.dumps(value)]
+        self.lines.splice(ordinal, ordinal, new_lines)
+        return ordinal, 0, new_lines
+
+    def delete(self, path):
+        if len(path) > 1:
+            return self.replace(path, None)
+
+        # The record is already gone from the list by the time this runs.
+        ordinal = int(path[0])
+        self.lines.splice(ordinal, ordinal + 1, [])
+        return ordinal, 1, []
+
+    def get_lines(self, path):
+        if not path:
+            return 0, max(len(self.lines) - 1, 0)
+        ordinal = self.locate(path)
+        return ordinal, ordinal
+
+    def path_at(self, line: int, column: int = None):
+        if 0 <= line < len(self.records):
+            return [str(line)]
+        return []
+
+
+# Strings are matched whole so the brackets and commas in them are skipped. A
+# lone quote is a string the chunk being scanned cuts off.
+PRETTY_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\],]|"')
+PRETTY_SPACING = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")|(:)|\s+')
+OPENERS = b'{['
+CLOSERS = b'}]'
+
+
+class PrettyLines:
+    def __init__(self, lines: LineIndex, indent: int = 4, chunk_size: int = 4 * 1024 * 1024, max_cached: int = 4096):
+        self.lines = lines
+        self.indent = indent
+        self.chunk_size = chunk_size
+        self.max_cached = max_cached
+
+        # Where each line of json.dump(indent=4)'s layout starts in the file,
+        # and its depth. A line's text is made when it is shown.
+        self.offsets = array('Q')
+        self.depths = array('I')
+        self.scanned = 0
+        self.complete = False
+        self.cancelled = False
+
+        self.cache = OrderedDict()
+
+    def start(self):
+        threading.Thread(target=self.scan, daemon=True).start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __len__(self):
+        if self.complete or not self.scanned:
+            return len(self.offsets)
+        return max(int(len(self.offsets) * self.lines.size / self.scanned), len(self.offsets))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            stop = self.available_lines() if index.stop is None else min(index.stop, self.available_lines())
+            return [self.get_line(line) for line in range(start, stop)]
+
+        if not 0 <= index < self.available_lines():
+            raise IndexError(index)
+        return self.get_line(index)
+
+    def available_lines(self):
+        # A line is known once the next one has started.
+        if self.complete:
+            return len(self.offsets)
+        return max(len(self.offsets) - 1, 0)
+
+    def get_line(self, line: int):
+        text = self.cache.get(line)
+        if text is not None:
+            self.cache.move_to_end(line)
+            return text
+
+        start = self.offsets[line]
+        end = self.offsets[line + 1] if line + 1 < len(self.offsets) else self.lines.size
+        text = self.lines.read_chunk(start, end - start).decode('utf-8', errors='replace')
+        text = ' ' * (self.indent * self.depths[line]) + PRETTY_SPACING.sub(self.respace, text)
+
+        self.cache[line] = text
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return text
+
+    @staticmethod
+    def respace(match):
+        if match.group(1):
+            return match.group(1)
+        return ': ' if match.group(2) else ''
+
+    def line_at(self, offset: int):
+        return max(bisect_right(self.offsets, offset) - 1, 0)
+
+    def content_start(self, line: int):
+        # Skips the whitespace after the comma or bracket the line starts at.
+        start = self.offsets[line]
+        head = self.lines.read_chunk(start, 256)
+        return start + len(head) - len(head.lstrip())
+
+    def add_line(self, offset: int, depth: int):
+        # Depths go first, so a reader never finds an offset without one.
+        self.depths.append(depth)
+        self.offsets.append(offset)
+
+    def scan(self):
+        size = self.lines.size
+        chunk_size = self.chunk_size
+        position = 0
+        depth = 0
+
+        # Where a just-opened container's first member would start, until it
+        # is known whether it has one.
+        opened = None
+
+        if size:
+            self.add_line(0, 0)
+        while position < size and not self.cancelled:
+            chunk = self.lines.read_chunk(position, chunk_size)
+            if not chunk:
+                return
+            final = position + len(chunk) >= size
+            resume = position + len(chunk)
+
+            for match in PRETTY_TOKEN.finditer(chunk):
+                token = chunk[match.start()]
+                if opened is not None:
+                    if token in CLOSERS and not chunk[max(opened - position, 0):match.start()].strip():
+                        depth -= 1
+                        opened = None
+                        continue
+                    self.add_line(opened, depth)
+                    opened = None
+
+                if token == ord('"'):
+                    if match.end() - match.start() == 1 and not final:
+                        resume = position + match.start()
+                        break
+                elif token in OPENERS:
+                    depth += 1
+                    opened = position + match.end()
+                elif token == ord(','):
+                    self.add_line(position + match.end(), depth)
+                else:
+                    depth = max(depth - 1, 0)
+                    self.add_line(position + match.start(), depth)
+
+            # A container that is still open at the end of the chunk has a
+            # member if there is anything but whitespace after its bracket.
+            if opened is not None and chunk[max(opened - position, 0):resume - position].strip():
+                self.add_line(opened, depth)
+                opened = None
+
+            # A string longer than a chunk needs a bigger one.
+            if resume == position:
+                chunk_size *= 2
+            position = resume
+            self.scanned = position
+
+        self.complete = not self.cancelled
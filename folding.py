@@ -0,0 +1,429 @@
+import operator
+import re
+import threading
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, compress
+
+from file_index import LineIndex
+
+
+# Strings are matched whole so the brackets in them are skipped. Strings never
+# span lines, so the file is scanned in chunks of whole lines, its strings
+# dropped and then everything but brackets and newlines, leaving little for
+# Python to look at.
+STRING_TOKEN = re.compile(rb'"[^"\\\n]*(?:\\.[^"\\\n]*)*"')
+NOT_BRACKETS = bytes(set(range(256)) - set(b'{}[]\n'))
+TEXT_BRACKET_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]')
+
+# Depths are kept a byte each, so the ancestors of a container can be found
+# with bytearray.rfind. Deeper nesting than this is stored as this deep, and
+# folds and edits no longer follow it.
+MAX_DEPTH = 255
+
+OPEN_BRACE = ord('{')
+OPEN_BRACKET = ord('[')
+
+
+class FenwickTree:
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = array('q', bytes(8 * (size + 1)))
+
+    def add(self, index: int, delta: int):
+        index += 1
+        tree = self.tree
+        while index <= self.size:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int):
+        # The sum of the values before index.
+        total = 0
+        tree = self.tree
+        while index > 0:
+            total += tree[index]
+            index &= index - 1
+        return total
+
+    @classmethod
+    def from_values(cls, values: list):
+        # Node i sums the last i & -i values up to i, a difference of prefix
+        # sums. Nodes with the same i & -i are evenly spaced, so each of those
+        # levels is a slice and the tree is built without a Python loop. The
+        # odd nodes hold a single value each.
+        fenwick = cls(len(values))
+        fenwick.tree[1::2] = array('q', values[::2])
+        prefix = list(accumulate(values, initial=0))
+        step = 2
+        while step <= len(values):
+            fenwick.tree[step::2 * step] = array('q', list(map(operator.sub, prefix[step::2 * step], prefix[::2 * step])))
+            step *= 2
+        return fenwick
+
+
+def match_brackets(lines: list, depth: int):
+    # Containers opened and closed within lines, as (opening line, closing
+    # line, depth) relative to the first. Brackets that close containers
+    # opened before the lines come back too, innermost first, and so do those
+    # of containers still open after them, outermost first.
+    pairs = []
+    closed = []
+    stack = []
+    for offset, line in enumerate(lines):
+        if not ('{' in line or '[' in line or '}' in line or ']' in line):
+            continue
+        for match in TEXT_BRACKET_TOKEN.finditer(line):
+            token = match.group()
+            if token in '{[':
+                stack.append((offset, depth))
+                depth += 1
+            elif token in '}]':
+                depth -= 1
+                if not stack:
+                    closed.append(offset)
+                    continue
+                opener, opener_depth = stack.pop()
+                if offset > opener:
+                    pairs.append((opener, offset, min(opener_depth, MAX_DEPTH)))
+    return pairs, closed, [offset for offset, _ in stack]
+
+
+class FoldMap:
+    def __init__(self, lines: LineIndex, chunk_size: int = 1024 * 1024):
+        self.lines = lines
+        self.chunk_size = chunk_size
+
+        # Every object and array spanning more than one line, in document
+        # order: the lines its brackets are on and how many such containers
+        # it is nested in. Matched once, by scan, and kept up to date by edits.
+        self.openers = array('q')
+        self.closers = array('q')
+        self.depths = bytearray()
+        self.scanned = 0
+        self.complete = False
+        self.cancelled = False
+
+        # Containers folded by the user, and the outermost of those, which
+        # are the ones whose lines are actually hidden. The tree holds how
+        # many lines each of the outermost hides, by container, so rows and
+        # lines convert in logarithmic time however much is folded.
+        self.collapsed = bytearray()
+        self.effective = []
+        self.hidden = FenwickTree(0)
+        self.hidden_total = 0
+
+        # How many lines each container would hide, kept between rebuilds
+        # until an edit moves its brackets.
+        self.heights = None
+
+    def start(self):
+        threading.Thread(target=self.scan, daemon=True).start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __len__(self):
+        return len(self.openers)
+
+    def scan(self):
+        size = self.lines.size
+        offsets = self.lines.offsets
+        chunk_size = self.chunk_size
+        position = 0
+
+        # All containers in the order they open, single line ones included,
+        # as the closing line is only known at the end of each.
+        openers = []
+        closers = []
+        depths = []
+        stack = []
+
+        while position < size and not self.cancelled:
+            chunk = self.lines.read_chunk(position, chunk_size)
+            if not chunk:
+                return
+
+            # A line longer than a chunk needs a bigger one.
+            if position + len(chunk) < size:
+                end = chunk.rfind(b'\n') + 1
+                if not end:
+                    chunk_size *= 2
+                    continue
+                chunk = chunk[:end]
+
+            brackets = STRING_TOKEN.sub(b'', chunk).translate(None, NOT_BRACKETS)
+            for line, run in enumerate(brackets.split(b'\n'), bisect_right(offsets, position) - 1):
+                if not run:
+                    continue
+                for token in run:
+                    if token == OPEN_BRACE or token == OPEN_BRACKET:
+                        depths.append(len(stack))
+                        stack.append(len(openers))
+                        openers.append(line)
+                        closers.append(line)
+                    elif stack:
+                        closers[stack.pop()] = line
+
+            position += len(chunk)
+            self.scanned = position
+
+        if self.cancelled:
+            return
+        if depths and max(depths) > MAX_DEPTH:
+            depths = [min(depth, MAX_DEPTH) for depth in depths]
+        spanning = [closer > opener for opener, closer in zip(openers, closers)]
+        self.set_containers(array('q', compress(openers, spanning)), array('q', compress(closers, spanning)), bytearray(compress(depths, spanning)))
+        self.complete = True
+
+    def set_containers(self, openers: array, closers: array, depths: bytearray):
+        self.openers = openers
+        self.closers = closers
+        self.depths = depths
+        self.collapsed = bytearray(len(openers))
+        self.effective = []
+        self.hidden = FenwickTree(len(openers))
+        self.hidden_total = 0
+        self.heights = None
+
+    def rebuild(self, mask: bytes = None):
+        # Adding a few folds one by one beats building the whole tree. mask
+        # marks the outermost folds, when the caller already has it.
+        if mask is None and len(self.effective) * max(len(self).bit_length(), 1) < len(self):
+            self.hidden = FenwickTree(len(self))
+            self.hidden_total = 0
+            self.update([], self.effective, rebuild=False)
+            return
+
+        if mask is None:
+            mask = bytearray(len(self))
+            for index in self.effective:
+                mask[index] = 1
+        if self.heights is None:
+            self.heights = list(map(operator.sub, self.closers, self.openers))
+        hidden = list(map(operator.mul, self.heights, mask))
+        self.hidden = FenwickTree.from_values(hidden)
+        self.hidden_total = sum(hidden)
+
+    def update(self, removed: list, added: list, rebuild: bool = True):
+        if rebuild and len(removed) + len(added) > 64:
+            self.rebuild()
+            return
+        for index in removed:
+            self.hidden.add(index, self.openers[index] - self.closers[index])
+            self.hidden_total -= self.closers[index] - self.openers[index]
+        for index in added:
+            self.hidden.add(index, self.closers[index] - self.openers[index])
+            self.hidden_total += self.closers[index] - self.openers[index]
+
+    def subtree_end(self, index: int):
+        # Nested containers follow the one they are in, and open before it
+        # closes. A sibling may open on the line it closes on.
+        return bisect_left(self.openers, self.closers[index], index + 1)
+
+    def container_at(self, line: int):
+        index = bisect_left(self.openers, line)
+        if index < len(self) and self.openers[index] == line:
+            return index
+        return None
+
+    def fold_containing(self, line: int):
+        # The outermost folded container hiding line, if any.
+        position = bisect_left(self.effective, line, key=self.openers.__getitem__) - 1
+        if position >= 0 and self.closers[self.effective[position]] >= line:
+            return self.effective[position]
+        return None
+
+    def is_outermost(self, index: int):
+        position = bisect_left(self.effective, index)
+        return position < len(self.effective) and self.effective[position] == index
+
+    def is_folded(self, line: int):
+        index = self.container_at(line)
+        return index is not None and self.collapsed[index] == 1
+
+    def visible_count(self, total: int):
+        return total - self.hidden_total
+
+    def row_of(self, line: int):
+        # A hidden line is on the row of the fold hiding it.
+        fold = self.fold_containing(line)
+        if fold is not None:
+            line = self.openers[fold]
+        return line - self.hidden.prefix(bisect_left(self.openers, line))
+
+    def line_of(self, row: int):
+        # The rows of folded lines grow with their position, so the last fold
+        # at or before the row is found by bisection. The row is either that
+        # fold's own or one of the lines after it.
+        openers = self.openers
+        effective = self.effective
+        prefix = self.hidden.prefix
+        position = bisect_right(range(len(effective)), row, key=lambda position: openers[effective[position]] - prefix(effective[position])) - 1
+        if position < 0:
+            return row
+
+        fold = effective[position]
+        fold_row = openers[fold] - prefix(fold)
+        return openers[fold] if row == fold_row else self.closers[fold] + row - fold_row
+
+    def visible_lines(self, row: int, count: int, total: int):
+        line = self.line_of(row)
+        position = bisect_left(self.effective, line, key=self.openers.__getitem__)
+        lines = []
+        while len(lines) < count and line < total:
+            lines.append(line)
+            if position < len(self.effective) and self.openers[self.effective[position]] == line:
+                line = self.closers[self.effective[position]] + 1
+                position += 1
+            else:
+                line += 1
+        return lines
+
+    def collapse(self, index: int):
+        if self.collapsed[index]:
+            return
+        self.collapsed[index] = 1
+        if self.fold_containing(self.openers[index]) is not None:
+            return
+
+        # Folds inside this one stay folded, but no longer hide lines of
+        # their own.
+        end = self.subtree_end(index)
+        first = bisect_left(self.effective, index + 1)
+        last = bisect_left(self.effective, end)
+        removed = self.effective[first:last]
+        self.effective[first:last] = [index]
+        self.update(removed, [index])
+
+    def expand(self, index: int):
+        if not self.collapsed[index]:
+            return
+        self.collapsed[index] = 0
+        position = bisect_left(self.effective, index)
+        if position == len(self.effective) or self.effective[position] != index:
+            return
+
+        # The outermost folds inside it hide their lines again.
+        end = self.subtree_end(index)
+        inner = []
+        found = self.collapsed.find(1, index + 1, end)
+        while found != -1:
+            inner.append(found)
+            found = self.collapsed.find(1, self.subtree_end(found), end)
+        self.effective[position:position + 1] = inner
+        self.update([index], inner)
+
+    def toggle(self, line: int):
+        index = self.container_at(line)
+        if index is None:
+            return False
+        if self.collapsed[index]:
+            self.expand(index)
+        else:
+            self.collapse(index)
+        return True
+
+    def reveal(self, line: int):
+        fold = self.fold_containing(line)
+        while fold is not None:
+            self.expand(fold)
+            fold = self.fold_containing(line)
+
+    def collapse_depth(self, depth: int):
+        # Folds every container nested depth deep or deeper, leaving the ones
+        # above open, in a few passes over the depths.
+        depth = min(depth, MAX_DEPTH - 1)
+        self.collapsed = bytearray(self.depths.translate(bytes(int(level >= depth) for level in range(256))))
+        outermost = self.depths.translate(bytes(int(level == depth) for level in range(256)))
+        self.effective = list(compress(range(len(self)), outermost))
+        self.rebuild(outermost)
+
+    def expand_all(self):
+        self.collapsed = bytearray(len(self))
+        self.effective = []
+        self.rebuild()
+
+    def enclosing(self, index: int, line: int):
+        # Containers opened before index that are still open at line,
+        # outermost first. They are all ancestors of the one just before it,
+        # unless that is nested too deep to tell.
+        chain = []
+        index -= 1
+        while index >= 0:
+            if self.depths[index] == MAX_DEPTH:
+                return None
+            if self.closers[index] >= line:
+                chain.append(index)
+            if self.depths[index] == 0:
+                break
+            index = self.depths.rfind(self.depths[index] - 1, 0, index)
+        chain.reverse()
+        return chain
+
+    def apply_edit(self, start: int, count: int, new_lines: list):
+        # Lines start to start + count were replaced by new_lines. Containers
+        # after them move, the ones around them stretch, and the brackets in
+        # the new lines are matched to find the containers they open and
+        # close. Returns False if those cannot be told apart.
+        end = start + count
+        delta = len(new_lines) - count
+        first = bisect_left(self.openers, start)
+        last = bisect_left(self.openers, end)
+
+        chain = self.enclosing(first, start)
+        if chain is None:
+            return False
+        pairs, closed, opened = match_brackets(new_lines, len(chain))
+        closing = [index for index in reversed(chain) if self.closers[index] < end]
+        spanning = [index for index in range(first, last) if self.closers[index] >= end]
+        if len(closing) != len(closed) or len(spanning) != len(opened):
+            return False
+
+        # Where the folds among the containers replaced are kept, and which
+        # of the containers around the edit are folds.
+        self.heights = None
+        low = bisect_left(self.effective, first)
+        high = bisect_left(self.effective, last)
+        replaced = set(self.effective[low:high])
+        around = [index for index in chain if self.is_outermost(index)]
+        before = {index: self.closers[index] - self.openers[index] for index in around + self.effective[low:high]}
+        for index in chain:
+            self.closers[index] += delta
+        for index, offset in zip(closing, closed):
+            self.closers[index] = start + offset
+
+        # The containers opened in the edited lines: those that continue past
+        # them and those entirely new, in document order.
+        middle = [(start + offset, self.closers[index] + delta, self.depths[index], self.collapsed[index], index in replaced) for index, offset in zip(spanning, opened)]
+        middle.extend((start + opener, start + closer, depth, 0, False) for opener, closer, depth in pairs)
+        middle.sort(key=lambda container: (container[0], -container[1]))
+
+        # Only the containers after the edit move, and only if lines were
+        # added or removed.
+        if delta:
+            self.openers[last:] = array('q', map(delta.__add__, self.openers[last:]))
+            self.closers[last:] = array('q', map(delta.__add__, self.closers[last:]))
+        self.openers[first:last] = array('q', [container[0] for container in middle])
+        self.closers[first:last] = array('q', [container[1] for container in middle])
+        self.depths[first:last] = bytearray(container[2] for container in middle)
+        self.collapsed[first:last] = bytearray(container[3] for container in middle)
+
+        shift = len(middle) - (last - first)
+        folds = [first + position for position, container in enumerate(middle) if container[4]]
+        if shift:
+            self.effective[high:] = [index + shift for index in self.effective[high:]]
+        self.effective[low:high] = folds
+
+        # Unless containers came or went, only the folds around the edit hide
+        # a different number of lines.
+        if shift:
+            self.rebuild()
+            return True
+        after = {index: self.closers[index] - self.openers[index] for index in around + folds}
+        for index in before.keys() | after.keys():
+            change = after.get(index, 0) - before.get(index, 0)
+            self.hidden.add(index, change)
+            self.hidden_total += change
+        return True
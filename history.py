@@ -0,0 +1,119 @@
+import sys
+from collections import deque
+
+
+# Stands in for the old value of a member that an edit added, and the new
+# value of one it deleted.
+MISSING = object()
+
+
+class EditStep:
+    __slots__ = ('path', 'old', 'new', 'position', 'size', 'group')
+
+    def __init__(self, path: list, old, new, position: int, size: int, group: int):
+        self.path = path
+        self.old = old
+        self.new = new
+
+        # Where an added or deleted member sits among its siblings, so undoing
+        # a delete puts it back in its place.
+        self.position = position
+        self.size = size
+
+        # Steps of one bulk edit share a group, and are undone together.
+        self.group = group
+
+
+class EditHistory:
+    # Each step holds just the member an edit swapped out and the one it put
+    # in. Everything else in the document is shared with the live data rather
+    # than copied, so a step costs the size of what was edited.
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.size = 0
+
+        self.groups = 0
+        self.grouping = False
+
+    def __len__(self):
+        return len(self.undo_steps)
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_steps)
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_steps)
+
+    def start_group(self):
+        self.groups += 1
+        self.grouping = True
+
+    def end_group(self):
+        self.grouping = False
+
+    def record(self, path, old, new, position: int = None):
+        # A new edit starts a new branch, and what was undone before it can no
+        # longer be redone.
+        for step in self.redo_steps:
+            self.size -= step.size
+        self.redo_steps.clear()
+        if not self.max_bytes:
+            return
+
+        limit = self.max_bytes + 1
+        size = estimate_size(path, limit) + estimate_size(old, limit) + estimate_size(new, limit)
+        if not self.grouping:
+            self.groups += 1
+        self.undo_steps.append(EditStep(list(path), old, new, position, size, self.groups))
+        self.size += size
+
+        # The oldest steps go first, a whole group at a time. A step bigger
+        # than the cap on its own is not kept either.
+        while self.size > self.max_bytes and self.undo_steps:
+            group = self.undo_steps[0].group
+            while self.undo_steps and self.undo_steps[0].group == group:
+                self.size -= self.undo_steps.popleft().size
+
+    def undo(self):
+        # The steps of the last edit, newest first.
+        steps = []
+        while self.undo_steps and (not steps or self.undo_steps[-1].group == steps[0].group):
+            steps.append(self.undo_steps.pop())
+        self.redo_steps.extend(steps)
+        return steps
+
+    def redo(self):
+        # The steps of the last edit undone, in the order they were made.
+        steps = []
+        while self.redo_steps and (not steps or self.redo_steps[-1].group == steps[0].group):
+            steps.append(self.redo_steps.pop())
+        self.undo_steps.extend(steps)
+        return steps
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.size = 0
+
+
+def estimate_size(value, limit: int):
+    # Roughly how much memory value keeps alive, counting shared scalars once
+    # per reference. Counting stops at limit, since a step that big is dropped
+    # whatever its exact size.
+    if value is MISSING:
+        return 0
+    size = 0
+    pending = [value]
+    while pending and size < limit:
+        value = pending.pop()
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif isinstance(value, list):
+            pending.extend(value)
+    return size
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+
+from array import array
+
+
+MAGIC = b'PJEIDX\x00\x01'
+HEADER_LENGTH = struct.Struct('<I')
+
+
+class IndexCache:
+    def __init__(self, filename: str, size: int, mtime_ns: int, head: bytes):
+        self.filename = os.path.abspath(filename)
+
+        # Kept next to the file it indexes, hidden, so it follows the file
+        # around and never shows up as something to open.
+        directory, name = os.path.split(self.filename)
+        self.path = os.path.join(directory, f".{name}.index")
+
+        # What a sidecar has to have been written for. The hash of the start
+        # of the file catches rewrites that keep the size and the mtime.
+        self.key = {
+            "path": self.filename,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "hash": hashlib.blake2b(head, digest_size=16).hexdigest(),
+            "byteorder": sys.byteorder,
+        }
+
+        self.header = None
+        self.data_start = 0
+
+    def load(self):
+        # Only the header is read here; the sections are read when the loader
+        # threads get to them.
+        try:
+            with open(self.path, 'rb') as file:
+                if file.read(len(MAGIC)) != MAGIC:
+                    return None
+                header_length, = HEADER_LENGTH.unpack(file.read(HEADER_LENGTH.size))
+                header = json.loads(file.read(header_length))
+                data_start = file.tell()
+                length = os.fstat(file.fileno()).st_size
+        except (OSError, ValueError, struct.error):
+            return None
+
+        if any(header.get(name) != value for name, value in self.key.items()):
+            return None
+        if length != data_start + header["offsets"] * header["offset_size"] + header["spans"]:
+            return None
+
+        self.header = header
+        self.data_start = data_start
+        return header
+
+    def read_offsets(self):
+        offsets = array('I' if self.header["offset_size"] == 4 else 'Q')
+        with open(self.path, 'rb') as file:
+            file.seek(self.data_start)
+            offsets.fromfile(file, self.header["offsets"])
+        return offsets if offsets.typecode == 'Q' else array('Q', offsets)
+
+    def read_spans(self):
+        with open(self.path, 'rb') as file:
+            file.seek(self.data_start + self.header["offsets"] * self.header["offset_size"])
+            return file.read(self.header["spans"])
+
+    def save(self, offsets: array, spans: bytes, **metadata):
+        # Offsets into files under 4 GB are stored in 32 bits.
+        if not offsets or offsets[-1] < 2 ** 32:
+            offsets = array('I', offsets)
+        header = dict(self.key, offsets=len(offsets), offset_size=offsets.itemsize, spans=len(spans), **metadata)
+        encoded = json.dumps(header).encode('utf-8')
+
+        # Written aside and renamed into place, so another window opening the
+        # same file never reads half a sidecar. A directory that cannot be
+        # written to just means every open parses the file.
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.', suffix='.tmp')
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(MAGIC)
+                file.write(HEADER_LENGTH.pack(len(encoded)))
+                file.write(encoded)
+                offsets.tofile(file)
+                file.write(spans)
+            os.replace(temp_path, self.path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+        self.header = header
+        self.data_start = len(MAGIC) + HEADER_LENGTH.size + len(encoded)
+        return True
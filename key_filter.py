@@ -0,0 +1,122 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+
+class KeyIndex:
+    def __init__(self, keys):
+        # Keys sorted case-insensitively, so every key starting with a given
+        # prefix sits in one contiguous run found by two bisects.
+        self.keys = sorted(keys, key=str.casefold)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix: str, lo: int = 0, hi: int = None):
+        # Matches for a longer prefix are a subrange of the matches for a
+        # shorter one, so a refined search can start from the previous bounds.
+        if hi is None:
+            hi = len(self.keys)
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix, lo, hi, key=str.casefold)
+        stop = bisect_right(self.keys, prefix + '\U0010ffff', start, hi, key=str.casefold)
+        return start, stop
+
+    def find(self, key: str):
+        start, stop = self.search(key)
+        for position in range(start, stop):
+            if self.keys[position] == key:
+                return position
+        return None
+
+    def add(self, key: str):
+        if self.find(key) is None:
+            insort(self.keys, key, key=str.casefold)
+
+    def discard(self, key: str):
+        position = self.find(key)
+        if position is not None:
+            del self.keys[position]
+
+
+class KeyRange:
+    __slots__ = ('keys', 'start', 'stop')
+
+    def __init__(self, keys: list, start: int, stop: int):
+        self.keys = keys
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return self.keys[self.start + start:self.start + stop:step]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.keys[self.start + index]
+
+    def __iter__(self):
+        for position in range(self.start, self.stop):
+            yield self.keys[position]
+
+
+class KeyFilter:
+    def __init__(self, max_indexes: int = 8):
+        self.max_indexes = max_indexes
+
+        # Indexes of recently filtered objects by id, holding on to the object
+        # so its id cannot be reused while the entry is cached.
+        self.indexes = OrderedDict()
+
+        self.text = ''
+        self.container = None
+        self.bounds = None
+
+    def get_index(self, container: dict):
+        entry = self.indexes.get(id(container))
+        if entry is not None:
+            self.indexes.move_to_end(id(container))
+            return entry[1]
+
+        index = KeyIndex(container.keys())
+        self.indexes[id(container)] = (container, index)
+        while len(self.indexes) > self.max_indexes:
+            self.indexes.popitem(last=False)
+        return index
+
+    def apply(self, container: dict, text: str):
+        index = self.get_index(container)
+        if container is self.container and self.bounds and text.startswith(self.text):
+            self.bounds = index.search(text, *self.bounds)
+        else:
+            self.bounds = index.search(text)
+        self.container = container
+        self.text = text
+        return KeyRange(index.keys, *self.bounds)
+
+    def reset(self):
+        self.text = ''
+        self.container = None
+        self.bounds = None
+
+    def clear(self):
+        # Every index is dropped, for when any object may have changed.
+        self.indexes.clear()
+        self.reset()
+
+    def edited(self, container: dict, key: str, deleted: bool = False):
+        entry = self.indexes.get(id(container))
+        if entry is None:
+            return
+
+        if deleted:
+            entry[1].discard(key)
+        else:
+            entry[1].add(key)
+        if container is self.container:
+            self.bounds = None
@@ -27,7 +27,7 @@ class Keyboard:
 
     def handle_backspace(self, keys, user_text: str):
         self.start_length = len(user_text)
-        if keys[pygame.K_BACKSPACE]:
+        if keys[pygame.K_BACKSPACE] and self.text_input.activated:
             if self.backspace_start_time is None:
                 self.backspace_start_time = pygame.time.get_ticks()
                 
@@ -96,11 +96,10 @@ class Keyboard:
                 text_input.add_text(user_text)
             elif user_text != text_input.placeholder:
                 text_input.add_json(
-                        filename="test.json",
+                        document=self.display_keys.document,
                         value=user_text
                     )
                 self.display_keys.set_keys(force_reload=True)
-                text_box.set_text("test.json", True)
                 text_input_callback(user_text)
                 user_text = text_input.placeholder
 
@@ -0,0 +1,88 @@
+import pygame
+
+from document import JSONDocument
+from keyboard import Keyboard
+from utils import DisplayJSONBox, DisplayJSONKeyButtonsDynamically, SearchPanel, TextInput, TreeMinimap
+
+
+BACKGROUND_COLOUR = (25, 25, 25)
+
+
+class EditorLayout:
+    # The editor's widgets, placed and wired together. main.py runs them and
+    # benchmark.py times them, from this one layout.
+    def __init__(self, screen: pygame.Surface, filename: str, save_delay: float = 1.0):
+        self.screen = screen
+
+        self.text_input = TextInput(
+            x=350,
+            y=125,
+            width=150,
+            height=50,
+            font=pygame.font.Font(None, 24),
+            max_length=50,
+            screen=screen,
+            placeholder="Enter text here"
+        )
+
+        self.text_box = DisplayJSONBox(
+            x=780,
+            y=0,
+            width=500,
+            height=screen.get_height(),
+            font=pygame.font.Font(None, 24),
+            screen=screen,
+            bg_colour=(105, 105, 105)
+        )
+        self.text_box.set_text(filename)
+
+        # The editor owns the parsed document; edits apply to it in memory and
+        # are written back to disk by its debounced background saver.
+        self.document = JSONDocument(filename, self.text_box.loader, save_delay=save_delay)
+        self.document.observers.append(self.text_box.apply_edit)
+
+        self.display_keys = DisplayJSONKeyButtonsDynamically(
+            x=15,
+            y=400,
+            width=750,
+            height=300,
+            font=pygame.font.Font(None, 24),
+            screen=screen,
+            button_width=725//5,
+            button_height=50,
+            button_spacing=5,
+            input_box=self.text_input,
+            display_json_box=self.text_box,
+            document=self.document,
+        )
+        self.text_box.path_callback = self.display_keys.open_path
+
+        self.minimap = TreeMinimap(
+            x=-2,
+            y=-2,
+            width=250,
+            height=200,
+            screen=screen,
+            text_box=self.text_box,
+        )
+
+        # Searches every key and value on a background thread; clicking a
+        # result opens it in the key grid.
+        self.search_panel = SearchPanel(
+            x=515,
+            y=10,
+            width=250,
+            height=340,
+            font=pygame.font.Font(None, 22),
+            screen=screen,
+            document=self.document,
+            open_callback=self.display_keys.open_path,
+        )
+        self.display_keys.text_inputs.append(self.search_panel.search_input)
+
+        self.keyboard = Keyboard(
+            text_input=self.text_input,
+            display_keys=self.display_keys
+        )
+
+        self.widgets = [self.text_input, self.text_box, self.display_keys, self.minimap, self.search_panel]
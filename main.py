@@ -1,67 +1,32 @@
+import os
 import pygame
 
 from utils import *
 
-from keyboard import Keyboard
+from layout import BACKGROUND_COLOUR, EditorLayout
+
+from profiler import Profiler, ProfilerOverlay
 
 pygame.init()
 
+# JSON_EDITOR_PROFILE=1 times every widget call (F3 shows the overlay, F4
+# writes a Chrome trace); JSON_EDITOR_TRACE=path also writes it on exit.
+profiler = Profiler.from_environment()
+
 clock = pygame.time.Clock()
 
 screen = pygame.display.set_mode((1280, 720))
 pygame.display.set_caption("JSON Editor")
 pygame.mouse.set_cursor(*pygame.cursors.tri_left)
 
-text_input = TextInput(
-            x=350, 
-            y=125, 
-            width=150, 
-            height=50, 
-            font=pygame.font.Font(None, 24),
-            max_length=50,
-            screen=screen,
-            placeholder="Enter text here"
-)
-
-text_box = DisplayJSONBox(
-            x=780,
-            y=0,
-            width=500,
-            height=screen.get_height(),
-            font=pygame.font.Font(None, 24),
-            screen=screen,
-            bg_colour=(105, 105, 105)
-)
-text_box.set_text("test.json")
-
-
-display_keys = DisplayJSONKeyButtonsDynamically(
-            x=15,
-            y=400,
-            width=750,
-            height=300,
-            font=pygame.font.Font(None, 24),
-            screen=screen,
-            button_width=725//5,
-            button_height=50,
-            button_spacing=5,
-            input_box=text_input,
-            display_json_box=text_box,
-)
-
-minimap = TreeMinimap(
-            x=-2,
-            y=-2,
-            width=250,
-            height=200,
-            screen=screen,
-            input_box=text_input,
-)
-
-keyboard = Keyboard(
-            text_input=text_input,
-            display_keys=display_keys
-)
+layout = EditorLayout(screen, "test.json")
+text_input = layout.text_input
+text_box = layout.text_box
+document = layout.document
+display_keys = layout.display_keys
+minimap = layout.minimap
+search_panel = layout.search_panel
+keyboard = layout.keyboard
 
 user_text = text_input.placeholder
 
@@ -69,41 +34,141 @@ running = True
 
 input_box_active = False
 
+# How long to wait for input when idle, while background work is running,
+# and while a held backspace still repeats.
+IDLE_TIMEOUT = 500
+LOADING_TIMEOUT = 100
+REPEAT_TIMEOUT = 10
+
+widgets = layout.widgets
+
+if profiler:
+    profiler.instrument(text_input, ("draw", "handle_event", "add_text"))
+    profiler.instrument(text_box, ("draw", "handle_event", "load_visible_text", "update_loading", "apply_edit"))
+    profiler.instrument(display_keys, ("draw", "handle_event", "set_keys", "load_visible_buttons"))
+    profiler.instrument(minimap, ("draw", "set_layout"))
+    profiler.instrument(search_panel, ("draw", "handle_event"))
+    profiler.instrument(keyboard, ("handle_keydown", "handle_backspace", "handle_mousedown"))
+    profiler.instrument(Button, ("draw", "render_skin"))
+
+    overlay = ProfilerOverlay(
+                x=15,
+                y=200,
+                width=490,
+                height=150,
+                screen=screen,
+                profiler=profiler
+    )
+    widgets.append(overlay)
+
 def text_input_callback(text):
     print(text)
 
 def button_callback():
     print("Button clicked!")
 
+screen.fill(BACKGROUND_COLOUR)
+full_redraw = True
+
 while running:
-    screen.fill((25, 25, 25))
     clock.tick(100)
 
+    if keyboard.backspace_start_time is not None:
+        timeout = REPEAT_TIMEOUT
+    elif text_box.loading or search_panel.searching:
+        timeout = LOADING_TIMEOUT
+    else:
+        timeout = IDLE_TIMEOUT
+    events = [pygame.event.wait(timeout)] + pygame.event.get()
+    if profiler:
+        profiler.begin_frame()
+
     keys = pygame.key.get_pressed()
     user_text = keyboard.handle_backspace(keys, user_text)
     
-    for event in pygame.event.get():
+    for event in events:
+        if event.type == pygame.NOEVENT:
+            continue
+
         if event.type == pygame.QUIT:
             running = False
 
+        if event.type == pygame.WINDOWEXPOSED:
+            full_redraw = True
+
         if event.type == pygame.MOUSEBUTTONDOWN:
             user_text, input_box_active = keyboard.handle_mousedown(user_text, text_input)
 
         if event.type == pygame.KEYDOWN and input_box_active:
             user_text = keyboard.handle_keydown(event, user_text, text_input, text_input_callback, text_box)
         
+        text_input.handle_event(event)
         text_box.handle_event(event)
         display_keys.handle_event(event)
-
-    display_keys.set_keys()
-
-    text_box.load_visible_text()
-    text_input.draw()
-    text_box.draw()
-    display_keys.draw()
-    minimap.draw()
-
-    pygame.display.update()
-    pygame.display.flip()
-
+        minimap.handle_event(event)
+        search_panel.handle_event(event)
+        if profiler:
+            overlay.handle_event(event)
+
+    text_box.save_error = document.error
+    if text_box.update_loading() and display_keys.at_root:
+        display_keys.set_keys(force_reload=True)
+
+    # A save that could not replace the file while the text pane had it open.
+    if document.pending_replace is not None and document.pending_replace[1] == document.version:
+        text_box.close()
+        document.finish_replace()
+        text_box.set_text(document.filename, force_reload=True)
+        document.rebase(text_box.loader)
+
+    # Edits the text pane could not splice in are shown once the saver has
+    # caught up with them.
+    if text_box.stale and document.saved_version == document.version:
+        text_box.set_text(document.filename, force_reload=True)
+        document.rebase(text_box.loader)
+
+    minimap.update()
+    search_panel.update()
+    if profiler:
+        overlay.update()
+
+    if full_redraw:
+        screen.fill(BACKGROUND_COLOUR)
+        for widget in widgets:
+            widget.dirty = True
+
+    dirty_rects = []
+    for widget in widgets:
+        if not widget.dirty:
+            continue
+
+        if widget is text_box:
+            text_box.load_visible_text()
+        elif widget is display_keys:
+            display_keys.set_keys()
+
+        screen.fill(BACKGROUND_COLOUR, widget.dirty_rect)
+        widget.draw()
+        widget.dirty = False
+        dirty_rects.append(widget.dirty_rect)
+
+    if full_redraw:
+        pygame.display.flip()
+        full_redraw = False
+    elif dirty_rects:
+        pygame.display.update(dirty_rects)
+
+    if profiler:
+        profiler.end_frame()
+
+if profiler and os.environ.get("JSON_EDITOR_TRACE"):
+    profiler.export_trace(os.environ["JSON_EDITOR_TRACE"])
+
+# A document that is still being parsed has no edits that could be saved,
+# so its load is stopped rather than waited for.
+if not document.loaded:
+    document.loader.cancel()
+document.flush()
+text_box.close()
+document.finish_replace()
 pygame.quit()
\ No newline at end of file
@@ -0,0 +1,206 @@
+import json
+import os
+import time
+
+from collections import defaultdict, deque
+from typing import Tuple
+
+import pygame
+
+
+class Profiler:
+    def __init__(self, window: int = 120, max_events: int = 500000):
+        self.window = window
+        self.max_events = max_events
+
+        # Per-frame totals of every instrumented call, and the last few
+        # hundred frames of them for the overlay's rolling percentiles.
+        self.frame_start = None
+        self.frame_totals = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.history = defaultdict(lambda: deque(maxlen=self.window))
+
+        # (name, start, end) of every call and frame, for the trace export.
+        self.events = []
+        self.origin = time.perf_counter()
+
+        self.font_class = pygame.font.Font
+        self.surface_class = pygame.Surface
+
+    @classmethod
+    def from_environment(cls):
+        # Opt in, so a normal run pays only for a None check per frame.
+        if not os.environ.get("JSON_EDITOR_PROFILE") and not os.environ.get("JSON_EDITOR_TRACE"):
+            return None
+        profiler = cls()
+        profiler.install_counters()
+        return profiler
+
+    def install_counters(self):
+        # Fonts and surfaces created from here on count their renders and
+        # allocations, so this has to run before the widgets are built.
+        profiler = self
+
+        class CountingFont(self.font_class):
+            def render(self, *args, **kwargs):
+                profiler.counters["font.render"] += 1
+                return super().render(*args, **kwargs)
+
+        class CountingSurface(self.surface_class):
+            def __init__(self, *args, **kwargs):
+                profiler.counters["Surface"] += 1
+                super().__init__(*args, **kwargs)
+
+        pygame.font.Font = CountingFont
+        pygame.Surface = CountingSurface
+
+    def instrument(self, target, methods: Tuple[str, ...], label: str = None):
+        # Works on instances and on classes; wrapping a class times the
+        # method for every instance, which is how slotted Buttons are done.
+        if label is None:
+            label = target.__name__ if isinstance(target, type) else type(target).__name__
+        for name in methods:
+            function = getattr(target, name, None)
+            if function is not None:
+                setattr(target, name, self.wrap(f"{label}.{name}", function))
+
+    def wrap(self, name: str, function):
+        record = self.record
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, start, time.perf_counter())
+
+        return timed
+
+    def record(self, name: str, start: float, end: float):
+        self.frame_totals[name] += end - start
+        if len(self.events) < self.max_events:
+            self.events.append((name, start, end))
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        end = time.perf_counter()
+        self.record("frame", self.frame_start, end)
+        self.frame_start = None
+
+        for name, total in self.frame_totals.items():
+            self.history[name].append(total * 1000)
+        for name, count in self.counters.items():
+            self.history[name].append(count)
+        self.frame_totals.clear()
+        self.counters.clear()
+
+    def get_stats(self):
+        stats = []
+        for name, samples in self.history.items():
+            ordered = sorted(samples)
+            if not ordered:
+                continue
+            stats.append((
+                name,
+                ordered[len(ordered) // 2],
+                ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+                ordered[-1],
+            ))
+        stats.sort(key=lambda stat: stat[2], reverse=True)
+        return stats
+
+    def export_trace(self, path: str):
+        # Chrome's trace event format, for chrome://tracing or Perfetto.
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": 1,
+            }
+            for name, start, end in self.events
+        ]
+        with open(path, 'w') as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+class ProfilerOverlay:
+    def __init__(self,
+                 x: int,
+                 y: int,
+                 width: int,
+                 height: int,
+                 screen: pygame.display.set_mode,
+                 profiler: Profiler,
+                 font_colour: Tuple[int, int, int] = (220, 220, 220),
+                 bg_colour: Tuple[int, int, int] = (40, 40, 40),
+                 toggle_key: int = pygame.K_F3,
+                 export_key: int = pygame.K_F4
+                 ):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.screen = screen
+        self.profiler = profiler
+        self.font_colour = font_colour
+        self.bg_colour = bg_colour
+        self.toggle_key = toggle_key
+        self.export_key = export_key
+
+        # Built from the uncounted classes, so the overlay does not show up
+        # in its own render and allocation counts.
+        self.font = profiler.font_class(pygame.font.match_font("monospace"), 14)
+        self.surface = profiler.surface_class((self.width, self.height))
+        self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
+
+        self.visible = False
+        self.trace_path = os.environ.get("JSON_EDITOR_TRACE") or "trace.json"
+
+        self.dirty = False
+        self.dirty_rect = self.rect
+
+    def handle_event(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == self.toggle_key:
+            self.visible = not self.visible
+            self.dirty = True
+        elif event.key == self.export_key:
+            self.profiler.export_trace(self.trace_path)
+
+    def update(self):
+        if self.visible:
+            self.dirty = True
+
+    def draw(self):
+        if not self.visible:
+            return
+
+        self.surface.fill(self.bg_colour)
+        line_height = self.font.get_linesize()
+        header = self.font.render("p50 / p95 / max per frame (ms or count)", True, self.font_colour)
+        self.surface.blit(header, (5, 3))
+
+        # Long names lose their start, so the method stays readable.
+        name_width = max((self.width - 10) // self.font.size(" ")[0] - 27, 8)
+
+        y = 3 + line_height
+        for name, median, high, peak in self.profiler.get_stats():
+            if y + line_height > self.height:
+                break
+            if len(name) > name_width:
+                name = "…" + name[1 - name_width:]
+            text = f"{name:<{name_width}} {median:8.2f} {high:8.2f} {peak:8.2f}"
+            self.surface.blit(self.font.render(text, True, self.font_colour), (5, y))
+            y += line_height
+
+        self.screen.blit(self.surface, (self.x, self.y))
@@ -0,0 +1,382 @@
+import json
+import operator
+import re
+from functools import lru_cache
+
+from file_index import RecordList
+
+
+# A JSONPath subset: $, .name, ['name'], [index], [start:stop:step], unions
+# of those, * wildcards, .. descent, and [?(...)] filters comparing @ paths
+# with literals, joined by && and ||.
+TOKEN = re.compile(r'''
+    \s*(?:
+      (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    | (?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+    | (?P<name>[^\W\d][\w-]*)
+    | (?P<symbol>\.\.|==|!=|<=|>=|&&|\|\||[$@.\[\]*,:?()<>!])
+    )''', re.VERBOSE)
+
+COMPARISONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+LITERALS = {'true': True, 'false': False, 'null': None}
+
+SINGLE_QUOTED = re.compile(r'\\.|"')
+SWAPPED_QUOTES = {'"': '\\"', "\\'": "'"}
+
+# Stands in for what a filter's @ path does not reach.
+NOTHING = object()
+
+
+class QueryError(ValueError):
+    pass
+
+
+def tokenize(text: str):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise QueryError(f"unexpected {text[position:position + 10]!r} at {position}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string' and value[0] == "'":
+            # Read as JSON once its quotes are swapped: \' becomes ' and a
+            # bare " is escaped, while every other escape is kept.
+            value = '"' + SINGLE_QUOTED.sub(lambda match: SWAPPED_QUOTES.get(match.group(), match.group()), value[1:-1]) + '"'
+        if kind in ('string', 'number'):
+            try:
+                value = json.loads(value)
+            except ValueError as error:
+                raise QueryError(f"bad {kind} at {match.start(kind)}: {error.msg}") from None
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+def children(node):
+    # (key, child) pairs, keys as they appear in document paths.
+    if isinstance(node, dict):
+        return node.items()
+    if isinstance(node, RecordList):
+        return ((str(ordinal), node.peek(ordinal)) for ordinal in range(len(node)))
+    if isinstance(node, list):
+        return ((str(index), child) for index, child in enumerate(node))
+    return ()
+
+
+def descendants(path: tuple, node):
+    # The node and everything below it, in document order.
+    stack = [(path, node)]
+    while stack:
+        path, node = stack.pop()
+        yield path, node
+        if isinstance(node, (dict, list, RecordList)):
+            stack.extend(reversed([(path + (key,), child) for key, child in children(node)]))
+
+
+def select_name(name: str):
+    def select(path: tuple, node):
+        if isinstance(node, dict) and name in node:
+            yield path + (name,), node[name]
+    return select
+
+
+def select_index(index: int):
+    def select(path: tuple, node):
+        if isinstance(node, (list, RecordList)):
+            position = index + len(node) if index < 0 else index
+            if 0 <= position < len(node):
+                yield path + (str(position),), (node.peek(position) if isinstance(node, RecordList) else node[position])
+    return select
+
+
+def select_slice(start, stop, step):
+    if step == 0:
+        raise QueryError("slice step cannot be 0")
+
+    def select(path: tuple, node):
+        if isinstance(node, (list, RecordList)):
+            for position in range(*slice(start, stop, step).indices(len(node))):
+                yield path + (str(position),), (node.peek(position) if isinstance(node, RecordList) else node[position])
+    return select
+
+
+def select_all(path: tuple, node):
+    for key, child in children(node):
+        yield path + (key,), child
+
+
+def select_filter(predicate):
+    def select(path: tuple, node):
+        for key, child in children(node):
+            if predicate(child):
+                yield path + (key,), child
+    return select
+
+
+def select_union(selectors: list):
+    if len(selectors) == 1:
+        return selectors[0]
+
+    def select(path: tuple, node):
+        for selector in selectors:
+            yield from selector(path, node)
+    return select
+
+
+def make_step(selector, descend: bool = False):
+    # A step turns the stream of nodes matched so far into the next one,
+    # lazily, so matches come out one at a time in a single pass.
+    if descend:
+        def step(nodes):
+            for path, node in nodes:
+                for inner_path, inner in descendants(path, node):
+                    yield from selector(inner_path, inner)
+    else:
+        def step(nodes):
+            for path, node in nodes:
+                yield from selector(path, node)
+    return step
+
+
+class Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, expected: str = None):
+        kind, value = self.peek()
+        if kind is None:
+            raise QueryError(f"{self.text!r} ends early")
+        if expected is not None and value != expected:
+            raise QueryError(f"expected {expected!r} in {self.text!r}, found {value!r}")
+        self.position += 1
+        return kind, value
+
+    def at(self, symbol: str):
+        kind, value = self.peek()
+        return kind == 'symbol' and value == symbol
+
+    def parse_query(self):
+        self.take('$')
+        steps = []
+        while self.peek()[0] is not None:
+            if self.at('..'):
+                self.take()
+                steps.append(make_step(self.parse_member() if not self.at('[') else self.parse_brackets(), descend=True))
+            elif self.at('.'):
+                self.take()
+                steps.append(make_step(self.parse_member()))
+            elif self.at('['):
+                steps.append(make_step(self.parse_brackets()))
+            else:
+                raise QueryError(f"unexpected {self.peek()[1]!r} in {self.text!r}")
+        return steps
+
+    def parse_member(self):
+        kind, value = self.take()
+        if kind == 'symbol' and value == '*':
+            return select_all
+        if kind in ('name', 'string'):
+            return select_name(value)
+        if kind == 'number' and isinstance(value, int):
+            return select_name(str(value))
+        raise QueryError(f"expected a member name in {self.text!r}, found {value!r}")
+
+    def parse_brackets(self):
+        self.take('[')
+        selectors = [self.parse_selector()]
+        while self.at(','):
+            self.take()
+            selectors.append(self.parse_selector())
+        self.take(']')
+        return select_union(selectors)
+
+    def parse_selector(self):
+        kind, value = self.peek()
+        if kind is None:
+            self.take()
+        if kind == 'symbol' and value == '*':
+            self.take()
+            return select_all
+        if kind == 'symbol' and value == '?':
+            self.take()
+            self.take('(')
+            predicate = self.parse_or()
+            self.take(')')
+            return select_filter(predicate)
+        if kind == 'string':
+            self.take()
+            return select_name(value)
+
+        # An index or a slice, each part optional.
+        parts = [None]
+        while True:
+            kind, value = self.peek()
+            if kind == 'number':
+                if not isinstance(value, int):
+                    raise QueryError(f"index {value!r} is not an integer in {self.text!r}")
+                self.take()
+                parts[-1] = value
+            elif kind == 'symbol' and value == ':' and len(parts) < 3:
+                self.take()
+                parts.append(None)
+            else:
+                break
+        if len(parts) == 1:
+            if parts[0] is None:
+                raise QueryError(f"expected a selector in {self.text!r}, found {value!r}")
+            return select_index(parts[0])
+        parts += [None] * (3 - len(parts))
+        return select_slice(*parts)
+
+    def parse_or(self):
+        predicate = self.parse_and()
+        while self.at('||'):
+            self.take()
+            left, right = predicate, self.parse_and()
+            predicate = lambda node, left=left, right=right: left(node) or right(node)
+        return predicate
+
+    def parse_and(self):
+        predicate = self.parse_comparison()
+        while self.at('&&'):
+            self.take()
+            left, right = predicate, self.parse_comparison()
+            predicate = lambda node, left=left, right=right: left(node) and right(node)
+        return predicate
+
+    def parse_comparison(self):
+        if self.at('('):
+            self.take()
+            predicate = self.parse_or()
+            self.take(')')
+            return predicate
+        if self.at('!'):
+            self.take()
+            inner = self.parse_comparison()
+            return lambda node: not inner(node)
+
+        left = self.parse_operand()
+        kind, value = self.peek()
+        if kind != 'symbol' or value not in COMPARISONS:
+            # A lone @ path tests that it exists.
+            return lambda node: left(node) is not NOTHING
+        self.take()
+        compare = COMPARISONS[value]
+        right = self.parse_operand()
+
+        def predicate(node):
+            a, b = left(node), right(node)
+            if a is NOTHING or b is NOTHING:
+                return False
+            if isinstance(a, bool) != isinstance(b, bool):
+                return compare is operator.ne
+            try:
+                return compare(a, b)
+            except TypeError:
+                # Values of different types are only ever unequal.
+                return compare is operator.ne
+        return predicate
+
+    def parse_operand(self):
+        kind, value = self.take()
+        if kind in ('string', 'number'):
+            return lambda node: value
+        if kind == 'name' and value in LITERALS:
+            literal = LITERALS[value]
+            return lambda node: literal
+        if kind != 'symbol' or value != '@':
+            raise QueryError(f"expected @ or a literal in {self.text!r}, found {value!r}")
+
+        keys = []
+        while self.at('.') or self.at('['):
+            if self.take()[1] == '.':
+                keys.append(self.take()[1])
+            else:
+                keys.append(self.take()[1])
+                self.take(']')
+
+        def operand(node):
+            for key in keys:
+                if isinstance(node, dict):
+                    node = node.get(str(key), NOTHING)
+                elif isinstance(node, list) and isinstance(key, int) and -len(node) <= key < len(node):
+                    node = node[key]
+                else:
+                    return NOTHING
+            return node
+        return operand
+
+
+class Query:
+    def __init__(self, text: str):
+        self.text = text
+        self.steps = Parser(text).parse_query()
+
+    def iterate(self, data):
+        # Key lists, in document order for plain selectors.
+        nodes = iter([((), data)])
+        for step in self.steps:
+            nodes = step(nodes)
+        for path, _ in nodes:
+            yield list(path)
+
+    def evaluate(self, data):
+        # Every distinct match. Unions and overlapping descents can reach a
+        # member more than once.
+        seen = set()
+        paths = []
+        for path in self.iterate(data):
+            key = tuple(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+        return paths
+
+    def count(self, data):
+        return len(self.evaluate(data))
+
+
+@lru_cache(maxsize=256)
+def compile_query(text: str):
+    # Parsed once per distinct query; the plan holds no document state.
+    return Query(text.strip())
+
+
+def split_assignment(text: str):
+    # Comparisons only appear inside filter brackets, so the first = outside
+    # brackets and quotes is the assignment.
+    depth = 0
+    quote = None
+    escaped = False
+    for position, character in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif character == '\\':
+                escaped = True
+            elif character == quote:
+                quote = None
+        elif character in '\'"':
+            quote = character
+        elif character in '[(':
+            depth += 1
+        elif character in '])':
+            depth -= 1
+        elif character == '=' and depth == 0:
+            return text[:position].strip(), text[position + 1:].strip()
+    return text.strip(), None
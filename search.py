@@ -0,0 +1,237 @@
+import json
+import re
+import threading
+from array import array
+from bisect import bisect_left
+
+from file_index import RecordList
+
+
+TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: str):
+    return TOKEN.findall(text.casefold())
+
+
+def scalar_text(value):
+    # repr writes numbers as json.dumps would, only faster.
+    if isinstance(value, str):
+        return value
+    if value is None or isinstance(value, bool):
+        return json.dumps(value)
+    return repr(value)
+
+
+def matches(tokens, terms: list):
+    # Every term has to start some token of the member, so results narrow
+    # down as a query is typed.
+    return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+
+class SearchIndex:
+    # The word tokens of every key and scalar value in one version of a
+    # document. Members are numbered in document order and kept as (parent,
+    # key), so no path is stored whole.
+    def __init__(self, data, version: int):
+        self.version = version
+        self.parents = array('q')
+        self.keys = []
+        self.postings = {}
+        self.complete = False
+        self.failed = False
+
+        # Sorted, so every token starting with a term is found by bisecting.
+        self.tokens = []
+        self.sorted_count = 0
+
+        # Keys repeat across objects, so each is split into tokens once.
+        self.key_tokens = {}
+
+        self.walker = self.walk(data)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def walk(self, data):
+        # Resumable: a later search picks up where the last one left off.
+        stack = [(-1, self.children(data))]
+        while stack:
+            parent, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                continue
+
+            key, value = child
+            member = len(self.parents)
+            self.parents.append(parent)
+            self.keys.append(key)
+            if isinstance(key, str):
+                tokens = self.key_tokens.get(key)
+                if tokens is None:
+                    tokens = self.key_tokens[key] = frozenset(tokenize(key))
+            else:
+                tokens = frozenset()
+            if isinstance(value, (dict, list)):
+                stack.append((member, self.children(value)))
+            else:
+                tokens = tokens.union(tokenize(scalar_text(value)))
+            for token in tokens:
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = array('q')
+                posting.append(member)
+            yield member, tokens
+        self.complete = True
+
+    def children(self, value):
+        if isinstance(value, dict):
+            return iter(value.items())
+        if isinstance(value, RecordList):
+            # Records are read without going through the list's cache, which
+            # the UI thread owns.
+            return ((ordinal, value.peek(ordinal)) for ordinal in range(len(value)))
+        if isinstance(value, list):
+            return enumerate(value)
+        return iter(())
+
+    def path(self, member: int):
+        path = []
+        while member >= 0:
+            path.append(str(self.keys[member]))
+            member = self.parents[member]
+        path.reverse()
+        return path
+
+    def search(self, terms: list):
+        if self.sorted_count != len(self.postings):
+            self.tokens = sorted(self.postings)
+            self.sorted_count = len(self.tokens)
+
+        found = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            start = bisect_left(self.tokens, term)
+            stop = bisect_left(self.tokens, term + '\U0010ffff', start)
+            members = set()
+            for token in self.tokens[start:stop]:
+                members.update(self.postings[token])
+            found = members if found is None else found & members
+            if not found:
+                return []
+        return sorted(found) if found else []
+
+
+class DocumentSearch:
+    # Runs searches on a background thread. Results are appended to a list
+    # the UI thread reads as they come in; each new query gets a new list.
+    def __init__(self, document, max_results: int = 1000, batch_size: int = 256):
+        self.document = document
+        self.max_results = max_results
+        self.batch_size = batch_size
+
+        self.index = None
+        self.query = ''
+        self.results = []
+        self.generation = 0
+        self.searching = False
+
+        # How many members a query matches, counted past the results kept.
+        self.count = None
+
+        # Set when a search was asked for before the document finished
+        # loading, for the caller to start again once it has.
+        self.waiting = False
+
+        # Only the thread holding this advances the index.
+        self.lock = threading.Lock()
+
+    def start(self, query: str):
+        self.generation += 1
+        self.query = query
+        self.results = []
+        self.count = None
+        terms = tokenize(query)
+        self.searching = bool(terms) and self.document.loaded
+        self.waiting = bool(terms) and not self.document.loaded
+        if self.searching:
+            threading.Thread(target=self.run, args=(self.generation, terms, self.results), daemon=True).start()
+
+    def start_query(self, plan):
+        # Fills the same result list a search does.
+        self.generation += 1
+        self.query = plan.text
+        self.results = []
+        self.count = 0
+        self.searching = self.document.loaded
+        self.waiting = not self.document.loaded
+        if self.searching:
+            threading.Thread(target=self.run_query, args=(self.generation, plan, self.results), daemon=True).start()
+
+    def run_query(self, generation: int, plan, results: list):
+        while generation == self.generation:
+            count = 0
+            seen = set()
+            try:
+                for path in plan.iterate(self.document.data):
+                    key = tuple(path)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    count += 1
+                    if len(results) < self.max_results:
+                        results.append(path)
+                    if count % self.batch_size == 0:
+                        if generation != self.generation:
+                            return
+                        self.count = count
+            except RuntimeError:
+                # Edited while being walked; count again from the start.
+                del results[:]
+                continue
+            if generation == self.generation:
+                self.count = count
+                self.searching = False
+            return
+
+    def cancel(self):
+        self.generation += 1
+        self.searching = False
+        self.waiting = False
+
+    def get_index(self):
+        version = self.document.version
+        if self.index is None or self.index.version != version or self.index.failed:
+            self.index = SearchIndex(self.document.data, version)
+        return self.index
+
+    def run(self, generation: int, terms: list, results: list):
+        with self.lock:
+            while generation == self.generation:
+                index = self.get_index()
+                try:
+                    self.search(index, generation, terms, results)
+                except RuntimeError:
+                    # The document was edited under the walk. The next pass
+                    # starts an index of the new version.
+                    index.failed = True
+                    del results[:]
+                    continue
+                if generation == self.generation:
+                    self.searching = False
+                return
+
+    def search(self, index: SearchIndex, generation: int, terms: list, results: list):
+        # Indexed members are looked up; the rest are matched as indexed.
+        for member in index.search(terms)[:self.max_results]:
+            if generation != self.generation:
+                return
+            results.append(index.path(member))
+
+        count = 0
+        for member, tokens in index.walker:
+            if len(results) < self.max_results and matches(tokens, terms):
+                results.append(index.path(member))
+            count += 1
+            if count % self.batch_size == 0 and generation != self.generation:
+                return
@@ -0,0 +1,92 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import batch_edit
+
+
+class BatchEditTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name: str, text: str):
+        filename = os.path.join(self.directory.name, name)
+        with open(filename, 'w') as file:
+            file.write(text)
+        return filename
+
+    def run_edits(self, filename: str, edits: str, *options):
+        edits_file = self.write('edits.txt', edits)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            status = batch_edit.main([filename, edits_file, *options])
+        return status, output.getvalue()
+
+    def test_edits_are_converted_and_written_once(self):
+        data = {"users": [{"name": "A", "active": True}, {"name": "B", "active": True}], "count": 2}
+        filename = self.write('test.json', json.dumps(data, indent=4))
+        status, output = self.run_edits(filename, "\n".join([
+            "# comment",
+            "users/0/name=Nadia",
+            "count=3",
+            "",
+            "users/1/tags=['x', 1]",
+            "$.users[*].active=False",
+            "new key=hello = world",
+        ]))
+
+        self.assertEqual(status, 0, output)
+        self.assertIn("5 edits, 6 members set", output)
+        with open(filename) as file:
+            text = file.read()
+        expected = {
+            "users": [{"name": "Nadia", "active": False}, {"name": "B", "active": False, "tags": ["x", 1]}],
+            "count": 3,
+            "new key": "hello = world",
+        }
+        self.assertEqual(text, json.dumps(expected, indent=4))
+
+    def test_failed_edits_leave_the_file_unchanged(self):
+        text = json.dumps({"a": [1, 2], "b": "text"}, indent=4)
+        filename = self.write('test.json', text)
+        for edits in ("a/5=1", "missing/key=1", "b/c=1", "a/x=1", "$=1", "$.a[=1\na/0=5", "$.a[?(@ ==)]=1", "a/0"):
+            with self.subTest(edits=edits):
+                status, output = self.run_edits(filename, edits)
+                self.assertEqual(status, 1)
+                self.assertIn("line ", output)
+                with open(filename) as file:
+                    self.assertEqual(file.read(), text)
+
+        status, output = self.run_edits(filename, "a/5=1\na/0=5", "--keep-going")
+        self.assertEqual(status, 1)
+        with open(filename) as file:
+            self.assertEqual(json.load(file), {"a": [5, 2], "b": "text"})
+
+    def test_json_lines(self):
+        records = [{"id": i, "tags": [i]} for i in range(100)]
+        filename = self.write('test.jsonl', "".join(json.dumps(record) + "\n" for record in records))
+        status, output = self.run_edits(filename, "5/id=-5\n$[?(@.id > 97)].tags=[]\n0=None")
+
+        self.assertEqual(status, 0, output)
+        records[5]["id"] = -5
+        records[98]["tags"] = records[99]["tags"] = []
+        records[0] = None
+        with open(filename) as file:
+            self.assertEqual([json.loads(line) for line in file], records)
+
+    def test_history_is_not_kept(self):
+        filename = self.write('test.json', json.dumps({"a": 1}))
+        document = batch_edit.load(filename)
+        self.addCleanup(document.loader.lines.close)
+        count, errors = batch_edit.apply_edits(document, [(1, "a", "2"), (2, "b", "[3]")])
+        self.assertEqual((count, errors), (2, []))
+        self.assertEqual(document.data, {"a": 2, "b": [3]})
+        self.assertEqual(len(document.history), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from benchmark import compare, summarize
+
+
+def results(**medians):
+    return {"results": {"small": {name: {"p50": median} for name, median in medians.items()}}}
+
+
+class CompareTest(unittest.TestCase):
+    def test_summarize(self):
+        stats = summarize([5.0, 1.0, 3.0, 2.0, 4.0])
+        self.assertEqual((stats["samples"], stats["p50"], stats["max"], stats["mean"]), (5, 3.0, 5.0, 3.0))
+
+    def test_slower_medians_are_flagged(self):
+        regressions = compare(results(load=15.0, draw=1.0), results(load=10.0, draw=1.0), tolerance=0.2, noise_floor=0.5)
+        self.assertEqual(regressions, ["small/load p50: 10.000 ms -> 15.000 ms"])
+
+    def test_jitter_is_not_flagged(self):
+        # 50% slower, but only by a fraction of a millisecond.
+        self.assertEqual(compare(results(draw=0.3), results(draw=0.2), tolerance=0.2, noise_floor=0.5), [])
+        self.assertEqual(compare(results(load=11.0), results(load=10.0), tolerance=0.2, noise_floor=0.5), [])
+
+    def test_benchmarks_missing_from_the_baseline_are_skipped(self):
+        self.assertEqual(compare(results(new=100.0), results(), tolerance=0.2, noise_floor=0.5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
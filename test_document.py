@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from document import JSONDocument
+
+
+class DocumentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.filename = os.path.join(self.directory.name, 'test.json')
+
+    def open(self, data, **options):
+        with open(self.filename, 'w') as file:
+            json.dump(data, file, indent=4)
+        options.setdefault("save_delay", 3600)
+        document = JSONDocument(self.filename, **options)
+        self.addCleanup(document.loader.lines.close)
+        self.addCleanup(document.loader.cancel)
+        return document
+
+    def wait_until(self, condition, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+
+class FlushTest(DocumentTestCase):
+    def test_flush_without_edits_does_not_wait_for_the_load(self):
+        document = self.open({f"key{i}": list(range(20)) for i in range(50000)})
+        start = time.perf_counter()
+        self.assertTrue(document.flush())
+        self.assertLess(time.perf_counter() - start, 0.05)
+        self.assertFalse(document.loader.parsed)
+
+    def test_flush_waits_for_the_parse_to_save_edits(self):
+        document = self.open({"a": 1})
+        while not document.loaded:
+            time.sleep(0.001)
+        document.set(["a"], 2)
+        self.assertTrue(document.flush())
+        with open(self.filename) as file:
+            self.assertEqual(json.load(file), {"a": 2})
+
+    def test_cancelled_load_is_not_saved(self):
+        document = self.open({f"key{i}": list(range(20)) for i in range(50000)})
+        document.version += 1
+        document.loader.cancel()
+        start = time.perf_counter()
+        self.assertFalse(document.flush())
+        self.assertLess(time.perf_counter() - start, 1)
+
+
+class DebouncedSaverTest(DocumentTestCase):
+    def open_counting_writes(self, fail: int = 0):
+        document = self.open({"a": 0}, save_delay=0.05)
+        self.wait_until(lambda: document.loaded)
+        self.writes = []
+        write = document.write
+
+        # Each write records the error the last one ran into.
+        def counting_write():
+            self.writes.append(document.error)
+            if len(self.writes) <= fail:
+                raise OSError("disk full")
+            return write()
+        document.write = counting_write
+        return document
+
+    def test_edits_in_quick_succession_are_saved_once(self):
+        document = self.open_counting_writes()
+        for value in range(1, 6):
+            document.set(["a"], value)
+        self.wait_until(lambda: document.saved_version == document.version)
+        self.assertEqual(len(self.writes), 1)
+        with open(self.filename) as file:
+            self.assertEqual(json.load(file), {"a": 5})
+
+    def test_failed_save_is_retried(self):
+        document = self.open_counting_writes(fail=1)
+        document.set(["a"], 2)
+        self.wait_until(lambda: document.saved_version == document.version)
+        self.assertIsNone(self.writes[0])
+        self.assertIsInstance(self.writes[1], OSError)
+        self.assertIsNone(document.error)
+        with open(self.filename) as file:
+            self.assertEqual(json.load(file), {"a": 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
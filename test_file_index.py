@@ -0,0 +1,357 @@
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from file_index import FileLoader, LineBuffer, LineIndex, PrettyLines, RecordList, StructureIndex
+
+
+def random_value(rng: random.Random, depth: int):
+    roll = rng.random()
+    if depth > 3 or roll < 0.4:
+        return rng.choice([1, 2.5, "s", None, True, "ü", [], {}])
+    if roll < 0.7:
+        return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randint(1, 4))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(1, 4))]
+
+
+def all_paths(value, path=()):
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = ((str(i), child) for i, child in enumerate(value))
+    else:
+        return
+    for key, child in items:
+        yield path + (key,)
+        yield from all_paths(child, path + (key,))
+
+
+def resolve(value, path):
+    for key in path:
+        value = value[int(key)] if isinstance(value, list) else value[key]
+    return value
+
+
+class LineIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.txt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def index(self, text: str, chunk_size: int):
+        with open(self.filename, 'w', encoding='utf-8', newline='') as file:
+            file.write(text)
+        lines = LineIndex(self.filename, chunk_size)
+        self.addCleanup(lines.close)
+        return lines
+
+    def test_lines_match_splitlines(self):
+        rng = random.Random(3)
+        for chunk_size in (1, 3, 16, 1024):
+            for _ in range(20):
+                raw = ["ü" * rng.randint(0, 5) + "x" * rng.randint(0, 20) for _ in range(rng.randint(0, 30))]
+                text = "\n".join(raw) + rng.choice(["", "\n", "\r\n"])
+                with self.subTest(chunk_size=chunk_size, text=text):
+                    lines = self.index(text, chunk_size)
+                    self.assertEqual(list(lines), text.splitlines())
+
+                    # Byte lengths count the line break.
+                    longest = max(map(len, text.encode('utf-8').splitlines(keepends=True)), default=0)
+                    self.assertTrue(lines.complete)
+                    self.assertEqual(lines.longest, longest)
+
+    def test_lines_are_indexed_on_demand(self):
+        lines = self.index("".join(f"line {i}\n" for i in range(1000)), 64)
+        self.assertEqual(lines[5], "line 5")
+        self.assertFalse(lines.complete)
+        self.assertLess(lines.indexed_bytes, 200)
+        self.assertEqual(lines[998:], ["line 998", "line 999"])
+        self.assertTrue(lines.complete)
+        self.assertEqual(len(lines), 1000)
+        with self.assertRaises(IndexError):
+            lines[1000]
+
+
+class FileLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def start(self, text: str):
+        with open(self.filename, 'w') as file:
+            file.write(text)
+        loader = FileLoader(self.filename, 256)
+        self.addCleanup(loader.lines.close)
+        loader.start_indexing()
+        data = loader.start_parsing()
+        return loader, data
+
+    def wait(self, loader: FileLoader):
+        while loader.loading:
+            time.sleep(0.001)
+
+    def test_document_is_built_in_the_background(self):
+        expected = {f"k{i}": [i, {"v": str(i)}] for i in range(500)}
+        loader, data = self.start(json.dumps(expected, indent=4))
+        # The root is handed out up front and filled in place.
+        self.assertIsInstance(data, dict)
+        self.wait(loader)
+        self.assertTrue(loader.parsed)
+        self.assertIsNone(loader.error)
+        self.assertEqual(data, expected)
+        self.assertEqual(loader.members_loaded, 500)
+        self.assertEqual(len(loader.lines), json.dumps(expected, indent=4).count("\n") + 1)
+        self.assertEqual(loader.get_progress(), "")
+
+    def test_errors_are_kept(self):
+        loader, _ = self.start('{"a": 1,}')
+        self.wait(loader)
+        self.assertFalse(loader.parsed)
+        self.assertIsInstance(loader.error, ValueError)
+
+    def test_cancelled_load_is_not_parsed(self):
+        loader, _ = self.start(json.dumps(list(range(100000))))
+        loader.cancel()
+        # Indexing stops too, so the lines are never complete.
+        while loader.parsing:
+            time.sleep(0.001)
+        self.assertFalse(loader.parsed)
+
+
+class StructureIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, data, chunk_size: int):
+        with open(self.filename, 'w') as file:
+            json.dump(data, file, indent=4)
+
+        loader = FileLoader(self.filename, chunk_size)
+        loader.lines.index_all()
+        loaded = loader.start_parsing()
+        while loader.parsing:
+            time.sleep(0.001)
+        self.assertIsNone(loader.error)
+        self.assertEqual(loaded, data)
+        return loader, loaded
+
+    def test_splice_matches_json_dumps(self):
+        rng = random.Random(0)
+        for session in range(60):
+            data = {f"r{i}": random_value(rng, 1) for i in range(rng.randint(1, 5))}
+            loader, data = self.load(data, rng.choice([7, 64, 4096]))
+            lines = LineBuffer(loader.lines)
+            structure = StructureIndex(lines, loader.spans, sync_after=rng.choice([1, 3, 32]))
+
+            for step in range(12):
+                paths = list(all_paths(data))
+                if not paths:
+                    break
+                path = list(rng.choice(paths))
+                parent = resolve(data, path[:-1])
+                key = int(path[-1]) if isinstance(parent, list) else path[-1]
+                if rng.random() < 0.3:
+                    del parent[key]
+                    structure.delete(path)
+                else:
+                    parent[key] = random_value(rng, 2)
+                    structure.replace(path, parent[key])
+
+                with self.subTest(session=session, step=step):
+                    self.assertEqual('\n'.join(lines[0:len(lines)]), json.dumps(data, indent=4))
+            loader.lines.close()
+
+    def test_insert_matches_json_dumps(self):
+        rng = random.Random(5)
+        for session in range(60):
+            data = {f"r{i}": random_value(rng, 1) for i in range(rng.randint(1, 5))}
+            loader, data = self.load(data, rng.choice([7, 64, 4096]))
+            lines = LineBuffer(loader.lines)
+            structure = StructureIndex(lines, loader.spans, sync_after=rng.choice([1, 3, 32]))
+
+            for step in range(12):
+                containers = [()] + [path for path in all_paths(data) if isinstance(resolve(data, path), (dict, list))]
+                path = list(rng.choice(containers))
+                parent = resolve(data, path)
+                value = random_value(rng, 2)
+                if rng.random() < 0.2 and path:
+                    structure.delete(path)
+                    del resolve(data, path[:-1])[int(path[-1]) if isinstance(resolve(data, path[:-1]), list) else path[-1]]
+                elif isinstance(parent, list):
+                    ordinal = rng.randint(0, len(parent))
+                    parent.insert(ordinal, value)
+                    structure.insert(path + [str(ordinal)], value, ordinal)
+                else:
+                    ordinal = rng.randint(0, len(parent))
+                    key = f"n{step}"
+                    items = list(parent.items())
+                    items.insert(ordinal, (key, value))
+                    parent.clear()
+                    parent.update(items)
+                    structure.insert(path + [key], value, ordinal)
+
+                with self.subTest(session=session, step=step):
+                    self.assertEqual('\n'.join(lines[0:len(lines)]), json.dumps(data, indent=4))
+                    for member in all_paths(data):
+                        first, last = structure.get_lines(list(member))
+                        self.assertEqual(structure.path_at(first), list(member))
+            loader.lines.close()
+
+    def test_paths_and_lines_round_trip(self):
+        rng = random.Random(1)
+        data = {f"r{i}": random_value(rng, 1) for i in range(8)}
+        loader, data = self.load(data, 64)
+        structure = StructureIndex(LineBuffer(loader.lines), loader.spans)
+
+        for path in all_paths(data):
+            first, last = structure.get_lines(list(path))
+            self.assertEqual(structure.path_at(first), list(path))
+            self.assertEqual(last - first + 1, len(json.dumps(resolve(data, path), indent=4).split('\n')))
+        loader.lines.close()
+
+
+class PrettyLinesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_matches_json_dumps(self):
+        rng = random.Random(3)
+        for session in range(40):
+            data = random_value(rng, 0)
+            with open(self.filename, 'w') as file:
+                json.dump(data, file, separators=rng.choice([(',', ':'), (', ', ': ')]))
+
+            loader = FileLoader(self.filename)
+            loader.lines.index_all()
+            pretty = PrettyLines(loader.lines, chunk_size=rng.choice([3, 16, 4096]))
+            pretty.scan()
+            with self.subTest(session=session):
+                self.assertEqual(pretty[:], json.dumps(data, indent=4).split('\n'))
+            loader.lines.close()
+
+    def test_lines_map_to_paths(self):
+        rng = random.Random(4)
+        data = {f"r{i}": random_value(rng, 1) for i in range(8)}
+        with open(self.filename, 'w') as file:
+            json.dump(data, file, separators=(',', ':'))
+
+        loader = FileLoader(self.filename, 64)
+        loader.lines.index_all()
+        loader.start_parsing()
+        while loader.parsing:
+            time.sleep(0.001)
+        self.addCleanup(loader.lines.close)
+        structure = StructureIndex(LineBuffer(loader.lines), loader.spans)
+        pretty = PrettyLines(loader.lines)
+        pretty.scan()
+
+        for path in all_paths(data):
+            spans, ordinal = structure.locate(list(path))
+            key, _, _ = structure.get_span(spans, ordinal)
+            line = pretty.line_at(loader.lines.offset_of(*key))
+            self.assertEqual(structure.path_at(*loader.lines.position_of(pretty.content_start(line))), list(path))
+
+
+class RecordListTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.log')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, text: str):
+        with open(self.filename, 'w') as file:
+            file.write(text)
+
+        loader = FileLoader(self.filename, 16)
+        records = loader.start_parsing()
+        while loader.parsing:
+            time.sleep(0.001)
+        self.addCleanup(loader.lines.close)
+        return loader, records
+
+    def test_detects_json_lines(self):
+        loader, records = self.load('{"a": 1}\n[2]\n')
+        self.assertTrue(loader.json_lines)
+        self.assertIsInstance(records, RecordList)
+
+        loader, data = self.load('{"a":\n 1}\n')
+        self.assertFalse(loader.json_lines)
+        self.assertEqual(data, {"a": 1})
+
+    def test_cache_evicts_all_but_edited_records(self):
+        _, records = self.load("".join(json.dumps({"n": i}) + "\n" for i in range(10)))
+        records.max_cached = 2
+        first = records[0]
+        records.pin(1)
+        records[1]["n"] = -1
+        for ordinal in range(2, 10):
+            records[ordinal]
+        self.assertEqual(list(records.cache), [8, 9])
+        self.assertIsNot(records[0], first)
+        self.assertEqual(records[1], {"n": -1})
+
+        records[0]
+        records[8]
+        records[2]
+        self.assertEqual(list(records.cache), [8, 2])
+
+    def test_dump_copies_untouched_records(self):
+        rng = random.Random(2)
+        raw = [json.dumps(random_value(rng, 1), separators=(',', ':')) for _ in range(200)]
+        loader, records = self.load('\n'.join(raw) + '\n')
+        records.max_cached = 8
+        expected = [json.loads(line) for line in raw]
+        lines = list(raw)
+
+        for step in range(300):
+            ordinal = rng.randrange(len(records))
+            roll = rng.random()
+            if roll < 0.1:
+                del records[ordinal]
+                del expected[ordinal]
+                del lines[ordinal]
+            elif roll < 0.3 and isinstance(expected[ordinal], dict):
+                records.pin(ordinal)
+                records[ordinal]["edited"] = step
+                expected[ordinal]["edited"] = step
+                lines[ordinal] = json.dumps(expected[ordinal])
+            elif roll < 0.4:
+                records[ordinal] = step
+                expected[ordinal] = step
+                lines[ordinal] = json.dumps(step)
+            elif roll < 0.5:
+                ordinal = rng.randint(0, len(records))
+                records.insert(ordinal, [step])
+                expected.insert(ordinal, [step])
+                lines.insert(ordinal, json.dumps([step]))
+            else:
+                self.assertEqual(records[ordinal], expected[ordinal])
+
+        self.assertEqual(len(records), len(expected))
+        self.assertLessEqual(len(records.cache), 8)
+        output = io.BytesIO()
+        records.dump(output)
+        self.assertEqual(output.getvalue().decode('utf-8'), '\n'.join(lines) + '\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from file_index import FileLoader, LineBuffer, StructureIndex
+from folding import FenwickTree, FoldMap, match_brackets
+from test_file_index import all_paths, random_value, resolve
+
+
+class FenwickTreeTest(unittest.TestCase):
+    def test_built_tree_matches_added_values(self):
+        rng = random.Random(0)
+        for size in (0, 1, 2, 7, 100):
+            values = [rng.randrange(5) for _ in range(size)]
+            built = FenwickTree.from_values(values)
+            added = FenwickTree(size)
+            for index, value in enumerate(values):
+                added.add(index, value)
+            self.assertEqual(built.tree, added.tree)
+            for index in range(size + 1):
+                self.assertEqual(built.prefix(index), sum(values[:index]))
+
+
+    def test_updates_keep_prefix_sums(self):
+        rng = random.Random(1)
+        values = [rng.randrange(5) for _ in range(300)]
+        fenwick = FenwickTree.from_values(values)
+        for _ in range(500):
+            index, delta = rng.randrange(len(values)), rng.randint(-3, 3)
+            fenwick.add(index, delta)
+            values[index] += delta
+            end = rng.randrange(len(values) + 1)
+            self.assertEqual(fenwick.prefix(end), sum(values[:end]))
+
+
+class FoldMapTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, data, chunk_size: int):
+        with open(self.filename, 'w') as file:
+            json.dump(data, file, indent=4)
+        loader = FileLoader(self.filename, chunk_size)
+        loader.lines.index_all()
+        self.addCleanup(loader.lines.close)
+        folds = FoldMap(loader.lines, chunk_size)
+        folds.scan()
+        self.assertTrue(folds.complete)
+        return loader, folds
+
+    def check(self, folds: FoldMap, lines: list):
+        pairs, _, _ = match_brackets(lines, 0)
+        pairs.sort()
+        self.assertEqual(list(zip(folds.openers, folds.closers, folds.depths)), pairs)
+
+        hidden = set()
+        for index in range(len(folds)):
+            if folds.collapsed[index]:
+                hidden.update(range(folds.openers[index] + 1, folds.closers[index] + 1))
+        visible = [line for line in range(len(lines)) if line not in hidden]
+
+        self.assertEqual(folds.visible_count(len(lines)), len(visible))
+        for row, line in enumerate(visible):
+            self.assertEqual(folds.line_of(row), line)
+            self.assertEqual(folds.row_of(line), row)
+        for start in range(0, len(visible), 5):
+            self.assertEqual(folds.visible_lines(start, 7, len(lines)), visible[start:start + 7])
+
+    def test_folds_match_brute_force(self):
+        rng = random.Random(0)
+        for session in range(40):
+            data = {f"r{i}": random_value(rng, 1) for i in range(rng.randint(1, 6))}
+            loader, folds = self.load(data, rng.choice([7, 64, 4096]))
+            lines = LineBuffer(loader.lines)
+            text = lines[0:len(lines)]
+
+            for step in range(10):
+                roll = rng.random()
+                if roll < 0.1:
+                    folds.collapse_depth(rng.randint(0, 4))
+                elif roll < 0.15:
+                    folds.expand_all()
+                elif roll < 0.25:
+                    folds.reveal(rng.randrange(len(text)))
+                else:
+                    folds.toggle(rng.randrange(len(text)))
+                with self.subTest(session=session, step=step):
+                    self.check(folds, text)
+
+    def test_edits_keep_folds(self):
+        rng = random.Random(1)
+        for session in range(40):
+            data = {f"r{i}": random_value(rng, 1) for i in range(rng.randint(1, 6))}
+            loader, folds = self.load(data, 64)
+            data = loader.start_parsing()
+            while loader.parsing:
+                time.sleep(0.001)
+            lines = LineBuffer(loader.lines)
+            structure = StructureIndex(lines, loader.spans)
+
+            for step in range(10):
+                for _ in range(3):
+                    folds.toggle(rng.randrange(len(lines)))
+
+                paths = list(all_paths(data))
+                if not paths:
+                    break
+                path = list(rng.choice(paths))
+                parent = resolve(data, path[:-1])
+                key = int(path[-1]) if isinstance(parent, list) else path[-1]
+                if rng.random() < 0.3:
+                    del parent[key]
+                    start, count, new_lines = structure.delete(path)
+                else:
+                    parent[key] = random_value(rng, 2)
+                    start, count, new_lines = structure.replace(path, parent[key])
+                self.assertTrue(folds.apply_edit(start, count, new_lines))
+                with self.subTest(session=session, step=step):
+                    self.check(folds, lines[0:len(lines)])
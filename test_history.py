@@ -0,0 +1,177 @@
+import copy
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from document import JSONDocument
+from file_index import LineBuffer, StructureIndex
+from history import MISSING, EditHistory
+from test_file_index import all_paths, random_value, resolve
+
+
+class EditHistoryTest(unittest.TestCase):
+    def test_memory_cap_drops_oldest_steps(self):
+        history = EditHistory(max_bytes=4096)
+        for step in range(100):
+            history.record(['a', str(step)], MISSING, list(range(10)))
+            self.assertLessEqual(history.size, 4096)
+        self.assertGreater(len(history), 0)
+        self.assertLess(len(history), 100)
+        self.assertEqual(history.undo_steps[-1].path, ['a', '99'])
+
+        history.record(['big'], MISSING, list(range(10000)))
+        self.assertFalse(history.can_undo)
+        self.assertEqual(history.size, 0)
+
+    def test_new_edit_clears_redo(self):
+        history = EditHistory()
+        history.record(['a'], 1, 2)
+        history.record(['b'], 1, 2)
+        history.undo()
+        self.assertTrue(history.can_redo)
+        history.record(['c'], 1, 2)
+        self.assertFalse(history.can_redo)
+        self.assertEqual([step.path for step in history.undo_steps], [['a'], ['c']])
+
+
+class DocumentHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, data):
+        with open(self.filename, 'w') as file:
+            json.dump(data, file, indent=4)
+        document = JSONDocument(self.filename, save_delay=3600)
+        while document.loader.parsing:
+            time.sleep(0.001)
+        self.addCleanup(document.loader.lines.close)
+        return document
+
+    def edit(self, rng: random.Random, document: JSONDocument, step: int):
+        data = document.data
+        containers = [()] + [path for path in all_paths(data) if isinstance(resolve(data, path), (dict, list))]
+        paths = list(all_paths(data))
+        roll = rng.random()
+        if roll < 0.3 and paths:
+            document.delete(list(rng.choice(paths)))
+        elif roll < 0.6 and paths:
+            document.set(list(rng.choice(paths)), random_value(rng, 2))
+        else:
+            path = list(rng.choice(containers))
+            parent = resolve(data, path)
+            position = rng.randint(0, len(parent))
+            key = str(position) if isinstance(parent, list) else f"n{step}"
+            document.insert(path + [key], random_value(rng, 2), position)
+
+    def test_undo_and_redo_match_snapshots(self):
+        rng = random.Random(0)
+        for session in range(30):
+            document = self.load({f"r{i}": random_value(rng, 1) for i in range(rng.randint(1, 5))})
+            lines = LineBuffer(document.loader.lines)
+            structure = StructureIndex(lines, document.loader.spans, sync_after=rng.choice([1, 32]))
+
+            def apply_edit(path, value, deleted, position):
+                if deleted:
+                    structure.delete(path)
+                elif position is not None:
+                    structure.insert(path, value, position)
+                else:
+                    structure.replace(path, value)
+            document.observers.append(apply_edit)
+
+            snapshots = [copy.deepcopy(document.data)]
+            current = 0
+            for step in range(30):
+                roll = rng.random()
+                if roll < 0.25 and current:
+                    self.assertIsNotNone(document.undo())
+                    current -= 1
+                elif roll < 0.4 and current + 1 < len(snapshots):
+                    self.assertIsNotNone(document.redo())
+                    current += 1
+                else:
+                    self.edit(rng, document, step)
+                    current += 1
+                    del snapshots[current:]
+                    snapshots.append(copy.deepcopy(document.data))
+
+                with self.subTest(session=session, step=step):
+                    self.assertEqual(document.data, snapshots[current])
+                    self.assertEqual(list(document.data), list(snapshots[current]))
+                    self.assertEqual('\n'.join(lines[0:len(lines)]), json.dumps(document.data, indent=4))
+
+            while document.undo() is not None:
+                current -= 1
+            self.assertEqual(current, 0)
+            self.assertEqual(json.dumps(document.data), json.dumps(snapshots[0]))
+
+    def test_bulk_edits_save_once_and_undo_together(self):
+        rng = random.Random(1)
+        for session in range(20):
+            document = self.load({f"r{i}": random_value(rng, 1) for i in range(6)})
+            lines = LineBuffer(document.loader.lines)
+            structure = StructureIndex(lines, document.loader.spans)
+            document.quiet_after = rng.choice([0, 1000])
+            notified = []
+
+            def apply_edit(path, value, deleted, position):
+                notified.append(path)
+                if not path:
+                    return
+                if deleted:
+                    structure.delete(path)
+                elif position is not None:
+                    structure.insert(path, value, position)
+                else:
+                    structure.replace(path, value)
+            document.observers.append(apply_edit)
+            schedules = []
+            document.saver.schedule = lambda: schedules.append(document.version)
+
+            before = copy.deepcopy(document.data)
+            paths = list(all_paths(document.data))
+            chosen = [list(path) for path in rng.sample(paths, min(len(paths), rng.randint(1, 8)))]
+            expected = copy.deepcopy(document.data)
+            value = {"bulk": [session]}
+            if rng.random() < 0.5:
+                count = document.delete_all(chosen + chosen[:1])
+                for path in sorted(chosen, key=lambda path: [int(key) if key.isdigit() else -1 for key in path], reverse=True):
+                    try:
+                        parent = resolve(expected, path[:-1])
+                        del parent[int(path[-1]) if isinstance(parent, list) else path[-1]]
+                    except (KeyError, IndexError, TypeError):
+                        pass
+            else:
+                count = document.set_all(chosen, value)
+                for path in sorted(chosen, key=len, reverse=True):
+                    try:
+                        parent = resolve(expected, path[:-1])
+                        parent[int(path[-1]) if isinstance(parent, list) else path[-1]] = copy.deepcopy(value)
+                    except (KeyError, IndexError, TypeError):
+                        pass
+
+            with self.subTest(session=session):
+                self.assertEqual(count, len(chosen))
+                self.assertEqual(document.data, expected)
+                self.assertEqual(len(schedules), 1)
+                if document.quiet_after == 0:
+                    self.assertEqual(notified, [[]])
+                else:
+                    self.assertEqual(len(notified), len(chosen))
+                    self.assertEqual('\n'.join(lines[0:len(lines)]), json.dumps(document.data, indent=4))
+
+                document.undo()
+                self.assertEqual(json.dumps(document.data), json.dumps(before))
+                document.redo()
+                self.assertEqual(document.data, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
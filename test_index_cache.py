@@ -0,0 +1,83 @@
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from file_index import FileLoader, LineBuffer, StructureIndex
+from test_file_index import all_paths, random_value
+
+
+class IndexCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'test.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, build_data: bool = True):
+        loader = FileLoader(self.filename, 64)
+        loader.start_indexing()
+        data = loader.start_parsing(build_data)
+        while loader.parsing or not loader.lines.complete:
+            time.sleep(0.001)
+        self.assertIsNone(loader.error)
+        self.addCleanup(loader.lines.close)
+        return loader, data
+
+    def test_reopen_uses_sidecar(self):
+        rng = random.Random(3)
+        data = {f"r{i}": random_value(rng, 1) for i in range(40)}
+        with open(self.filename, 'w') as file:
+            json.dump(data, file, indent=4)
+
+        first, _ = self.open()
+        self.assertIsNone(first.cached)
+        first.remember_width("font", 321)
+        first.write_index()
+
+        for build_data in (True, False):
+            loader, loaded = self.open(build_data)
+            self.assertIsNotNone(loader.cached)
+            self.assertEqual(loader.widths, {"font": 321})
+            self.assertEqual(loader.lines.offsets, first.lines.offsets)
+            if build_data:
+                self.assertEqual(loaded, data)
+
+            expected = StructureIndex(LineBuffer(first.lines), first.spans)
+            structure = StructureIndex(LineBuffer(loader.lines), loader.spans)
+            for path in all_paths(data):
+                self.assertEqual(structure.get_lines(list(path)), expected.get_lines(list(path)))
+            for line in range(len(loader.lines)):
+                self.assertEqual(structure.path_at(line), expected.path_at(line))
+
+    def test_changed_file_is_parsed_again(self):
+        with open(self.filename, 'w') as file:
+            json.dump({"a": 1, "b": [1, 2]}, file, indent=4)
+        loader, _ = self.open()
+        loader.write_index()
+        stat = os.stat(self.filename)
+
+        # Same size and modification time, different content.
+        with open(self.filename, 'w') as file:
+            json.dump({"a": 2, "b": [1, 3]}, file, indent=4)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        loader, data = self.open()
+        self.assertIsNone(loader.cached)
+        self.assertEqual(data, {"a": 2, "b": [1, 3]})
+
+    def test_file_saved_over_gets_no_sidecar(self):
+        with open(self.filename, 'w') as file:
+            json.dump({"a": 1}, file)
+        loader, _ = self.open()
+        with open(self.filename, 'w') as file:
+            json.dump({"a": 12}, file)
+        loader.write_index()
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, '.test.json.index')))
+
+
+if __name__ == '__main__':
+    unittest.main()
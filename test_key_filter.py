@@ -0,0 +1,63 @@
+import random
+import unittest
+from unittest import mock
+
+from key_filter import KeyFilter, KeyIndex
+
+
+def brute_force(data: dict, text: str):
+    return sorted((key for key in data if key.casefold().startswith(text.casefold())), key=str.casefold)
+
+
+class KeyFilterTest(unittest.TestCase):
+    def test_typing_matches_brute_force(self):
+        rng = random.Random(4)
+        data = {"".join(rng.choice("abAB") for _ in range(rng.randint(1, 6))): None for _ in range(300)}
+        key_filter = KeyFilter()
+        for session in range(50):
+            text = ""
+            for _ in range(8):
+                text = text[:-1] if text and rng.random() < 0.3 else text + rng.choice("abAB")
+                with self.subTest(text=text):
+                    self.assertEqual(list(key_filter.apply(data, text)), brute_force(data, text))
+
+    def test_longer_prefixes_search_the_previous_matches(self):
+        data = {f"k{i}": i for i in range(600)}
+        key_filter = KeyFilter()
+        key_filter.apply(data, "k1")
+        with mock.patch.object(KeyIndex, "search", autospec=True, side_effect=KeyIndex.search) as search:
+            matches = key_filter.apply(data, "k12")
+        self.assertEqual(search.call_args.args[2:], key_filter.indexes[id(data)][1].search("k1"))
+        self.assertEqual(len(matches), 11)
+
+    def test_edits_keep_indexes_in_step(self):
+        data = {"apple": 1, "banana": 2}
+        key_filter = KeyFilter()
+        self.assertEqual(list(key_filter.apply(data, "a")), ["apple"])
+        data["avocado"] = 3
+        key_filter.edited(data, "avocado")
+        self.assertEqual(list(key_filter.apply(data, "a")), ["apple", "avocado"])
+        del data["apple"]
+        key_filter.edited(data, "apple", deleted=True)
+        self.assertEqual(list(key_filter.apply(data, "a")), ["avocado"])
+
+    def test_least_recently_filtered_indexes_are_dropped(self):
+        objects = [{f"k{i}": i} for i in range(3)]
+        key_filter = KeyFilter(max_indexes=2)
+        for data in objects + [objects[1]]:
+            key_filter.apply(data, "k")
+        self.assertEqual(list(key_filter.indexes), [id(objects[2]), id(objects[1])])
+
+    def test_clear_drops_indexes_of_changed_objects(self):
+        data = {f"k{i}": i for i in range(600)}
+        key_filter = KeyFilter()
+        self.assertEqual(len(key_filter.apply(data, "k1")), 111)
+
+        # Changed without telling the filter, as a quiet bulk edit does.
+        data.clear()
+        key_filter.clear()
+        self.assertEqual(list(key_filter.apply(data, "k1")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from profiler import Profiler
+
+
+class Widget:
+    def __init__(self):
+        self.calls = 0
+
+    def draw(self):
+        self.calls += 1
+        return self.calls
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_off_unless_asked_for(self):
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertIsNone(Profiler.from_environment())
+
+    def test_calls_are_totalled_per_frame(self):
+        profiler = Profiler(window=3)
+        widget = Widget()
+        profiler.instrument(widget, ("draw", "missing"))
+        for calls in (1, 2, 3, 4):
+            profiler.begin_frame()
+            for _ in range(calls):
+                self.assertEqual(widget.draw(), widget.calls)
+            profiler.end_frame()
+
+        self.assertEqual(widget.calls, 10)
+        self.assertEqual(len(profiler.history["Widget.draw"]), 3)
+        self.assertEqual({stat[0] for stat in profiler.get_stats()}, {"frame", "Widget.draw"})
+        self.assertEqual(sum(name == "Widget.draw" for name, _, _ in profiler.events), 10)
+
+    def test_instrumenting_a_class_times_every_instance(self):
+        class Slotted:
+            __slots__ = ()
+
+            def draw(self):
+                pass
+
+        profiler = Profiler()
+        profiler.instrument(Slotted, ("draw", ))
+        profiler.begin_frame()
+        Slotted().draw()
+        Slotted().draw()
+        profiler.end_frame()
+        self.assertEqual(sum(name == "Slotted.draw" for name, _, _ in profiler.events), 2)
+
+    def test_counters(self):
+        with mock.patch.object(pygame, "Surface", pygame.Surface), mock.patch.object(pygame.font, "Font", pygame.font.Font):
+            profiler = Profiler()
+            profiler.install_counters()
+            profiler.begin_frame()
+            pygame.Surface((1, 1))
+            pygame.Surface((1, 1))
+            profiler.end_frame()
+        self.assertEqual(list(profiler.history["Surface"]), [2])
+
+    def test_trace_export(self):
+        profiler = Profiler()
+        profiler.instrument(Widget(), ("draw", ))
+        profiler.begin_frame()
+        profiler.end_frame()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.json")
+            profiler.export_trace(path)
+            with open(path) as file:
+                trace = json.load(file)
+        self.assertEqual([event["name"] for event in trace["traceEvents"]], ["frame"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import random
+import unittest
+
+from query import QueryError, compile_query, split_assignment
+from test_file_index import all_paths, random_value, resolve
+
+
+STORE = {
+    "store": {
+        "book": [
+            {"title": "A", "price": 8.95, "category": "reference"},
+            {"title": "B", "price": 12.99, "isbn": "0-553"},
+            {"title": "C", "price": 22, "category": "fiction", "tags": ["x", "y"]},
+        ],
+        "bicycle": {"price": 19.95, "colour": "red"},
+    },
+    "open": True,
+}
+
+
+def paths(query: str, data=STORE):
+    return [".".join(path) for path in compile_query(query).evaluate(data)]
+
+
+class QueryTest(unittest.TestCase):
+    def test_selectors(self):
+        self.assertEqual(paths("$.store.book[*].title"), ["store.book.0.title", "store.book.1.title", "store.book.2.title"])
+        self.assertEqual(paths("$['store'][\"bicycle\"].colour"), ["store.bicycle.colour"])
+        self.assertEqual(paths("$.store.book[-1].title"), ["store.book.2.title"])
+        self.assertEqual(paths("$.store.book[0,2].title"), ["store.book.0.title", "store.book.2.title"])
+        self.assertEqual(paths("$.store.book[::2].title"), ["store.book.0.title", "store.book.2.title"])
+        self.assertEqual(paths("$.store.book[1:].price"), ["store.book.1.price", "store.book.2.price"])
+        self.assertEqual(paths("$.store.*"), ["store.book", "store.bicycle"])
+        self.assertEqual(paths("$.missing.title"), [])
+        self.assertEqual(paths("$"), [""])
+
+    def test_descent_and_filters(self):
+        self.assertEqual(paths("$..price"), ["store.book.0.price", "store.book.1.price", "store.book.2.price", "store.bicycle.price"])
+        self.assertEqual(paths("$..book[?(@.price < 10)].title"), ["store.book.0.title"])
+        self.assertEqual(paths("$..book[?(@.isbn)].title"), ["store.book.1.title"])
+        self.assertEqual(paths("$..book[?(!@.isbn && @.price > 10)].title"), ["store.book.2.title"])
+        self.assertEqual(paths("$..book[?(@.category == 'fiction' || @.price < 9)].title"), ["store.book.0.title", "store.book.2.title"])
+        self.assertEqual(paths("$[?(@ == true)]"), ["open"])
+        self.assertEqual(paths("$..book[?(@.price == 'cheap')]"), [])
+        self.assertEqual(paths("$..tags[*]"), ["store.book.2.tags.0", "store.book.2.tags.1"])
+
+    def test_wildcard_descent_reaches_every_member(self):
+        rng = random.Random(0)
+        for session in range(30):
+            data = {f"r{i}": random_value(rng, 1) for i in range(4)}
+            found = compile_query("$..*").evaluate(data)
+            self.assertEqual(sorted(map(tuple, found)), sorted(all_paths(data)))
+            for path in found:
+                resolve(data, path)
+
+    def test_quoted_names(self):
+        data = {'a"b': 1, "it's": 2, "a/b": 3}
+        self.assertEqual(paths(r"""$['a\"b']""", data), ['a"b'])
+        self.assertEqual(paths(r"""$["a\"b"]""", data), ['a"b'])
+        self.assertEqual(paths(r"""$['it\'s', "a/b"]""", data), ["it's", "a/b"])
+
+    def test_plans_are_cached(self):
+        self.assertIs(compile_query("$.store.book[*]"), compile_query("$.store.book[*]"))
+
+    def test_errors(self):
+        for text in ("store", "$.", "$[", "$[1.5]", "$.a[?(@.b ==)]", "$[::0]", "$.a b", '$["\\q"]', "$['\\x']", "$[01]"):
+            with self.subTest(text=text):
+                with self.assertRaises(QueryError):
+                    compile_query(text)
+
+    def test_split_assignment(self):
+        self.assertEqual(split_assignment("$.a[*].b = 5"), ("$.a[*].b", "5"))
+        self.assertEqual(split_assignment("$.a[?(@.b == 'x=y')].c = {\"k\": 1}"), ("$.a[?(@.b == 'x=y')].c", "{\"k\": 1}"))
+        self.assertEqual(split_assignment("$..price"), ("$..price", None))
+
+
+if __name__ == '__main__':
+    unittest.main()
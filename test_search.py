@@ -0,0 +1,113 @@
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+
+from document import JSONDocument
+from search import DocumentSearch, SearchIndex, matches, scalar_text, tokenize
+from test_file_index import all_paths, resolve
+
+
+WORDS = ["alpha", "beta", "gamma", "delta", "Alphabet", "bet", "x1", "ü"]
+
+
+def random_document(rng: random.Random, depth: int = 0):
+    roll = rng.random()
+    if depth > 2 or roll < 0.4:
+        return rng.choice([" ".join(rng.sample(WORDS, 2)), rng.randint(0, 20), 2.5, None, True, []])
+    if roll < 0.7:
+        return {rng.choice(WORDS) + str(i): random_document(rng, depth + 1) for i in range(rng.randint(1, 4))}
+    return [random_document(rng, depth + 1) for _ in range(rng.randint(1, 4))]
+
+
+def brute_force(data, query: str):
+    terms = tokenize(query)
+    found = []
+    for path in all_paths(data):
+        parent = resolve(data, path[:-1])
+        tokens = set() if isinstance(parent, list) else set(tokenize(path[-1]))
+        value = resolve(data, path)
+        if not isinstance(value, (dict, list)):
+            tokens.update(tokenize(scalar_text(value)))
+        if matches(tokens, terms):
+            found.append(list(path))
+    return found
+
+
+class SearchIndexTest(unittest.TestCase):
+    def test_search_matches_brute_force(self):
+        rng = random.Random(0)
+        for session in range(30):
+            data = {f"r{i}": random_document(rng, 1) for i in range(5)}
+            index = SearchIndex(data, 0)
+
+            # Half the index is built before the first lookups.
+            members = sum(1 for _ in all_paths(data))
+            for _ in range(members // 2):
+                next(index.walker)
+            for query in ("al", "bet", "alpha beta", "x1", "nothing", "2", "TRUE", "ü"):
+                found = [index.path(member) for member in index.search(tokenize(query))]
+                fresh = SearchIndex(data, 0)
+                streamed = [fresh.path(member) for member, tokens in fresh.walker if matches(tokens, tokenize(query))]
+                with self.subTest(session=session, query=query):
+                    self.assertEqual(streamed, brute_force(data, query))
+                    self.assertEqual(found, [path for path in brute_force(data, query) if path in found])
+            for _ in index.walker:
+                pass
+            self.assertTrue(index.complete)
+            for query in ("al", "alpha be", "g", "1"):
+                with self.subTest(session=session, query=query):
+                    self.assertEqual([index.path(member) for member in index.search(tokenize(query))], brute_force(data, query))
+
+
+class DocumentSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, name: str, text: str):
+        filename = os.path.join(self.directory.name, name)
+        with open(filename, 'w') as file:
+            file.write(text)
+        document = JSONDocument(filename, save_delay=3600)
+        while document.loader.parsing:
+            time.sleep(0.001)
+        self.addCleanup(document.loader.lines.close)
+        return document
+
+    def wait(self, search: DocumentSearch):
+        deadline = time.monotonic() + 10
+        while search.searching and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertFalse(search.searching)
+        return search.results
+
+    def test_results_follow_edits(self):
+        rng = random.Random(1)
+        data = {f"r{i}": random_document(rng, 1) for i in range(40)}
+        document = self.load('test.json', json.dumps(data, indent=4))
+        search = DocumentSearch(document)
+
+        for query in ("alpha", "gamma d", "al", "alpha"):
+            search.start(query)
+            self.assertEqual(self.wait(search), brute_force(document.data, query))
+
+        document.set(["r0"], "omega alpha")
+        search.start("omega")
+        self.assertEqual(self.wait(search), [["r0"]])
+        search.start("")
+        self.assertEqual(self.wait(search), [])
+
+    def test_searches_json_lines(self):
+        document = self.load('test.jsonl', '{"name": "alpha"}\n{"name": "beta"}\n[1, "alpha"]\n')
+        search = DocumentSearch(document)
+        search.start("alpha")
+        self.assertEqual(self.wait(search), [["0", "name"], ["2", "1"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from document import JSONDocument
+from utils import AssetManager, Button, DisplayJSONBox, DisplayJSONKeyButtonsDynamically, SurfaceCache, TextInput, button_skins, get_font
+
+
+def setUpModule():
+    pygame.init()
+    pygame.display.set_mode((1280, 720))
+
+
+def tearDownModule():
+    pygame.quit()
+
+
+class SurfaceCacheTest(unittest.TestCase):
+    def test_least_recently_used_surfaces_are_evicted(self):
+        # 10x10 32-bit surfaces take 400 bytes each.
+        cache = SurfaceCache(max_bytes=1200)
+        for key in "abc":
+            cache.put(key, pygame.Surface((10, 10), 0, 32))
+        self.assertIsNotNone(cache.get("a"))
+
+        cache.put("d", pygame.Surface((10, 10), 0, 32))
+        self.assertEqual(list(cache.surfaces), ["c", "a", "d"])
+        self.assertEqual(cache.used_bytes, 1200)
+
+    def test_oversized_and_replaced_surfaces(self):
+        cache = SurfaceCache(max_bytes=1000)
+        surface = pygame.Surface((20, 20), 0, 32)
+        self.assertIs(cache.put("big", surface), surface)
+        self.assertNotIn("big", cache)
+
+        cache.put("a", pygame.Surface((10, 10), 0, 32))
+        cache.put("a", pygame.Surface((5, 10), 0, 32))
+        self.assertEqual((len(cache), cache.used_bytes), (1, 200))
+        cache.invalidate("a")
+        self.assertEqual((len(cache), cache.used_bytes), (0, 0))
+
+
+class AssetManagerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for name, colour, size in (("red.bmp", (200, 0, 0), (40, 20)), ("big.bmp", (0, 0, 200), (100, 10))):
+            image = pygame.Surface(size)
+            image.fill(colour)
+            pygame.image.save(image, os.path.join(directory.name, name))
+        self.assets = AssetManager(directory.name, page_size=(64, 64))
+
+    def test_variants_are_made_once(self):
+        image = self.assets.get("red.bmp")
+        self.assertIs(self.assets.get("red.bmp"), image)
+        self.assertEqual(self.assets.get("red.bmp", dark=True).get_at((0, 0))[:3], (100, 0, 0))
+        self.assertEqual(self.assets.get("red.bmp", (10, 10)).get_size(), (10, 10))
+        self.assertEqual(list(self.assets.sources), ["red.bmp"])
+
+    def test_opaque_images_are_packed_in_shelves(self):
+        images = [self.assets.get("red.bmp", (40, 20 + i)) for i in range(4)]
+        self.assertEqual([image.get_offset() for image in images], [(0, 0), (0, 20), (0, 41), (0, 0)])
+        self.assertEqual([image.get_parent() for image in images], [self.assets.pages[0]] * 3 + [self.assets.pages[1]])
+        self.assertEqual(images[2].get_at((39, 21))[:3], (200, 0, 0))
+
+        # Too wide for a page, so kept on its own.
+        self.assertIsNone(self.assets.get("big.bmp").get_parent())
+
+
+class ButtonSkinTest(unittest.TestCase):
+    def setUp(self):
+        self.font = pygame.font.Font(None, 24)
+
+    def button(self, text: str, x: int = 0):
+        return Button(x=x, y=0, width=100, height=40, font=self.font, screen=pygame.display.get_surface(), text=text)
+
+    def test_buttons_that_look_alike_share_a_skin(self):
+        button_skins.clear()
+        first, second = self.button("a"), self.button("a", x=200)
+        self.assertIs(first.get_skin(False), second.get_skin(False))
+        self.assertIsNot(first.get_skin(False), first.get_skin(True))
+        self.assertEqual(len(button_skins), 2)
+
+        second.set_text("b")
+        self.assertIsNot(second.get_skin(False), first.get_skin(False))
+        with mock.patch.object(Button, "render_skin") as render_skin:
+            first.draw()
+            second.draw()
+        render_skin.assert_not_called()
+
+
+class TextInputTest(unittest.TestCase):
+    def setUp(self):
+        self.text_input = TextInput(x=350, y=125, width=150, height=50, font=pygame.font.Font(None, 24), max_length=50, screen=pygame.display.get_surface())
+
+    def move(self, position: tuple):
+        with mock.patch("pygame.mouse.get_pos", return_value=position):
+            self.text_input.handle_event(pygame.event.Event(pygame.MOUSEMOTION, pos=position, rel=(0, 0), buttons=(0, 0, 0)))
+
+    def test_font_size_matches_a_linear_search(self):
+        width = self.text_input.surface.get_width() * 0.9
+        for text in ("", "a", "hello", "a much longer piece of text than fits"):
+            with self.subTest(text=text):
+                expected = next((size for size in range(1, 50) if get_font(size).size(text)[0] >= width), 50)
+                self.assertEqual(self.text_input.fit_font_size(text), expected)
+
+    def test_labels_are_rendered_once(self):
+        self.text_input.add_text("abc")
+        label = self.text_input.get_text()
+        self.text_input.add_text("abcd")
+        self.text_input.add_text("abc")
+        self.assertIs(self.text_input.get_text(), label)
+
+    def test_only_hover_changes_make_it_dirty(self):
+        self.text_input.dirty = False
+        self.move((0, 0))
+        self.assertFalse(self.text_input.dirty)
+
+        self.move((400, 150))
+        self.assertTrue(self.text_input.dirty)
+        self.text_input.dirty = False
+        self.move((410, 150))
+        self.assertFalse(self.text_input.dirty)
+
+        self.move((0, 0))
+        self.assertTrue(self.text_input.dirty)
+
+
+class KeyGridTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.load({"a": 1, "b": [1, 2]})
+
+    def load(self, data):
+        self.filename = os.path.join(self.directory.name, 'test.json')
+        with open(self.filename, 'w') as file:
+            json.dump(data, file, indent=4)
+
+        screen = pygame.display.get_surface()
+        font = pygame.font.Font(None, 24)
+        self.text_input = TextInput(x=350, y=125, width=150, height=50, font=font, max_length=50, screen=screen)
+        self.text_box = DisplayJSONBox(x=780, y=0, width=500, height=720, font=font, screen=screen)
+        self.text_box.set_text(self.filename)
+        self.addCleanup(self.text_box.close)
+        self.document = JSONDocument(self.filename, self.text_box.loader, save_delay=3600)
+        self.document.observers.append(self.text_box.apply_edit)
+        self.grid = DisplayJSONKeyButtonsDynamically(
+            x=15, y=400, width=750, height=300, font=font, screen=screen,
+            button_width=145, button_height=50, button_spacing=5,
+            input_box=self.text_input, display_json_box=self.text_box, document=self.document
+        )
+        self.text_box.path_callback = self.grid.open_path
+        while not self.document.loaded:
+            time.sleep(0.001)
+        self.grid.set_keys(force_reload=True)
+
+    def press(self, key: int, mod: int = pygame.KMOD_CTRL):
+        self.grid.handle_event(pygame.event.Event(pygame.KEYDOWN, key=key, mod=mod, unicode=''))
+
+    def test_scrolling_rebinds_a_fixed_pool_of_buttons(self):
+        self.load({f"k{i}": i for i in range(1000)})
+        pool = list(self.grid.button_pool)
+        self.assertEqual(len(pool), self.grid.visible_rows * self.grid.columns)
+        self.assertEqual(self.grid.bound_count, len(pool))
+        self.assertEqual(pool[0].text, "k0")
+
+        self.grid.scroll_offset_y = 10 * self.grid.button_height
+        self.grid.load_visible_buttons()
+        self.assertEqual(self.grid.button_pool, pool)
+        self.assertEqual(pool[0].text, "k50")
+
+    def test_buttons_are_hit_by_row_and_column(self):
+        self.load({f"k{i}": i for i in range(12)})
+        pool = self.grid.button_pool
+        # Slots are 145x50 with 5 pixels between them, from (15, 400).
+        self.assertIs(self.grid.get_button_at((16, 401)), pool[0])
+        self.assertIs(self.grid.get_button_at((15 + 150 + 144, 400 + 55 + 49)), pool[6])
+        self.assertIsNone(self.grid.get_button_at((15 + 147, 401)))
+        self.assertIsNone(self.grid.get_button_at((15 + 4 * 150, 400 + 2 * 55)))
+        self.assertIsNone(self.grid.get_button_at((10, 401)))
+
+    def test_arrays_are_browsed_through_a_range(self):
+        self.load({"b": [[i] for i in range(100000)]})
+        self.grid.open_path(["b"])
+        self.assertEqual(self.grid.keys, range(100000))
+
+        self.grid.scroll_offset_y = 1000 * self.grid.button_height
+        self.grid.load_visible_buttons()
+        self.assertEqual(self.grid.button_pool[0].text, "5000")
+
+        # Going back into the array from an item keeps the same range.
+        keys = self.grid.keys
+        self.grid.button_pool[0].callback()
+        self.assertEqual(self.text_input.path, ["b", "5000"])
+        self.grid.go_back()
+        self.assertIs(self.grid.keys, keys)
+
+    def test_paths_jump_between_the_grid_and_the_text_pane(self):
+        data = {f"k{i}": {"x": i} for i in range(200)}
+        self.load(data)
+        lines = json.dumps(data, indent=4).split("\n")
+        while self.text_box.structure is None:
+            self.text_box.update_loading()
+            time.sleep(0.001)
+
+        self.grid.open_path(["k150", "x"])
+        line = lines.index('        "x": 150')
+        self.assertEqual(self.text_box.highlight_lines, (line, line))
+        self.assertEqual(self.text_box.visible_range()[0], line)
+
+        # Clicking a key's line in the pane opens it in the grid.
+        self.text_box.load_visible_text()
+        row = self.text_box.row_lines.index(lines.index('    "k151": {'))
+        self.text_box.select_line_at(10 + row * self.text_box.font.get_height())
+        self.assertEqual(self.text_input.path, ["k151"])
+        self.assertEqual(list(self.grid.keys), ["x"])
+
+    def test_undo_is_left_to_a_box_being_typed_in(self):
+        search_input = TextInput(x=515, y=10, width=250, height=30, font=pygame.font.Font(None, 22), max_length=100, screen=pygame.display.get_surface())
+        self.grid.text_inputs.append(search_input)
+        self.document.set(["a"], 2)
+
+        for box in (self.text_input, search_input):
+            box.activated = True
+            self.press(pygame.K_z)
+            self.assertEqual(self.document.data["a"], 2)
+            box.activated = False
+
+        self.press(pygame.K_z)
+        self.assertEqual(self.document.data["a"], 1)
+        self.press(pygame.K_y)
+        self.assertEqual(self.document.data["a"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
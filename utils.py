@@ -1,27 +1,254 @@
 import pygame
-import json
 import string
-import random
-import ast
 import os
+import threading
+import codecs
 
-from typing import Optional, Tuple, Callable
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Optional, Tuple, Callable, Hashable
 
+from document import JSONDocument, convert_str
+from file_index import FileLoader, LineBuffer, LineIndex, PrettyLines, RecordList, RecordStructure, StructureIndex
+from folding import FoldMap
+from key_filter import KeyFilter
+from query import QueryError, compile_query, split_assignment
+from search import DocumentSearch
+
+
+class SurfaceCache:
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def __contains__(self, key: Hashable):
+        return key in self.surfaces
+
+    def get(self, key: Hashable):
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def put(self, key: Hashable, surface: pygame.Surface):
+        if key in self.surfaces:
+            self.invalidate(key)
+
+        size = surface.get_pitch() * surface.get_height()
+        if size > self.max_bytes:
+            return surface
+
+        self.surfaces[key] = surface
+        self.used_bytes += size
+
+        while self.used_bytes > self.max_bytes:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.used_bytes -= evicted.get_pitch() * evicted.get_height()
+
+        return surface
+
+    def invalidate(self, key: Hashable):
+        surface = self.surfaces.pop(key, None)
+        if surface is not None:
+            self.used_bytes -= surface.get_pitch() * surface.get_height()
+
+    def clear(self):
+        self.surfaces.clear()
+        self.used_bytes = 0
 
-def convert_str(s):
-    try:
-        return int(s)
-    except ValueError:
-        try:
-            return float(s)
-        except ValueError:
-            try:
-                return ast.literal_eval(s)
-            except (ValueError, SyntaxError):
-                return s
+
+class ColumnMap:
+    def __init__(self, source, line: int, text: Optional[str], measure: Callable, block: int = 128):
+        self.source = source
+        self.line = line
+        self.text = text
+        self.measure = measure
+        self.block = block
+
+        # Where every block of characters starts, as an offset into the line
+        # (in bytes for a line still in the file, in characters otherwise) and
+        # in pixels. Built as far as has been scrolled to, a little per frame.
+        if text is None:
+            self.position, self.end = source.line_bounds(line)
+            self.decoder = codecs.getincrementaldecoder('utf-8')('surrogateescape')
+        else:
+            self.position, self.end = 0, len(text)
+        self.offsets = array('Q', [self.position])
+        self.xs = array('Q', [0])
+        self.complete = self.position >= self.end
+
+        self.pending = ''
+        self.pending_index = 0
+
+    @property
+    def width(self):
+        return self.xs[-1]
+
+    def extend(self, x: int, budget: int):
+        # Measures blocks until one reaches x, or budget characters have been
+        # measured. Returns how many were.
+        measured = 0
+        while not self.complete and self.xs[-1] < x and measured < budget:
+            if self.text is not None:
+                block = self.text[self.position:self.position + self.block]
+                self.position += len(block)
+                size = len(block)
+            else:
+                block = self.next_block()
+                if block is None:
+                    continue
+                if not block:
+                    self.complete = True
+                    break
+                if block.isascii():
+                    size = len(block)
+                else:
+                    # Bytes that are not UTF-8 were escaped to count them, and
+                    # are shown as replacement characters.
+                    raw = block.encode('utf-8', 'surrogateescape')
+                    size = len(raw)
+                    block = raw.decode('utf-8', errors='replace')
+
+            self.offsets.append(self.offsets[-1] + size)
+            self.xs.append(self.xs[-1] + self.measure(block))
+            measured += len(block)
+            if self.offsets[-1] >= self.end:
+                self.complete = True
+        return measured
+
+    def next_block(self):
+        if len(self.pending) - self.pending_index < self.block and self.position < self.end:
+            size = min(64 * 1024, self.end - self.position)
+            chunk = self.source.read_chunk(self.position, size)
+            self.position += size
+            self.pending = self.pending[self.pending_index:] + self.decoder.decode(chunk, final=self.position >= self.end)
+            self.pending_index = 0
+            return None
+
+        block = self.pending[self.pending_index:self.pending_index + self.block]
+        self.pending_index += len(block)
+        return block
+
+    def window(self, left: int, right: int):
+        # The text of the blocks that cover left to right, and where it starts.
+        # Blocks are a few hundred pixels wide, which is the margin that lets
+        # small scrolls reuse the same rendered window.
+        first = bisect_right(self.xs, left) - 1
+        last = min(bisect_left(self.xs, right), len(self.xs) - 1)
+        if last <= first:
+            return '', self.xs[-1]
+
+        start, end = self.offsets[first], self.offsets[last]
+        if self.text is not None:
+            text = self.text[start:end]
+        else:
+            text = self.source.read_chunk(start, end - start).decode('utf-8', errors='replace')
+        return text, self.xs[first]
+
+
+class AssetManager:
+    def __init__(self, directory: str = "assets", page_size: Tuple[int, int] = (1024, 1024)):
+        self.directory = directory
+        self.page_size = page_size
+
+        # Decoded files by name, and every variant handed out so far by
+        # (name, size, dark). Opaque variants live on shared atlas pages.
+        self.sources = {}
+        self.images = {}
+
+        self.pages = []
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+    def load(self, name: str):
+        source = self.sources.get(name)
+        if source is None:
+            source = pygame.image.load(os.path.join(self.directory, name))
+            source = self.sources[name] = self.convert(source)
+        return source
+
+    def convert(self, surface: pygame.Surface):
+        # Saves a conversion on every blit, once a display mode is set.
+        if pygame.display.get_surface() is None:
+            return surface
+        if surface.get_flags() & pygame.SRCALPHA:
+            return surface.convert_alpha()
+        return surface.convert()
+
+    def get(self, name: str, size: Optional[Tuple[int, int]] = None, dark: bool = False):
+        key = (name, size, dark)
+        image = self.images.get(key)
+        if image is not None:
+            return image
+
+        image = self.load(name)
+        if size is not None and image.get_size() != size:
+            image = pygame.transform.scale(image, size)
+        if dark:
+            image = image.copy()
+            image.fill((128, 128, 128), special_flags=pygame.BLEND_RGBA_MULT)
+
+        image = self.images[key] = self.pack(image)
+        return image
+
+    def pack(self, image: pygame.Surface):
+        width, height = image.get_size()
+        page_width, page_height = self.page_size
+        if image.get_flags() & pygame.SRCALPHA or width > page_width or height > page_height:
+            return image
+
+        # Shelf packing: fill a row left to right, then start a new row below
+        # the tallest image in it, and a new page once a page is full.
+        if self.shelf_x + width > page_width:
+            self.shelf_x = 0
+            self.shelf_y += self.shelf_height
+            self.shelf_height = 0
+        if not self.pages or self.shelf_y + height > page_height:
+            self.pages.append(self.convert(pygame.Surface(self.page_size)))
+            self.shelf_x = self.shelf_y = self.shelf_height = 0
+
+        page = self.pages[-1]
+        page.blit(image, (self.shelf_x, self.shelf_y))
+        packed = page.subsurface((self.shelf_x, self.shelf_y, width, height))
+
+        self.shelf_x += width
+        self.shelf_height = max(self.shelf_height, height)
+        return packed
+
+
+# Every sprite and its variants, loaded once and shared by all widgets.
+assets = AssetManager()
+
+# Composited button surfaces shared by every Button, one blit per draw.
+button_skins = SurfaceCache(16 * 1024 * 1024)
+
+# Rendered TextInput labels by (text, size, colour).
+text_surfaces = SurfaceCache(4 * 1024 * 1024)
+
+# Default fonts by point size; creating one reads the font file.
+fonts = {}
+
+
+def get_font(size: int):
+    font = fonts.get(size)
+    if font is None:
+        font = fonts[size] = pygame.font.Font(None, size)
+    return font
 
 
 class Button:
+    __slots__ = (
+        'x', 'y', 'width', 'height', 'text', 'font', 'font_colour', 'bg_colour', 'hover_colour',
+        'border_colour', 'border_width', 'border_radius', 'screen', 'screen_x', 'screen_y', 'callback',
+        'sprite', 'dark_sprite', 'surface', 'rect', 'text_rect', 'is_dragging'
+    )
+
     def __init__(self, 
                  x: int, 
                  y: int, 
@@ -76,6 +303,20 @@ class Button:
         self.is_dragging = False
 
     def draw(self):
+        hovered = self.rect.collidepoint(pygame.mouse.get_pos())
+        self.screen.blit(self.get_skin(hovered), (self.x, self.y))
+
+    def get_skin(self, hovered: bool):
+        key = (
+            self.sprite, self.dark_sprite, self.width, self.height, self.border_radius, self.border_width,
+            self.border_colour, self.bg_colour, self.hover_colour, self.text, self.font, self.font_colour, hovered
+        )
+        skin = button_skins.get(key)
+        if skin is None:
+            skin = button_skins.put(key, self.render_skin(hovered))
+        return skin
+
+    def render_skin(self, hovered: bool):
         button_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
         button_surface.fill((0, 0, 0, 0))
 
@@ -83,40 +324,44 @@ class Button:
         pygame.draw.rect(mask_surface, (255, 255, 255), (0, 0, self.width, self.height), border_radius=self.border_radius)
 
         if self.sprite:
-            if self.rect.collidepoint(pygame.mouse.get_pos()):
+            if hovered:
                 if self.dark_sprite:
-                    temp_surface = pygame.transform.scale(self.dark_sprite, (self.width, self.height))
+                    temp_surface = self.fit_sprite(self.dark_sprite)
                 else:
                     temp_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
                     pygame.draw.rect(temp_surface, self.hover_colour, (0, 0, self.width, self.height), border_radius=self.border_radius)
             else:
-                temp_surface = pygame.transform.scale(self.sprite, (self.width, self.height))
+                temp_surface = self.fit_sprite(self.sprite)
 
             button_surface.blit(temp_surface, (0, 0))
             button_surface.blit(mask_surface, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
 
         else:
-            if self.rect.collidepoint(pygame.mouse.get_pos()):
+            if hovered:
                 pygame.draw.rect(button_surface, self.hover_colour, (0, 0, self.width, self.height), border_radius=self.border_radius)
             else:
                 pygame.draw.rect(button_surface, self.bg_colour, (0, 0, self.width, self.height), border_radius=self.border_radius)
 
         pygame.draw.rect(button_surface, self.border_colour, (0, 0, self.width, self.height), self.border_width, self.border_radius)
-        button_surface.blit(self.text_surface, self.text_rect)
-        self.screen.blit(button_surface, (self.x, self.y))
+        button_surface.blit(self.font.render(self.text, True, self.font_colour), self.text_rect)
+        return assets.convert(button_surface)
+
+    def fit_sprite(self, sprite: pygame.Surface):
+        if sprite.get_size() == (self.width, self.height):
+            return sprite
+        return pygame.transform.scale(sprite, (self.width, self.height))
 
     def set_text(self, text: str):
         self.text = text
 
-        self.text_surface = self.font.render(self.text, True, self.font_colour)
-        text_width = self.text_surface.get_width()
+        text_width, text_height = self.font.size(self.text)
 
         while text_width > self.width - 10:
             self.text = self.text[:-4] + '...'
-            self.text_surface = self.font.render(self.text, True, self.font_colour)
-            text_width = self.text_surface.get_width()
+            text_width, text_height = self.font.size(self.text)
 
-        self.text_rect = self.text_surface.get_rect(center=(self.width/2, self.height/2))
+        self.text_rect = pygame.Rect(0, 0, text_width, text_height)
+        self.text_rect.center = (self.width/2, self.height/2)
 
     def move_on_hold(self):
         self.surface.fill(self.hover_colour)
@@ -132,15 +377,18 @@ class Button:
         if not pygame.mouse.get_pressed()[0]:
             self.is_dragging = False
 
+    def place(self, x: int, y: int, screen_x: int, screen_y: int):
+        self.x = x
+        self.y = y
+        self.screen_x = screen_x
+        self.screen_y = screen_y
+        self.rect.topleft = (screen_x, screen_y)
+
     def is_clicked(self):
         if self.rect.collidepoint(pygame.mouse.get_pos()):
             return True
         return False
 
-    def callback(self):
-        if self.callback:
-            self.callback()
-
 class TextInput:
     def __init__(self,
                  x: int,
@@ -178,6 +426,10 @@ class TextInput:
         self.text_rect = self.text_surface.get_rect(center=(self.surface.get_width()/2, self.surface.get_height()/2))
 
         self.activated = False
+        self.hovered = False
+
+        self.dirty = True
+        self.dirty_rect = self.rect
 
     def draw(self):
         self.surface.fill(self.bg_colour)
@@ -191,6 +443,15 @@ class TextInput:
         self.surface.blit(self.text_surface, self.text_rect)
         self.screen.blit(self.surface, (self.x, self.y))
 
+    def handle_event(self, event):
+        if event.type == pygame.MOUSEMOTION:
+            hovered = self.rect.collidepoint(pygame.mouse.get_pos())
+            if hovered != self.hovered:
+                self.hovered = hovered
+                self.dirty = True
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            self.dirty = True
+
     def is_clicked(self):
         if self.rect.collidepoint(pygame.mouse.get_pos()):
             self.activated = True
@@ -199,36 +460,31 @@ class TextInput:
     
     def add_text(self, text: str):
         if len(text) < self.max_length:
-            current_font_size = self.font.size(' ')[1]
-
-            self.text_surface = self.font.render(text, True, self.font_colour)
-            self.text_rect = self.text_surface.get_rect(center=(self.surface.get_width()/2, self.surface.get_height()/2))
-
-            while self.text_surface.get_width() > self.surface.get_width():
-                current_font_size -= 1
-                self.font = pygame.font.Font(None, current_font_size)
-                self.text_surface = self.font.render(text, True, self.font_colour)
-                self.text_rect = self.text_surface.get_rect(center=(self.surface.get_width()/2, self.surface.get_height()/2))
+            self.dirty = True
 
-            while self.text_surface.get_width() < self.surface.get_width() * 0.9 and current_font_size < self.height:
-                current_font_size += 1
-                self.font = pygame.font.Font(None, current_font_size)
-                self.text_surface = self.font.render(text, True, self.font_colour)
-                self.text_rect = self.text_surface.get_rect(center=(self.surface.get_width()/2, self.surface.get_height()/2))
+            font_size = self.fit_font_size(text)
+            self.font = get_font(font_size)
 
-    def add_json(self, filename: str, value):
-        value = convert_str(value)
-        with open(filename, 'r') as file:
-            data = json.load(file)
+            key = (text, font_size, self.font_colour)
+            self.text_surface = text_surfaces.get(key)
+            if self.text_surface is None:
+                self.text_surface = text_surfaces.put(key, self.font.render(text, True, self.font_colour))
+            self.text_rect = self.text_surface.get_rect(center=(self.surface.get_width()/2, self.surface.get_height()/2))
 
-        if self.path:
-            temp = data
-            for key in self.path[:-1]:
-                temp = temp[key]
-            temp[self.path[-1]] = value
+    def fit_font_size(self, text: str):
+        # The smallest size, up to the box height, at which the text fills 90%
+        # of the box's width. Widths are only measured, never rendered.
+        low, high = 1, max(self.height, 1)
+        while low < high:
+            middle = (low + high) // 2
+            if get_font(middle).size(text)[0] >= self.surface.get_width() * 0.9:
+                high = middle
+            else:
+                low = middle + 1
+        return low
 
-        with open(filename, 'w') as file:
-            json.dump(data, file, indent=4)
+    def add_json(self, document: JSONDocument, value):
+        document.set(self.path, convert_str(value))
 
     def get_text(self):
         return self.text_surface
@@ -246,7 +502,11 @@ class DisplayJSONBox:
                  font_colour: Tuple[int, int, int] = (0, 0, 0),
                  bg_colour: Tuple[int, int, int] = (255, 255, 255),
                  border_colour: Tuple[int, int, int] = (0, 0, 0),
-                 border_width: int = 2
+                 border_width: int = 2,
+                 line_cache_bytes: int = 8 * 1024 * 1024,
+                 highlight_colour: Tuple[int, int, int] = (125, 125, 150),
+                 path_callback: Callable = None,
+                 pretty_key: int = pygame.K_F2
                  ):
         
         self.x = x
@@ -260,6 +520,9 @@ class DisplayJSONBox:
         self.border_colour = border_colour
         self.border_width = border_width
         self.screen = screen
+        self.highlight_colour = highlight_colour
+        self.path_callback = path_callback
+        self.pretty_key = pretty_key
 
         self.surface = pygame.Surface((self.width, self.height))
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
@@ -279,6 +542,20 @@ class DisplayJSONBox:
         
         self.text_width = 0
         self.text_height = 0
+
+        # The horizontal extent starts from the longest line the index has
+        # found and widens as wider lines are rendered. widest_line is the line
+        # it was taken from, if known; a background rescan of the buffer runs
+        # when an edit replaces that line, as [edit count, result].
+        self.widest_line = None
+        self.measured_longest = None
+        self.width_scan = None
+        self.edit_count = 0
+        self.measure_limit = 4096
+
+        # Identifies the font in the file's index sidecar, which remembers the
+        # text width measured with it.
+        self.font_key = f"{self.font.get_height()}:{self.font.size(string.ascii_letters + string.digits + string.punctuation)[0]}"
         
         self.scroll_bar_x = 0
         self.scroll_bar_y = 0
@@ -292,8 +569,52 @@ class DisplayJSONBox:
         self.scroll_speed = 10
 
         self.text_surfaces = []
-
-        self.dict: dict = {}
+        self.text_offsets = []
+
+        # The line shown on each visible row, and whether it opens an object
+        # or array that is folded (True), open (False) or neither (None).
+        self.row_lines = []
+        self.row_folds = []
+
+        # Lines longer than window_limit characters are never rendered whole:
+        # only the columns on screen are, positioned by a map of where each
+        # block of the line starts. Maps are built column_budget characters a
+        # frame, as far as the line has been scrolled.
+        self.window_limit = 1024
+        self.column_budget = 256 * 1024
+        self.column_maps = OrderedDict()
+        self.max_column_maps = 64
+        self.columns_pending = False
+
+        # The file laid out as if pretty-printed, for minified files, when
+        # toggled with pretty_key. The file itself is left as it is.
+        self.pretty = None
+
+        # Objects and arrays spanning several lines fold by clicking the
+        # margin next to them, or all those nested N deep with Ctrl+N, once
+        # their brackets have been matched in the background. Edits made
+        # before then wait in fold_edits, which is None once the folds have
+        # lost track of the lines.
+        self.folds = None
+        self.fold_edits = []
+
+        self.highlight_path = None
+        self.highlight_lines = None
+        self.highlight_offsets = None
+
+        # Keyed by content, so an edit only misses for the lines it changed.
+        self.line_cache = SurfaceCache(line_cache_bytes)
+
+        self.lines = None
+        self.loader = None
+        self.structure = None
+        self.stale = False
+        self.members_seen = 0
+        self.caption = None
+        self.save_error = None
+
+        self.dirty = True
+        self.dirty_rect = self.rect
 
 
     def draw(self):
@@ -315,39 +636,491 @@ class DisplayJSONBox:
             self.scroll_offset_x = 0
             self.scroll_bar_x = 0
 
-        for i, text_surface in enumerate(self.text_surfaces):
+        if self.highlight_lines:
+            first_line, last_line = self.highlight_lines
+            first_row = bisect_left(self.row_lines, first_line)
+            last_row = bisect_right(self.row_lines, last_line) - 1
+            if first_row <= last_row:
+                y = first_row * self.font.get_height() + 10
+                pygame.draw.rect(self.surface, self.highlight_colour, (0, y, self.width - self.scroll_bar_width, (last_row - first_row + 1) * self.font.get_height()))
+
+        for i, (text_surface, x) in enumerate(zip(self.text_surfaces, self.text_offsets)):
             y = i * self.font.get_height() + 10
-            self.surface.blit(text_surface, (10 - self.scroll_offset_x, y))
+            self.surface.blit(text_surface, (10 + x - self.scroll_offset_x, y))
+
+        if any(folded is not None for folded in self.row_folds):
+            self.draw_fold_markers()
 
         self.screen.blit(self.surface, (self.x, self.y))
 
+    def draw_fold_markers(self):
+        # Text scrolled left is kept out of the margin the markers are in.
+        height = self.font.get_height()
+        pygame.draw.rect(self.surface, self.bg_colour, (0, 10, 9, len(self.row_folds) * height))
+        for i, folded in enumerate(self.row_folds):
+            if folded is None:
+                continue
+            y = i * height + 10 + height // 2
+            if folded:
+                points = ((2, y - 4), (7, y), (2, y + 4))
+            else:
+                points = ((1, y - 2), (8, y - 2), (4, y + 3))
+            pygame.draw.polygon(self.surface, self.font_colour, points)
+
+    @property
+    def folding(self):
+        return self.folds is not None and self.folds.complete and self.pretty is None
+
+    @property
+    def view(self):
+        return self.pretty if self.pretty is not None else self.lines
+
+    @property
+    def loading(self):
+        return self.loader.loading or self.columns_pending or (self.pretty is not None and not self.pretty.complete)
+
+    def show_path(self, path):
+        self.highlight_path = list(path) if path else None
+        self.update_highlight()
+        if self.highlight_lines:
+            if self.folding:
+                self.folds.reveal(self.highlight_lines[0])
+                self.update_text_height()
+            self.scroll_to_line(self.highlight_lines[0])
+        self.dirty = True
+
+    def update_highlight(self):
+        if self.pretty is not None:
+            self.update_pretty_highlight()
+            return
+
+        self.highlight_lines = None
+        if self.highlight_path and self.structure is not None:
+            try:
+                self.highlight_lines = self.structure.get_lines(self.highlight_path)
+            except (KeyError, IndexError, ValueError):
+                pass
+
+    def update_pretty_highlight(self):
+        self.highlight_lines = None
+        if not self.highlight_path or not isinstance(self.structure, StructureIndex) or self.stale:
+            return
+
+        # Finding a member in the file takes decoding the start of its line,
+        # so its offsets are kept until the path changes.
+        if self.highlight_offsets is None or self.highlight_offsets[0] != self.highlight_path:
+            try:
+                spans, ordinal = self.structure.locate(self.highlight_path)
+                start, _, end = self.structure.get_span(spans, ordinal)
+            except (KeyError, IndexError, ValueError):
+                return
+            lines = self.loader.lines
+            self.highlight_offsets = (self.highlight_path, lines.offset_of(*start), lines.offset_of(*end) - 1)
+
+        _, start, end = self.highlight_offsets
+        self.highlight_lines = (self.pretty.line_at(start), self.pretty.line_at(end))
+
+    def scroll_to_line(self, line: int):
+        self.scroll_to_row(self.folds.row_of(line) if self.folding else line)
+
+    def centre_on_line(self, line: int):
+        row = self.folds.row_of(line) if self.folding else line
+        self.scroll_to_row(max(row - int(self.height / self.font.get_height()) // 2, 0))
+        self.dirty = True
+
+    def visible_range(self):
+        # The first and last lines on screen, from the scroll position alone
+        # so it is right before the pane has been drawn.
+        height = self.font.get_height()
+        first = max(int(self.scroll_offset_y / height), 0)
+        last = first + int(self.height / height)
+        if self.folding:
+            return self.folds.line_of(first), self.folds.line_of(last)
+        return first, last
+
+    def scroll_to_row(self, row: int):
+        self.scroll_offset_y = min(row * self.font.get_height(), max(self.text_height - self.height, 0))
+        if self.text_height > self.height:
+            self.scroll_bar_y = self.scroll_offset_y * (self.height - self.scroll_bar_height) / (self.text_height - self.height)
+
+    def line_at(self, mouse_y: int):
+        row = (mouse_y - 10) // self.font.get_height()
+        if 0 <= row < len(self.row_lines):
+            return self.row_lines[row]
+        return None
+
+    def toggle_fold_at(self, mouse_y: int):
+        line = self.line_at(mouse_y)
+        if line is not None and self.folds.toggle(line):
+            self.refold()
+
+    def fold_to_depth(self, depth: int):
+        if depth:
+            self.folds.collapse_depth(depth)
+        else:
+            self.folds.expand_all()
+        self.refold()
+
+    def refold(self):
+        # The line at the top of the pane stays there, or the fold it went
+        # into does.
+        top = self.row_lines[0] if self.row_lines else 0
+        self.update_text_height()
+        self.scroll_to_line(top)
+        self.dirty = True
+
+    def select_line_at(self, mouse_y: int):
+        if self.structure is None:
+            return
+
+        line = self.line_at(mouse_y)
+        if line is None:
+            return
+        if self.pretty is not None:
+            # The formatted view maps back to the file by byte offset, and
+            # only while the file still matches the pane.
+            if not 0 <= line < self.pretty.available_lines() or not isinstance(self.structure, StructureIndex) or self.stale:
+                return
+            path = self.structure.path_at(*self.loader.lines.position_of(self.pretty.content_start(line)))
+        elif line < len(self.lines):
+            path = self.structure.path_at(line)
+        else:
+            return
+
+        self.show_path(path)
+        if self.path_callback:
+            self.path_callback(path)
+
     def set_text(self, filename: str, force_reload: bool = False):
         if force_reload or not self.filename or not self.lines:
             self.filename = filename
-            with open(filename, 'r') as file:
-                lines = []
-                for line in file:
-                    lines.append(line.rstrip('\n'))
-                self.lines = lines
-                self.dict = json.loads(''.join(lines))
-        self.total_lines = len(self.lines)
-        self.text_height = self.total_lines * self.font.get_height()
-        self.scroll_bar_height = max(self.height * self.height / max(self.text_height, self.height), 20)
+            reloading = self.loader is not None
+            self.close()
+            self.loader = FileLoader(filename)
+            self.lines = LineBuffer(self.loader.lines)
+            self.loader.start_indexing()
+
+            # The first loader is parsed by the document that shares it. A
+            # reload only needs the member spans back to splice edits again.
+            if reloading:
+                self.loader.start_parsing(build_data=False)
+            self.structure = None
+            self.stale = False
+            self.members_seen = 0
+            self.text_width = 0
+            self.widest_line = None
+            self.measured_longest = None
+            self.width_scan = None
+            self.column_maps.clear()
+            self.folds = None
+            self.fold_edits = []
+
+            # The formatted view is made again from the reloaded file.
+            if self.pretty is not None:
+                self.pretty = PrettyLines(self.loader.lines)
+                self.pretty.start()
+                self.highlight_offsets = None
+        self.dirty = True
+        self.update_text_height()
         self.file_size = os.path.getsize(filename)
-        pygame.display.set_caption(f"JSON Editor ({filename} - {self.file_size / (1024 * 1024):.2f} MB)")
+        self.update_caption()
+
+    def set_pretty(self, enabled: bool):
+        # JSON Lines files are already one record to a line.
+        if self.loader is None or self.loader.json_lines or enabled == (self.pretty is not None):
+            return
+
+        if enabled:
+            self.pretty = PrettyLines(self.loader.lines)
+            self.pretty.start()
+        else:
+            self.pretty.cancel()
+            self.pretty = None
+
+        # Widths are found again for the lines now shown, and the view opens
+        # at whatever was highlighted in the other one.
+        self.column_maps.clear()
+        self.highlight_offsets = None
+        self.text_width = 0
+        self.widest_line = None
+        self.measured_longest = None
+        self.width_scan = None
+        self.scroll_offset_x = 0
+        self.scroll_bar_x = 0
+        self.update_text_height()
+        self.show_path(self.highlight_path)
+        if not self.highlight_lines:
+            self.scroll_to_line(0)
+        self.update_caption()
+
+    def close(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.lines.close()
+        if self.pretty is not None:
+            self.pretty.cancel()
+        if self.folds is not None:
+            self.folds.cancel()
+
+    def update_caption(self):
+        caption = f"JSON Editor ({self.filename} - {self.file_size / (1024 * 1024):.2f} MB)"
+        if self.loader.error:
+            caption += f" - failed to parse: {self.loader.error}"
+        elif self.loader.loading:
+            caption += f" - {self.loader.get_progress()}"
+        if self.pretty is not None:
+            caption += " - formatted" if self.pretty.complete else f" - formatting {self.pretty.scanned / max(self.loader.size, 1):.0%}"
+        if self.save_error:
+            caption += f" - failed to save: {self.save_error}"
+
+        if caption != self.caption:
+            self.caption = caption
+            pygame.display.set_caption(caption)
+
+    def update_loading(self):
+        if self.loader is None:
+            return False
+
+        self.update_caption()
+        if len(self.view) != self.total_lines or self.columns_pending:
+            self.dirty = True
+
+        if self.structure is None and self.loader.spans is not None and self.lines.complete:
+            self.structure = StructureIndex(self.lines, self.loader.spans)
+            self.dirty = True
+
+        # JSON Lines records map one to one onto lines, so there is nothing to
+        # wait for beyond the records themselves.
+        if self.structure is None and isinstance(self.loader.data, RecordList):
+            self.structure = RecordStructure(self.lines, self.loader.data)
+            self.dirty = True
+
+        self.update_folds()
+        self.update_text_width()
+        if self.loader.parsed and self.font_key in self.loader.widths:
+            self.loader.save_index()
+
+        members_loaded = self.loader.members_loaded
+        if members_loaded != self.members_seen:
+            self.members_seen = members_loaded
+            return True
+        return False
+
+    def update_folds(self):
+        # Brackets are matched once the file has been loaded, rather than
+        # alongside the parse. JSON Lines records are one line each, so there
+        # is nothing to fold.
+        if self.fold_edits is None or self.loader.json_lines or self.loader.loading:
+            return
+        if self.folds is None:
+            self.folds = FoldMap(self.loader.lines)
+            self.folds.start()
+        elif self.folds.complete and self.fold_edits:
+            edits, self.fold_edits = self.fold_edits, []
+            for edit in edits:
+                self.apply_fold_edit(*edit)
+            self.update_text_height()
+
+    def apply_fold_edit(self, start: int, count: int, new_lines: list):
+        if self.folds is None or not self.folds.complete:
+            if self.fold_edits is not None:
+                self.fold_edits.append((start, count, new_lines))
+        elif not self.folds.apply_edit(start, count, new_lines):
+            self.folds = None
+            self.fold_edits = None
 
     def load_visible_text(self):
-        start_line = max(int(self.scroll_offset_y / self.font.get_height()), 0)
-        end_line = min(start_line + int(self.height / self.font.get_height()) + 1, self.total_lines)
+        start_row = max(int(self.scroll_offset_y / self.font.get_height()), 0)
+        end_row = start_row + int(self.height / self.font.get_height()) + 1
+
+        # The slice is clamped by the index itself, which may still be
+        # discovering how many lines the file has.
+        self.update_highlight()
+        self.row_folds = []
+        if self.pretty is not None:
+            rows = [(self.pretty, line, text) for line, text in enumerate(self.pretty[start_row:end_row], start_row)]
+            self.row_lines = range(start_row, start_row + len(rows))
+        elif self.folding:
+            self.row_lines = self.folds.visible_lines(start_row, end_row - start_row, len(self.lines))
+            rows = [(source, index, None if isinstance(source, LineIndex) else source[index]) for source, index in map(self.lines.source_of, self.row_lines)]
+            self.row_folds = [None if index is None else self.folds.collapsed[index] == 1 for index in map(self.folds.container_at, self.row_lines)]
+        else:
+            rows = [(source, index, None if isinstance(source, LineIndex) else source[index]) for source, index in self.lines.get_sources(start_row, end_row)]
+            self.row_lines = range(start_row, start_row + len(rows))
+
+        self.text_surfaces = []
+        self.text_offsets = []
+        self.columns_pending = False
+        budget = self.column_budget
+        for row, (source, index, text) in enumerate(rows):
+            line = self.row_lines[row]
+            if text is None:
+                start, end = source.line_bounds(index)
+                if end - start <= self.window_limit:
+                    text = source.get_line(index)
+
+            # A folded container shows on its first line, closed as on its last.
+            if text is not None and self.row_folds and self.row_folds[row]:
+                closing = self.lines[self.folds.closers[self.folds.container_at(line)]].strip()
+                if len(text) + len(closing) < self.window_limit:
+                    text = f"{text} ... {closing}"
+
+            if text is not None and len(text) <= self.window_limit:
+                surface, x = self.render_line(text), 0
+            else:
+                surface, x, budget = self.render_columns(source, index, text, budget, line)
+            self.text_surfaces.append(surface)
+            self.text_offsets.append(x)
+
+            # Rendered lines are measured for free, and can only widen the extent.
+            if x + surface.get_width() + 10 > self.text_width:
+                self.set_text_width(x + surface.get_width() + 10, line)
+
+        # Fetching the visible lines may have indexed more of the file.
+        if len(self.view) != self.total_lines:
+            self.update_text_height()
+
+    def render_columns(self, source, index: int, text: Optional[str], budget: int, line: int):
+        key = (id(source), index)
+        columns = self.column_maps.get(key)
+        if columns is None or columns.source is not source:
+            columns = ColumnMap(source, index, text, lambda block: self.font.size(block)[0])
+            self.column_maps[key] = columns
+            while len(self.column_maps) > self.max_column_maps:
+                self.column_maps.popitem(last=False)
+        else:
+            self.column_maps.move_to_end(key)
+
+        budget -= columns.extend(self.scroll_offset_x + self.width, budget)
+        if not columns.complete and columns.width < self.scroll_offset_x + self.width:
+            self.columns_pending = True
+
+        # Once the whole line has been measured its width is exact, where the
+        # first estimate of it only scaled up a prefix. That can move the
+        # scroll offset, so the window is taken after.
+        if columns.complete and columns.width + 10 != self.text_width and (columns.width + 10 > self.text_width or line == self.widest_line):
+            self.set_text_width(columns.width + 10, line)
+
+        window, x = columns.window(self.scroll_offset_x, self.scroll_offset_x + self.width)
+        return self.render_line(window), x, budget
+
+    def update_text_width(self):
+        # The formatted view is sized from its rendered lines alone.
+        if self.pretty is not None:
+            return
 
-        self.text = self.lines[start_line:end_line]
-        self.text_surfaces = [self.font.render(line, True, self.font_colour) for line in self.text]
+        if self.text_width == 0 and self.font_key in self.loader.widths:
+            self.set_text_width(self.loader.widths[self.font_key], None)
+
+        # Until the first edit the lines are the file's, and the index tracks
+        # the longest of them as it goes. Only that one line gets measured.
+        base = self.loader.lines
+        if self.lines.pieces is None and base.longest and base.longest_line != self.measured_longest:
+            self.measured_longest = base.longest_line
+            width = self.measure_line(self.lines[base.longest_line]) + 10
+            if width >= self.text_width:
+                self.set_text_width(width, base.longest_line)
+            if base.complete and self.font_key not in self.loader.widths:
+                self.loader.remember_width(self.font_key, self.text_width)
+
+        if self.width_scan is not None and self.width_scan[1] is not None:
+            edit_count, (_, line) = self.width_scan
+            self.width_scan = None
+            if edit_count != self.edit_count:
+                self.start_width_scan()
+            else:
+                # The one place the extent shrinks, after the widest line was
+                # edited away.
+                self.set_text_width(self.measure_line(self.lines[line]) + 10 if len(self.lines) else 0, line)
+
+    def start_width_scan(self):
+        scan = [self.edit_count, None]
+        self.width_scan = scan
+
+        def run():
+            scan[1] = self.lines.longest_line()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def set_text_width(self, width: int, line: Optional[int]):
+        self.text_width = width
+        self.widest_line = line
+        if self.text_width > self.width:
+            self.scroll_offset_x = self.scroll_bar_x * (self.text_width - self.width) / (self.width - self.scroll_bar_width)
+        self.dirty = True
+
+    def measure_line(self, line: str):
+        # Very long lines are measured by a prefix and scaled up, which is
+        # close enough for a scroll bar and keeps minified files cheap.
+        if len(line) > self.measure_limit:
+            return self.font.size(line[:self.measure_limit])[0] * len(line) // self.measure_limit
+        return self.font.size(line)[0]
+
+    def apply_edit(self, path, value, deleted: bool = False, position: int = None):
+        # Splice just the re-serialized subtree into the line buffer. If the
+        # edit cannot be mapped to lines, fall back to reloading once saved,
+        # which is also how the formatted view catches up with edits.
+        if self.structure is None or self.stale or self.pretty is not None:
+            self.stale = True
+            return
 
-        if self.text_width == 0:
-            self.text_width = max(self.font.size(line)[0] for line in self.lines) + 10
+        try:
+            if deleted:
+                start, count, new_lines = self.structure.delete(path)
+            elif position is not None:
+                start, count, new_lines = self.structure.insert(path, value, position)
+            else:
+                start, count, new_lines = self.structure.replace(path, value)
+        except (KeyError, IndexError, ValueError):
+            self.stale = True
+            return
+
+        self.apply_fold_edit(start, count, new_lines)
+        self.update_text_height()
+        self.edit_count += 1
+
+        # Keep track of where the widest line went. If the edit replaced it,
+        # the extent can only be known again by looking at every line.
+        widest_replaced = False
+        if self.widest_line is not None:
+            if start <= self.widest_line < start + count:
+                widest_replaced = True
+                self.widest_line = None
+            elif self.widest_line >= start + count:
+                self.widest_line += len(new_lines) - count
+
+        for offset, line in enumerate(new_lines):
+            width = self.measure_line(line) + 10
+            if width > self.text_width or (widest_replaced and width == self.text_width):
+                self.set_text_width(width, start + offset)
+                widest_replaced = False
+        if widest_replaced:
+            self.start_width_scan()
+        self.dirty = True
+
+    def update_text_height(self):
+        self.total_lines = len(self.view)
+        rows = self.folds.visible_count(self.total_lines) if self.folding else self.total_lines
+        self.text_height = rows * self.font.get_height()
+        self.scroll_bar_height = max(self.height * self.height / max(self.text_height, self.height), 20)
+
+    def render_line(self, line: str):
+        key = (line, self.font, self.font_colour)
+        surface = self.line_cache.get(key)
+        if surface is None:
+            surface = self.line_cache.put(key, self.font.render(line, True, self.font_colour))
+        return surface
 
     def handle_event(self, event):
-        if event.type == pygame.MOUSEBUTTONDOWN:
+        if event.type == pygame.KEYDOWN and event.key == self.pretty_key:
+            self.set_pretty(self.pretty is None)
+            self.dirty = True
+
+        elif event.type == pygame.KEYDOWN and pygame.K_0 <= event.key <= pygame.K_9 and event.mod & pygame.KMOD_CTRL:
+            if self.folding:
+                self.fold_to_depth(event.key - pygame.K_0)
+
+        elif event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1:
                 mouse_x, mouse_y = pygame.mouse.get_pos()
                 mouse_x -= self.x
@@ -355,9 +1128,13 @@ class DisplayJSONBox:
                 if self.width - self.scroll_bar_width <= mouse_x <= self.width and 0 <= mouse_y <= self.height:
                     self.vertical_scroll_bar_dragging = True
                     self.scroll_bar_drag_start_y = mouse_y - self.scroll_bar_y
-                elif 0 <= mouse_x <= self.width and self.height - self.scroll_bar_height <= mouse_y <= self.height:
+                elif 0 <= mouse_x <= self.width and self.height - self.scroll_bar_width <= mouse_y <= self.height:
                     self.horizontal_scroll_bar_dragging = True
                     self.scroll_bar_drag_start_x = mouse_x - self.scroll_bar_x
+                elif 0 <= mouse_x < 10 and 0 <= mouse_y <= self.height and self.folding:
+                    self.toggle_fold_at(mouse_y)
+                elif 0 <= mouse_x <= self.width and 0 <= mouse_y <= self.height:
+                    self.select_line_at(mouse_y)
             mouse_x, mouse_y = pygame.mouse.get_pos()
             mouse_x -= self.x
             mouse_y -= self.y
@@ -375,7 +1152,7 @@ class DisplayJSONBox:
                     else:
                         if self.vertical_scroll_bar_enabled:
                             self.scroll_down()
-            self.draw()
+            self.dirty = True
 
         elif event.type == pygame.MOUSEBUTTONUP:
             if event.button == 1:
@@ -387,12 +1164,13 @@ class DisplayJSONBox:
                 mouse_y -= self.y
                 self.scroll_bar_y = min(max(mouse_y - self.scroll_bar_drag_start_y, 0), self.height - self.scroll_bar_height)
                 self.scroll_offset_y = self.scroll_bar_y * (self.text_height - self.height) / (self.height - self.scroll_bar_height)
+                self.dirty = True
             elif self.horizontal_scroll_bar_dragging and self.horizontal_scroll_bar_enabled:
                 mouse_x, _ = pygame.mouse.get_pos()
                 mouse_x -= self.x
                 self.scroll_bar_x = min(max(mouse_x - self.scroll_bar_drag_start_x, 0), self.width - self.scroll_bar_width)
                 self.scroll_offset_x = self.scroll_bar_x * (self.text_width - self.width) / (self.width - self.scroll_bar_width)
-            self.draw()
+                self.dirty = True
 
     def scroll_left(self):
         self.scroll_bar_x = max(self.scroll_bar_x - self.scroll_speed, 0)
@@ -422,7 +1200,8 @@ class DisplayJSONKeyButtonsDynamically:
                  button_height: int,
                  button_spacing: int,
                  input_box: TextInput,
-                 display_json_box: DisplayJSONBox
+                 display_json_box: DisplayJSONBox,
+                 document: JSONDocument
                  ):
         
         self.x = x
@@ -435,6 +1214,7 @@ class DisplayJSONKeyButtonsDynamically:
         self.button_height = button_height
         self.input_box = input_box
         self.display_json_box = display_json_box
+        self.document = document
 
         self.surface = pygame.Surface((self.width, self.height))
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
@@ -456,18 +1236,18 @@ class DisplayJSONKeyButtonsDynamically:
         self.button_spacing = button_spacing
 
         self.total_button_height = 0
-        self.current_dict = display_json_box.dict
-        self.json_data = self.current_dict = display_json_box.dict
-        self.keys = list(self.current_dict.keys())
+        self.json_data = self.current_dict = document.data if document.data is not None else {}
+        self.keys = self.get_keys(self.current_dict)
         self.current_key = None
 
         self.at_root = True
 
+        # Frames of (container, keys, key, document version). keys is only
+        # rebuilt on the way back if the document changed in between.
         self.navigation_stack = []
 
-        self.back_button_sprite = pygame.image.load("assets/back_button.jpg")
-        self.back_button_dark_sprite = self.back_button_sprite.copy()
-        self.back_button_dark_sprite.fill((128, 128, 128), special_flags=pygame.BLEND_RGBA_MULT)
+        self.back_button_sprite = assets.get("back_button.jpg", (100, 30))
+        self.back_button_dark_sprite = assets.get("back_button.jpg", (100, 30), dark=True)
 
         self.back_button = Button(
                                 x=660,
@@ -484,14 +1264,93 @@ class DisplayJSONKeyButtonsDynamically:
                                 dark_sprite=self.back_button_dark_sprite,
                                 )
         
-        self.sprite = pygame.image.load("assets/normal_button.jpg")
-        self.dark_sprite = self.sprite.copy()
-        self.dark_sprite.fill((128, 128, 128), special_flags=pygame.BLEND_RGBA_MULT)
-
+        self.sprite = assets.get("normal_button.jpg", (self.button_width, self.button_height))
+        self.dark_sprite = assets.get("normal_button.jpg", (self.button_width, self.button_height), dark=True)
+
+        self.columns = 5
+        self.visible_rows = int(self.height / self.button_height) + 2
+
+        # A fixed pool of buttons, one per grid slot in the viewport. Scrolling
+        # or navigating only rebinds their labels and callbacks.
+        self.button_pool = []
+        for slot in range(self.visible_rows * self.columns):
+            x, y = self.get_slot_position(slot)
+            self.button_pool.append(Button(
+                x=x,
+                y=y,
+                width=self.button_width,
+                height=self.button_height,
+                font=self.font,
+                screen=self.surface,
+                text='',
+                bg_colour=(169, 169, 169),
+                border_width=2,
+                border_radius=5,
+                screen_x=x + self.x,
+                screen_y=y + self.y,
+                sprite=self.sprite,
+                dark_sprite=self.dark_sprite
+            ))
+
+        self.last_button = Button(
+            x=0,
+            y=0,
+            width=self.button_width,
+            height=self.button_height,
+            font=self.font,
+            screen=self.surface,
+            text='-',
+            bg_colour=(178, 34, 34),
+            hover_colour=(139, 0, 0),
+            border_width=2,
+            border_radius=5,
+            screen_x=self.x,
+            screen_y=self.y,
+            callback=self.delete_key,
+            sprite=assets.get("back_button.jpg", (self.button_width, self.button_height)),
+            dark_sprite=assets.get("back_button.jpg", (self.button_width, self.button_height), dark=True)
+        )
+
+        self.visible_keys = []
+        self.bound_count = 0
+        self.last_button_slot = None
+        self.bound_state = None
+
+        self.hovered_slot = None
+
+        # Boxes that take typing, during which Ctrl+Z and Ctrl+Y are left to
+        # them rather than undoing. main.py adds the search box.
+        self.text_inputs = [input_box]
+
+        # Type-ahead filter over the keys of the current object.
+        self.key_filter = KeyFilter()
+        self.filter_text = ''
+        self.filter_input = TextInput(
+            x=self.x,
+            y=360,
+            width=250,
+            height=30,
+            font=self.font,
+            max_length=100,
+            screen=self.screen,
+            placeholder="Filter keys"
+        )
+        self.document.observers.append(self.on_edit)
+
+        # The back button and filter box are drawn straight onto the screen
+        # above the grid, so they have to be recomposited together with it.
+        self.dirty = True
+        self.dirty_rect = self.rect.union(self.back_button.rect).union(self.filter_input.rect)
 
     def set_keys(self, force_reload: bool = False):
         if force_reload:
-            self.keys = list(self.current_dict.keys())
+            # The root object is still being filled while the file loads.
+            if self.filter_text and isinstance(self.current_dict, dict) and self.document.loaded:
+                self.keys = self.key_filter.apply(self.current_dict, self.filter_text)
+            else:
+                self.keys = self.get_keys(self.current_dict)
+            self.bound_state = None
+            self.dirty = True
         self.total_keys = len(self.keys)
         self.total_button_height = ((self.total_keys + 4) // 5) * self.button_height
         total_lines = (self.total_keys + 4) // 5
@@ -502,10 +1361,26 @@ class DisplayJSONKeyButtonsDynamically:
             self.scroll_bar_height = max((visible_lines / total_lines) * self.height, 20)
         self.load_visible_buttons()
 
+    def get_keys(self, container):
+        # Arrays are browsed through a range; no key list is built for them.
+        if isinstance(container, dict):
+            return list(container.keys())
+        if isinstance(container, (list, RecordList)):
+            return range(len(container))
+        return []
+
+    def has_key(self, container, key):
+        if isinstance(container, (list, RecordList)):
+            return isinstance(key, int) and 0 <= key < len(container)
+        return key in container
+
     def update_keys_and_buttons(self, key):
-        if isinstance(self.current_dict[key], dict):
+        # Filtered keys cannot be restored once the filter is cleared.
+        keys = None if self.filter_text else self.keys
+        self.clear_filter()
+        if isinstance(self.current_dict[key], (dict, list)):
             self.current_key = key
-            self.navigation_stack.append((self.current_dict, self.keys, self.current_key))
+            self.navigation_stack.append((self.current_dict, keys, self.current_key, self.document.version))
             self.input_box.path.append(str(key))
             self.current_dict = self.current_dict[key]
             self.set_keys(force_reload=True)
@@ -514,16 +1389,18 @@ class DisplayJSONKeyButtonsDynamically:
             self.at_root = False
             self.current_key = key
             self.input_box.path.append(str(key))
-            self.navigation_stack.append((self.current_dict, self.keys, self.current_key))
+            self.navigation_stack.append((self.current_dict, keys, self.current_key, self.document.version))
             self.current_dict = {}
             self.keys = []
             self.buttons = []
+            self.bound_state = None
         self.total_keys = len(self.keys)
         self.total_button_height = ((self.total_keys + 4) // 5) * self.button_height
 
         if self.keys:
             self.load_visible_buttons()
-            self.draw()
+        self.display_json_box.show_path(self.input_box.path)
+        self.dirty = True
         return bool(self.keys)
     
     def print_tree(self, json_obj, indent=0):
@@ -540,109 +1417,152 @@ class DisplayJSONKeyButtonsDynamically:
     
     def go_back(self):
         if self.navigation_stack:
-            self.current_dict, self.keys, self.current_key = self.navigation_stack.pop()
+            self.clear_filter()
+            self.current_dict, keys, self.current_key, version = self.navigation_stack.pop()
             self.input_box.path.pop()
-            self.set_keys(force_reload=True)
+            if keys is None or version != self.document.version:
+                self.set_keys(force_reload=True)
+            else:
+                self.keys = keys
+                self.bound_state = None
+                self.dirty = True
+                self.set_keys()
             self.at_root = len(self.navigation_stack) == 0
+            self.display_json_box.show_path(self.input_box.path)
+
+    def open_path(self, path):
+        while self.navigation_stack:
+            self.go_back()
+
+        for key in path:
+            if isinstance(self.current_dict, (list, RecordList)):
+                key = int(key)
+            if not self.has_key(self.current_dict, key):
+                break
+            self.update_keys_and_buttons(key)
+        self.display_json_box.show_path(path)
+
+    def set_filter(self, text: str):
+        self.filter_text = text
+        self.filter_input.add_text(text if text or self.filter_input.activated else self.filter_input.placeholder)
+        self.scroll_offset_y = 0
+        self.scroll_bar_y = 0
+        self.set_keys(force_reload=True)
+
+    def clear_filter(self):
+        if self.filter_text:
+            self.filter_text = ''
+            self.key_filter.reset()
+            self.filter_input.add_text('' if self.filter_input.activated else self.filter_input.placeholder)
+
+    def on_edit(self, path, value, deleted: bool = False, position: int = None):
+        # An empty path means anything may have changed, as after a big bulk
+        # edit, so the grid opens again whatever of its path is left.
+        if not path:
+            self.key_filter.clear()
+            if self.document.loaded:
+                self.open_path(list(self.input_box.path))
+            return
+
+        # Keep cached key indexes in step with keys being added or removed.
+        try:
+            parent = self.document.resolve(path[:-1])
+        except (KeyError, IndexError, ValueError):
+            return
+        if isinstance(parent, dict):
+            self.key_filter.edited(parent, path[-1], deleted)
+
+        # The keys shown for the object being browsed are updated in place.
+        # Arrays are shown through a range, which only needs its length.
+        if parent is self.current_dict and position is not None:
+            if isinstance(self.keys, list) and not self.filter_text:
+                if deleted:
+                    del self.keys[position]
+                else:
+                    self.keys.insert(position, path[-1])
+            elif isinstance(self.keys, range):
+                self.keys = range(len(parent))
+            else:
+                self.keys = self.get_keys(parent) if not self.filter_text else self.key_filter.apply(parent, self.filter_text)
+            self.bound_state = None
+            self.dirty = True
+            self.set_keys()
+
+    def step_history(self, redo: bool = False):
+        path = self.document.redo() if redo else self.document.undo()
+        if path is None:
+            return
+        # Stay where the grid is unless the step removed or replaced what it
+        # shows, in which case the nearest part of the path still there opens.
+        current = self.input_box.path
+        if current[:len(path)] == path:
+            self.open_path(list(current))
+        try:
+            self.document.resolve(path)
+        except (KeyError, IndexError, ValueError):
+            path = path[:-1]
+        self.display_json_box.show_path(path)
+        self.dirty = True
 
-    def delete_key(self, filename: str):
+    def delete_key(self):
         if self.navigation_stack:
-            parent_dict, _, current_key = self.navigation_stack[-1]
-            if current_key in parent_dict:
-                del parent_dict[current_key]
-                with open(filename, 'w') as file:
-                    json.dump(self.json_data, file, indent=4)
-                self.display_json_box.set_text(filename, force_reload=True)
+            parent_dict, _, current_key, _ = self.navigation_stack[-1]
+            if self.has_key(parent_dict, current_key):
+                self.document.delete(self.input_box.path)
                 self.set_keys(force_reload=True) 
                 self.go_back()
 
-    def load_visible_buttons(self):
-        if not self.keys:
-            self.visible_keys = []
-            self.buttons = []
-
-            start_row = max(int(self.scroll_offset_y / self.button_height), 0)
-
-            last_button_index = 0
-            last_button_x = (last_button_index % 5) * (self.button_width + self.button_spacing)
-            last_button_y = ((last_button_index // 5) - start_row) * (self.button_height + self.button_spacing)
-            last_button_screen_x = (last_button_index % 5) * self.button_width + self.x
-            last_button_screen_y = ((last_button_index // 5) - start_row) * self.button_height + self.y
-
-            self.last_button = Button(
-                x=last_button_x,
-                y=last_button_y,
-                width=self.button_width,
-                height=self.button_height,
-                font=self.font,
-                screen=self.surface,
-                text='-',
-                bg_colour=(178, 34, 34),
-                hover_colour=(139, 0, 0),
-                border_width=2,
-                border_radius=5,
-                screen_x=last_button_screen_x,
-                screen_y=last_button_screen_y,
-                callback=lambda: self.delete_key("test.json"),
-                sprite=self.back_button_sprite,
-                dark_sprite=self.back_button_dark_sprite
-            )
-
-            self.buttons.append(self.last_button)
+    def get_slot_position(self, slot: int):
+        row, column = divmod(slot, self.columns)
+        return column * (self.button_width + self.button_spacing), row * (self.button_height + self.button_spacing)
+
+    def get_slot_at(self, pos: Tuple[int, int]):
+        local_x = pos[0] - self.x
+        local_y = pos[1] - self.y
+        if not (0 <= local_x < self.width and 0 <= local_y < self.height):
+            return None
+
+        column, offset_x = divmod(local_x, self.button_width + self.button_spacing)
+        row, offset_y = divmod(local_y, self.button_height + self.button_spacing)
+        if column >= self.columns or offset_x >= self.button_width or offset_y >= self.button_height:
+            return None
+        return int(row * self.columns + column)
+
+    def get_button_at(self, pos: Tuple[int, int]):
+        slot = self.get_slot_at(pos)
+        if slot is None:
+            return None
+        if slot < self.bound_count:
+            return self.button_pool[slot]
+        if slot == self.last_button_slot and not self.at_root:
+            return self.last_button
+        return None
 
+    def load_visible_buttons(self):
+        start_row = max(int(self.scroll_offset_y / self.button_height), 0)
+        if self.bound_state == (start_row, self.total_keys):
             return
-        
-        elif self.keys:
-            start_row = max(int(self.scroll_offset_y / self.button_height), 0)
-            end_row = min(start_row + int(self.height / self.button_height) + 2, int(self.total_keys / 5) + 1)
-            start_key = start_row * 5
-            end_key = min(end_row * 5, self.total_keys)
-            self.visible_keys = self.keys[start_key:end_key]
-            
-            self.buttons = [Button(
-                x=(i % 5) * (self.button_width + self.button_spacing),
-                y=((i // 5) - start_row) * (self.button_height + self.button_spacing),
-                width=self.button_width,
-                height=self.button_height,
-                font=self.font,
-                screen=self.surface,
-                text=key,
-                bg_colour=(169, 169, 169),
-                border_width=2,
-                border_radius=5,
-                screen_x=(i % 5) * self.button_width + self.x,
-                screen_y=((i // 5) - start_row) * self.button_height + self.y,
-                callback=lambda key=key: self.update_keys_and_buttons(key),
-                sprite=self.sprite,
-                dark_sprite=self.dark_sprite
-            ) for i, key in enumerate(self.visible_keys, start=start_key)]
-
-            last_button_index = len(self.visible_keys)
-            last_button_x = (last_button_index % 5) * (self.button_width + self.button_spacing)
-            last_button_y = ((last_button_index // 5) - start_row) * (self.button_height + self.button_spacing)
-            last_button_screen_x = (last_button_index % 5) * self.button_width + self.x
-            last_button_screen_y = ((last_button_index // 5) - start_row) * self.button_height + self.y
-            
-            self.last_button = Button(
-                x=last_button_x,
-                y=last_button_y,
-                width=self.button_width,
-                height=self.button_height,
-                font=self.font,
-                screen=self.surface,
-                text='-',
-                bg_colour=(178, 34, 34),
-                hover_colour=(139, 0, 0),
-                border_width=2,
-                border_radius=5,
-                screen_x=last_button_screen_x,
-                screen_y=last_button_screen_y,
-                callback=lambda: self.delete_key("test.json"),
-                sprite=self.back_button_sprite,
-                dark_sprite=self.back_button_dark_sprite
-            )
-
+        self.bound_state = (start_row, self.total_keys)
+
+        start_key = start_row * self.columns
+        end_key = min(start_key + len(self.button_pool), self.total_keys)
+        self.visible_keys = self.keys[start_key:end_key]
+        self.bound_count = len(self.visible_keys)
+        self.buttons = self.button_pool[:self.bound_count]
+
+        for button, key in zip(self.buttons, self.visible_keys):
+            button.set_text(str(key))
+            button.callback = lambda key=key: self.update_keys_and_buttons(key)
+
+        # The delete button sits in the slot right after the last key.
+        last_button_slot = self.total_keys - start_key
+        if 0 <= last_button_slot < len(self.button_pool):
+            self.last_button_slot = last_button_slot
+            x, y = self.get_slot_position(last_button_slot)
+            self.last_button.place(x, y, x + self.x, y + self.y)
             self.buttons.append(self.last_button)
+        else:
+            self.last_button_slot = None
 
     def draw(self):
         self.surface.fill((25, 25, 25))
@@ -654,13 +1574,10 @@ class DisplayJSONKeyButtonsDynamically:
 
         if not self.at_root:
             self.back_button.draw()
-
-        if not self.keys:
-            self.buttons = []
-            self.load_visible_buttons()
+        self.filter_input.draw()
 
         for button in self.buttons:
-            if self.at_root and button == self.last_button:
+            if self.at_root and button is self.last_button:
                 continue
             button.draw()
 
@@ -676,8 +1593,34 @@ class DisplayJSONKeyButtonsDynamically:
         self.screen.blit(self.surface, (self.x, self.y))
 
     def handle_event(self, event):
+        self.filter_input.handle_event(event)
+        if self.filter_input.dirty:
+            self.dirty = True
+
+        if event.type == pygame.KEYDOWN and self.filter_input.activated:
+            if event.key == pygame.K_ESCAPE:
+                self.set_filter('')
+            elif event.key == pygame.K_BACKSPACE:
+                self.set_filter(self.filter_text[:-1])
+            elif event.key == pygame.K_RETURN:
+                self.filter_input.activated = False
+            elif event.unicode and event.unicode.isprintable():
+                self.set_filter(self.filter_text + event.unicode)
+            return
+
+        if event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL and not any(box.activated for box in self.text_inputs):
+            if event.key == pygame.K_z:
+                self.step_history(redo=bool(event.mod & pygame.KMOD_SHIFT))
+            elif event.key == pygame.K_y:
+                self.step_history(redo=True)
+
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1:
+                activated = self.filter_input.rect.collidepoint(pygame.mouse.get_pos())
+                if activated != self.filter_input.activated:
+                    self.filter_input.activated = activated
+                    self.filter_input.add_text(self.filter_text if activated or self.filter_text else self.filter_input.placeholder)
+
                 mouse_x, mouse_y = pygame.mouse.get_pos()
                 mouse_x -= self.x
                 mouse_y -= self.y
@@ -686,10 +1629,10 @@ class DisplayJSONKeyButtonsDynamically:
                     self.scroll_bar_drag_start_y = mouse_y - self.scroll_bar_y
                 if self.back_button.rect.collidepoint(pygame.mouse.get_pos()):
                     self.go_back()
-                for button in self.buttons:
-                    if button.rect.collidepoint(mouse_x + self.x, mouse_y + self.y):
+                else:
+                    button = self.get_button_at(pygame.mouse.get_pos())
+                    if button and button.callback:
                         button.callback()
-                        break   
             elif event.button == 4:
                 if self.rect.collidepoint(pygame.mouse.get_pos()):
                     if self.vertical_scroll_bar_enabled:
@@ -698,8 +1641,7 @@ class DisplayJSONKeyButtonsDynamically:
                 if self.rect.collidepoint(pygame.mouse.get_pos()):
                     if self.vertical_scroll_bar_enabled:
                         self.scroll_down()
-            if self.keys:
-                self.draw()
+            self.dirty = True
         elif event.type == pygame.MOUSEBUTTONUP:
             if event.button == 1:
                 self.vertical_scroll_bar_dragging = False
@@ -710,8 +1652,16 @@ class DisplayJSONKeyButtonsDynamically:
                 self.scroll_bar_y = min(max(mouse_y - self.scroll_bar_drag_start_y, 0), self.height - self.scroll_bar_height)
                 self.scroll_offset_y = (self.scroll_bar_y / (self.height - self.scroll_bar_height)) * max(self.total_button_height - self.height, 0)
                 self.scroll_offset_y = min(self.scroll_offset_y, max(self.total_button_height - self.height, 0))
-            if self.keys:
-                self.draw()
+                self.dirty = True
+
+            mouse_pos = pygame.mouse.get_pos()
+            if not self.at_root and self.back_button.rect.collidepoint(mouse_pos):
+                hovered_slot = -1
+            else:
+                hovered_slot = self.get_slot_at(mouse_pos)
+            if hovered_slot != self.hovered_slot:
+                self.hovered_slot = hovered_slot
+                self.dirty = True
 
     def scroll_down(self):
         max_scroll = max(self.total_button_height - self.height + self.button_height, 0)
@@ -733,87 +1683,398 @@ class TreeMinimap:
                  width: int,
                  height: int,
                  screen: pygame.display.set_mode,
-                 input_box: TextInput,
+                 text_box: DisplayJSONBox,
+                 bar_colours: Tuple[Tuple[int, int, int], ...] = ((110, 150, 210), (100, 180, 130), (210, 170, 90), (190, 110, 150)),
+                 viewport_colour: Tuple[int, int, int] = (230, 230, 230),
+                 highlight_colour: Tuple[int, int, int] = (255, 210, 90),
+                 max_columns: int = 80,
+                 max_line_height: float = 3,
+                 samples: int = 4,
     ):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
-        self.input_box = input_box
+        self.text_box = text_box
+        self.bar_colours = bar_colours
+        self.viewport_colour = viewport_colour
+        self.highlight_colour = highlight_colour
+        self.max_columns = max_columns
+        self.max_line_height = max_line_height
+        self.samples = samples
 
         self.screen = screen
 
         self.surface = pygame.Surface((self.width, self.height))
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
 
-        self.items = []
+        self.sprite = assets.get("tree_box.jpg", (self.width, self.height))
+        self.dark_sprite = assets.get("tree_box.jpg", (self.width, self.height), dark=True)
+
+        # Every line of the text pane's view as a bar, indented as deep as the
+        # line and as long as it, many lines to a pixel row in big files. Laid
+        # out once per view and edit, and drawn under the viewport each frame.
+        self.margin = 6
+        self.layout = None
+        self.layout_key = None
+        self.line_height = 0
+        self.total_lines = 0
+
+        self.viewport = None
+        self.dragging = False
+
+        self.dirty = True
+        self.dirty_rect = self.rect
+
+
+    def get_layout_key(self):
+        view = self.text_box.view
+        if view is None:
+            return None
+        return (id(view), self.text_box.edit_count, view.complete)
+
+    def get_viewport(self):
+        if self.text_box.view is None:
+            return None
+        return self.text_box.visible_range(), self.text_box.highlight_lines
+
+    def update(self):
+        if self.get_layout_key() != self.layout_key or self.get_viewport() != self.viewport:
+            self.dirty = True
+
+    def line_shape(self, view, line: int):
+        # The indentation and length of a line. Lines still in the file are
+        # measured from their bounds and a few leading bytes.
+        if isinstance(view, LineBuffer):
+            source, index = view.source_of(line)
+            if isinstance(source, LineIndex):
+                start, end = source.line_bounds(index)
+                head = source.read_chunk(start, min(end - start, self.max_columns))
+                return len(head) - len(head.lstrip(b' \t')), end - start
+            text = source[index]
+        else:
+            text = view.get_line(line)
+        return len(text) - len(text.lstrip(' \t')), len(text)
 
-        self.sprite = pygame.image.load("assets/tree_box.jpg")
-        self.dark_sprite = self.sprite.copy()
-        self.dark_sprite.fill((128, 128, 128), special_flags=pygame.BLEND_RGBA_MULT)
+    def set_layout(self):
+        self.layout_key = self.get_layout_key()
+        self.layout = self.dark_sprite.copy() if self.dark_sprite else pygame.Surface((self.width, self.height))
 
-        self.scroll_bar_width = 10
-        self.scroll_bar_height = 0
-        self.scroll_bar_colour = (150, 150, 150)
+        # A view still being indexed or formatted has no length to lay out yet.
+        view = self.text_box.view
+        self.total_lines = len(view) if view is not None and view.complete else 0
+        if not self.total_lines:
+            return
 
-        self.vertical_scroll_bar_dragging = False
-        self.vertical_scroll_bar_enabled = False
+        inner_width = self.width - 2 * self.margin
+        inner_height = self.height - 2 * self.margin
+        self.line_height = min(inner_height / self.total_lines, self.max_line_height)
+        column_width = inner_width / self.max_columns
+
+        # Each pixel row shows the shallowest and longest of a few lines
+        # spread over the ones it stands for.
+        for row in range(min(int(self.total_lines * self.line_height + 0.5), inner_height)):
+            first = int(row / self.line_height)
+            last = min(max(int((row + 1) / self.line_height), first + 1), self.total_lines)
+            shapes = [self.line_shape(view, line) for line in sorted({first + (last - first) * sample // self.samples for sample in range(self.samples)})]
+            indent = min(indent for indent, _ in shapes)
+            length = min(max(length for _, length in shapes), self.max_columns)
+            if length <= indent:
+                continue
+            colour = self.bar_colours[indent // 4 % len(self.bar_colours)]
+            self.layout.fill(colour, (self.margin + int(indent * column_width), self.margin + row, max(int((length - indent) * column_width), 1), 1))
 
-        self.horizontal_scroll_bar_dragging = False
-        self.horizontal_scroll_bar_enabled = False
+    def line_at(self, mouse_y: int):
+        line = int((mouse_y - self.margin) / self.line_height) if self.line_height else 0
+        return min(max(line, 0), max(self.total_lines - 1, 0))
 
-        self.text_width = 0
+    def row_of(self, line: int):
+        return self.margin + int(line * self.line_height)
 
-        self.text_surfaces = []
+    def draw(self):
+        if self.get_layout_key() != self.layout_key:
+            self.set_layout()
+        self.surface.blit(self.layout, (0, 0))
+
+        # The lines the text pane shows, and the highlighted member's.
+        self.viewport = self.get_viewport()
+        if self.viewport is not None and self.total_lines:
+            (first, last), highlight = self.viewport
+            last = min(last, self.total_lines - 1)
+            top = self.row_of(first)
+            pygame.draw.rect(self.surface, self.viewport_colour, (1, top, self.width - 2, max(self.row_of(last + 1) - top, 3)), 1)
+            if highlight:
+                top = self.row_of(highlight[0])
+                pygame.draw.rect(self.surface, self.highlight_colour, (self.width - self.margin + 1, top, self.margin - 2, max(self.row_of(highlight[1] + 1) - top, 2)))
 
+        self.screen.blit(self.surface, (self.x, self.y))
 
-    def unique_id(self):
-        letters_and_digits = string.ascii_letters + string.digits
-        return ''.join(random.choice(letters_and_digits) for _ in range(4))
+    def handle_event(self, event):
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.rect.collidepoint(pygame.mouse.get_pos()):
+            self.dragging = True
+            self.jump(pygame.mouse.get_pos()[1] - self.y)
+        elif event.type == pygame.MOUSEMOTION and self.dragging:
+            self.jump(pygame.mouse.get_pos()[1] - self.y)
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.dragging = False
+
+    def jump(self, mouse_y: int):
+        if self.total_lines:
+            self.text_box.centre_on_line(self.line_at(mouse_y))
+            self.dirty = True
+
+
+class SearchPanel:
+    # Searches keys and values, or with a query starting with $, lists what
+    # a JSONPath query matches. "$query = value" sets every match at once.
+    def __init__(self,
+                 x: int,
+                 y: int,
+                 width: int,
+                 height: int,
+                 font: pygame.font.Font,
+                 screen: pygame.display.set_mode,
+                 document: JSONDocument,
+                 open_callback: Callable = None,
+                 font_colour: Tuple[int, int, int] = (220, 220, 220),
+                 bg_colour: Tuple[int, int, int] = (40, 40, 40),
+                 hover_colour: Tuple[int, int, int] = (70, 70, 70),
+                 row_height: int = 20,
+    ):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.font = font
+        self.screen = screen
+        self.document = document
+        self.open_callback = open_callback
+        self.font_colour = font_colour
+        self.bg_colour = bg_colour
+        self.hover_colour = hover_colour
+        self.row_height = row_height
+
+        self.search = DocumentSearch(document)
+        self.query = ''
+        self.search_input = TextInput(
+            x=self.x,
+            y=self.y,
+            width=self.width,
+            height=30,
+            font=self.font,
+            max_length=100,
+            screen=self.screen,
+            placeholder="Search, or $ for JSONPath"
+        )
+
+        # The compiled query and the text of the value it assigns, while the
+        # box holds a JSONPath query, and what the last bulk edit did.
+        self.plan = None
+        self.value_text = None
+        self.error = None
+        self.message = None
+
+        # Results are listed under the search box, one path to a row.
+        self.list_rect = pygame.Rect(self.x, self.y + 35, self.width, self.height - 35)
+        self.surface = pygame.Surface(self.list_rect.size)
+        self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
+        self.scroll = 0
+        self.hovered_row = None
+
+        # Bulk edits of what a query matches, under the results.
+        button_width = (self.width - 5) // 2
+        button_y = self.list_rect.height - 30
+        self.set_button = Button(
+            x=0,
+            y=button_y,
+            width=button_width,
+            height=30,
+            font=self.font,
+            screen=self.surface,
+            text="Set all",
+            border_radius=5,
+            screen_x=self.list_rect.x,
+            screen_y=self.list_rect.y + button_y,
+            callback=lambda: self.apply_query(),
+        )
+        self.delete_button = Button(
+            x=button_width + 5,
+            y=button_y,
+            width=button_width,
+            height=30,
+            font=self.font,
+            screen=self.surface,
+            text="Delete all",
+            bg_colour=(178, 34, 34),
+            hover_colour=(139, 0, 0),
+            border_radius=5,
+            screen_x=self.list_rect.x + button_width + 5,
+            screen_y=self.list_rect.y + button_y,
+            callback=lambda: self.apply_query(deleted=True),
+        )
+
+        # What was last drawn, so streaming results only cause a redraw when
+        # the visible rows or the count change.
+        self.shown = None
+
+        self.dirty = True
+        self.dirty_rect = self.rect
+
+    @property
+    def searching(self):
+        return self.search.searching
+
+    @property
+    def visible_rows(self):
+        height = self.list_rect.height - (35 if self.plan is not None else 0)
+        return (height - self.row_height) // self.row_height
+
+    def get_shown(self):
+        hovered_button = self.plan is not None and (self.set_button.is_clicked(), self.delete_button.is_clicked())
+        return (id(self.search.results), len(self.search.results), self.search.count, self.search.searching, self.scroll, self.hovered_row, hovered_button)
+
+    def update(self):
+        # A search typed while the file was loading starts once it has.
+        if self.search.waiting and self.document.loaded:
+            self.set_query(self.query)
+        if self.get_shown() != self.shown:
+            self.dirty = True
+
+    def set_query(self, text: str):
+        self.query = text
+        self.scroll = 0
+        self.message = None
+        self.search_input.add_text(text if text or self.search_input.activated else self.search_input.placeholder)
+
+        self.plan = None
+        self.value_text = None
+        self.error = None
+        if text.lstrip().startswith('$'):
+            expression, self.value_text = split_assignment(text)
+            try:
+                self.plan = compile_query(expression)
+            except QueryError as error:
+                self.error = str(error)
+                self.search.cancel()
+                self.search.results = []
+            else:
+                self.search.start_query(self.plan)
+        else:
+            self.search.start(text)
+        self.dirty = True
 
-    def set_text(self):
-        x = 0
-        y = 0
-        path = []
-        for key in self.input_box.path:
-            path.append(key)
-            path_str = '.'.join(path)
-            if path_str not in self.items:
-                self.items.append(path_str)
-            self.surface.blit(self.input_box.font.render(key, True, (192,192,192)), (x + 10, y + 5))
-            y += 20
-            x += 5
+    def apply_query(self, deleted: bool = False):
+        # The matches are found again on the spot, so the edit applies to the
+        # document as it is now, and the file is saved once for all of them.
+        if self.plan is None or not self.document.loaded:
+            return
+        if not deleted and self.value_text is None:
+            self.message = "Add = value to set the matches"
+            self.dirty = True
+            return
 
-        lines = []
-        for item in self.items:
-            lines.append(item)
+        paths = self.plan.evaluate(self.document.data)
+        if deleted:
+            count = self.document.delete_all(paths)
+        else:
+            count = self.document.set_all(paths, convert_str(self.value_text))
+        self.set_query(self.query)
+        self.message = f"{'Deleted' if deleted else 'Set'} {count} member{'s' if count != 1 else ''}"
+
+    def row_at(self, pos: Tuple[int, int]):
+        if not self.list_rect.collidepoint(pos):
+            return None
+        row = (pos[1] - self.list_rect.y) // self.row_height - 1
+        index = self.scroll + row
+        if row < 0 or row >= self.visible_rows or index >= len(self.search.results):
+            return None
+        return row
+
+    def describe(self, path: list):
+        text = " / ".join(path)
+        try:
+            value = self.document.resolve(path)
+        except (KeyError, IndexError, ValueError, TypeError):
+            return text
+        if not isinstance(value, (dict, list)):
+            text += ": " + str(value)
+        return text
+
+    def get_status(self):
+        results = self.search.results
+        if self.error:
+            return self.error
+        if self.message:
+            return self.message
+        if self.plan is not None:
+            count = self.search.count or 0
+            if self.search.searching or self.search.waiting:
+                return f"{count} matches so far..."
+            return f"{count} match{'es' if count != 1 else ''}" + (", Enter sets them" if self.value_text is not None and count else "")
+        if self.search.searching or self.search.waiting:
+            return f"{len(results)} found, searching..."
+        if self.query:
+            return f"{len(results)} found" + (" (first shown)" if len(results) >= self.search.max_results else "")
+        return "Type to search keys and values"
 
     def draw(self):
-        for i, text_surface in enumerate(self.text_surfaces):
-            y = i * self.font.get_height() + 10
-            self.surface.blit(text_surface, (10 - self.scroll_offset_x, y))
+        self.shown = self.get_shown()
+        results = self.search.results
+        self.surface.fill(self.bg_colour)
+        self.surface.blit(self.font.render(self.get_status(), True, self.font_colour), (4, 2))
 
-        self.screen.blit(self.surface, (self.x, self.y))
+        for row, path in enumerate(results[self.scroll:self.scroll + self.visible_rows]):
+            top = (row + 1) * self.row_height
+            if row == self.hovered_row:
+                self.surface.fill(self.hover_colour, (0, top, self.width, self.row_height))
+            # The surface clips what does not fit; the cut only keeps huge
+            # string values from being rendered whole.
+            self.surface.blit(self.font.render(self.describe(path)[:200], True, self.font_colour), (4, top + 2))
 
-        if self.sprite:
-            if self.dark_sprite:
-                temp_surface = pygame.transform.scale(self.dark_sprite, (self.width, self.height))
-            else:
-                temp_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-                pygame.draw.rect(temp_surface, (128, 128, 128), (0, 0, self.width, self.height), border_radius=5)
-        else:
-            temp_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            pygame.draw.rect(temp_surface, (128, 128, 128), (0, 0, self.width, self.height), border_radius=5)
-
-        self.surface.blit(temp_surface, (0, 0))
-        self.set_text()
+        if self.plan is not None:
+            self.set_button.draw()
+            self.delete_button.draw()
 
-    def load_visible_text(self):
-        start_line = max(int(self.scroll_offset_y / self.font.get_height()), 0)
-        end_line = min(start_line + int(self.height / self.font.get_height()) + 1, self.total_lines)
+        self.search_input.draw()
+        self.screen.blit(self.surface, self.list_rect.topleft)
 
-        self.text = self.lines[start_line:end_line]
-        self.text_surfaces = [self.font.render(line, True, self.font_colour) for line in self.text]
+    def handle_event(self, event):
+        self.search_input.handle_event(event)
+        if self.search_input.dirty:
+            self.dirty = True
+
+        if event.type == pygame.KEYDOWN and self.search_input.activated:
+            if event.key == pygame.K_ESCAPE:
+                self.set_query('')
+            elif event.key == pygame.K_BACKSPACE:
+                self.set_query(self.query[:-1])
+            elif event.key == pygame.K_RETURN:
+                if self.plan is not None and self.value_text is not None:
+                    self.apply_query()
+                else:
+                    self.search_input.activated = False
+            elif event.unicode and event.unicode.isprintable():
+                self.set_query(self.query + event.unicode)
+            return
 
-        if self.text_width == 0:
-            self.text_width = max(self.font.size(line)[0] for line in self.lines) + 10
\ No newline at end of file
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            pos = pygame.mouse.get_pos()
+            if event.button == 1:
+                activated = self.search_input.rect.collidepoint(pos)
+                if activated != self.search_input.activated:
+                    self.search_input.activated = activated
+                    self.search_input.add_text(self.query if activated or self.query else self.search_input.placeholder)
+                if self.plan is not None and self.set_button.is_clicked():
+                    self.set_button.callback()
+                elif self.plan is not None and self.delete_button.is_clicked():
+                    self.delete_button.callback()
+                else:
+                    row = self.row_at(pos)
+                    if row is not None and self.open_callback:
+                        self.open_callback(list(self.search.results[self.scroll + row]))
+            elif event.button in (4, 5) and self.list_rect.collidepoint(pos):
+                step = -3 if event.button == 4 else 3
+                self.scroll = min(max(self.scroll + step, 0), max(len(self.search.results) - self.visible_rows, 0))
+            self.dirty = True
+        elif event.type == pygame.MOUSEMOTION:
+            self.hovered_row = self.row_at(pygame.mouse.get_pos())